@@ -11,12 +11,12 @@ from io import BytesIO
 from urllib.request import urlopen
 from zipfile import ZipFile
 
-import basedosdados as bd
 import numpy as np
 import pandas as pd
 import requests
 from lxml import html
 
+from pipelines.utils.reference import read_reference_table
 from pipelines.utils.utils import log
 
 # ---- functions to download data
@@ -313,16 +313,13 @@ def read_brazilian_municipallity_ids_from_base_dos_dados(
     """Download municipio table from base dos dados
 
     Args:
-        billing_id (str): BQ billing project id
+        billing_id (str): BQ billing project id. Not used anymore, the table is read
+            from the local reference cache.
 
     Returns:
         pd.DataFrame:  municipio table from base dos dados
     """
-    municipio = bd.read_table(
-        dataset_id="br_bd_diretorios_brasil",
-        table_id="municipio",
-        billing_project_id=billing_id,
-    )
+    municipio = read_reference_table("br_bd_diretorios_brasil", "municipio")
     return municipio
 
 
@@ -423,42 +420,10 @@ def replace_nan_with_empty_set_coltypes_str(df: pd.DataFrame) -> pd.DataFrame:
 
 
 # function copied from datasets.br_tse_eleicoes.utils
-def get_data_from_prod(dataset_id: str, table_id: str, columns: list) -> list:
+def get_data_from_prod(dataset_id: str, table_id: str, columns: list) -> pd.DataFrame:
     """
-    Get select columns from a table in prod.
+    Get select columns from a table in prod, as strings. The table is cached locally
+    and only downloaded again when it changes.
     """
 
-    storage = bd.Storage(dataset_id=dataset_id, table_id=table_id)
-    blobs = list(
-        storage.client["storage_staging"]
-        .bucket("basedosdados-dev")
-        .list_blobs(prefix=f"staging/{storage.dataset_id}/{storage.table_id}/")
-    )
-
-    dfs = []
-
-    for blob in blobs:
-        partitions = re.findall(r"\w+(?==)", blob.name)
-        if len(set(partitions) & set(columns)) == 0:
-            df = pd.read_csv(
-                blob.public_url,
-                usecols=columns,
-                dtype={"id_municipio": str, "id_municipio_bcb": str, "ddd": str},
-            )
-            dfs.append(df)
-        else:
-            columns2add = list(set(partitions) & set(columns))
-            for column in columns2add:
-                columns.remove(column)
-            df = pd.read_csv(
-                blob.public_url,
-                usecols=columns,
-                dtype={"id_municipio": str, "id_municipio_bcb": str},
-            )
-            for column in columns2add:
-                df[column] = blob.name.split(column + "=")[1].split("/")[0]
-            dfs.append(df)
-
-    df = pd.concat(dfs)
-
-    return df
+    return read_reference_table(dataset_id, table_id, columns)
@@ -19,3 +19,6 @@ class constants(Enum):  # pylint: disable=c0103
     DOWNLOAD_PATH_AGENCIA = "/tmp/input/agencia/"
     CLEANED_FILES_PATH_MUNICIPIO = "/tmp/output/municipio/"
     CLEANED_FILES_PATH_AGENCIA = "/tmp/output/agencia/"
+    # backfill
+    MAX_DOWNLOADS = 4
+    MAX_WORKERS = 4
@@ -45,6 +45,9 @@ with Flow(
     table_id = Parameter("table_id", default="municipio", required=True)
     update_metadata = Parameter("update_metadata", default=False, required=False)
     dbt_alias = Parameter("dbt_alias", default=False, required=False)
+    # backfill: download and clean every month missing in staging
+    backfill = Parameter("backfill", default=False, required=False)
+    max_workers = Parameter("max_workers", default=1, required=False)
 
     # Materialization mode
     materialization_mode = Parameter(
@@ -62,6 +65,9 @@ with Flow(
     donwload_files = download_estban_files(
         xpath=br_bcb_estban_constants.MUNICIPIO_XPATH.value,
         save_path=br_bcb_estban_constants.DOWNLOAD_PATH_MUNICIPIO.value,
+        backfill=backfill,
+        dataset_id=dataset_id,
+        table_id=table_id,
     )
 
     municipio = get_id_municipio(table="municipio")
@@ -69,6 +75,7 @@ with Flow(
     filepath = cleaning_municipios_data(
         path=br_bcb_estban_constants.DOWNLOAD_PATH_MUNICIPIO.value,
         municipio=municipio,
+        max_workers=max_workers,
         upstream_tasks=[donwload_files, municipio],
     )
 
@@ -143,6 +150,9 @@ with Flow(
     table_id = Parameter("table_id", default="agencia", required=True)
     dbt_alias = Parameter("dbt_alias", default=False, required=False)
     update_metadata = Parameter("update_metadata", default=False, required=False)
+    # backfill: download and clean every month missing in staging
+    backfill = Parameter("backfill", default=False, required=False)
+    max_workers = Parameter("max_workers", default=1, required=False)
 
     # Materialization mode
     materialization_mode = Parameter(
@@ -160,6 +170,9 @@ with Flow(
     donwload_files = download_estban_files(
         xpath=br_bcb_estban_constants.AGENCIA_XPATH.value,
         save_path=br_bcb_estban_constants.DOWNLOAD_PATH_AGENCIA.value,
+        backfill=backfill,
+        dataset_id=dataset_id,
+        table_id=table_id,
     )
     # read_file
 
@@ -168,6 +181,7 @@ with Flow(
     filepath = cleaning_agencias_data(
         path=br_bcb_estban_constants.DOWNLOAD_PATH_AGENCIA.value,
         municipio=municipio,
+        max_workers=max_workers,
         upstream_tasks=[donwload_files, municipio],
     )
     # 15/16/19/20 sao files problematicos
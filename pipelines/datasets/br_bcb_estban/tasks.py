@@ -4,11 +4,13 @@ Tasks for br_bcb_estban
 """
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 
 import basedosdados as bd
 import pandas as pd
 from prefect import task
+from prefect.engine.signals import SKIP
 
 from pipelines.constants import constants
 from pipelines.datasets.br_bcb_estban.constants import (
@@ -16,38 +18,41 @@ from pipelines.datasets.br_bcb_estban.constants import (
 )
 from pipelines.datasets.br_bcb_estban.utils import *
 from pipelines.datasets.br_bcb_estban.utils import (
-    cols_order_agencia,
-    create_id_municipio,
-    create_id_verbete_column,
-    create_month_year_columns,
+    clean_agencia_file,
+    clean_files,
+    clean_municipio_file,
+    data_bases_in_staging,
     download_and_unzip,
     extract_download_links,
-    get_data_from_prod,
-    order_cols_municipio,
-    pre_cleaning_for_pivot_long_agencia,
-    pre_cleaning_for_pivot_long_municipio,
-    read_files,
-    rename_columns_agencia,
-    rename_columns_municipio,
-    standardize_monetary_units,
-    wide_to_long_agencia,
-    wide_to_long_municipio,
+    missing_links,
 )
-from pipelines.utils.utils import clean_dataframe, log, to_partitions
+from pipelines.utils.reference import reference_lookup
+from pipelines.utils.utils import log
 
 
 @task(
     max_retries=constants.TASK_MAX_RETRIES.value,
     retry_delay=timedelta(seconds=constants.TASK_RETRY_DELAY.value),
 )
-def download_estban_files(xpath: str, save_path: str) -> str:
+def download_estban_files(
+    xpath: str,
+    save_path: str,
+    backfill: bool = False,
+    dataset_id: str = None,
+    table_id: str = None,
+) -> str:
     """This function downloads ESTBAN data from BACEN url,
     unzip the csv files and return a path for the raw files
 
+    In backfill mode, every month listed by BACEN that is missing or
+    incomplete in the staging bucket is downloaded, concurrently.
 
     Args:
         xpath (str): The xpath that contains estban file names
         save_path (str): a temporary path to save the estban files
+        backfill (bool): download all missing months instead of the latest one
+        dataset_id (str): dataset id, used in backfill mode
+        table_id (str): table id, used in backfill mode
 
     Returns:
         str: The path to the estban files
@@ -57,11 +62,28 @@ def download_estban_files(xpath: str, save_path: str) -> str:
 
     download_link = extract_download_links(url=url, xpath=xpath)
 
-    # setado para fazer upload incremental dos dados em staging
-    download_link = download_link[0]
-
-    file = "https://www4.bcb.gov.br/" + download_link
-    download_and_unzip(file, path=save_path)
+    if not backfill:
+        # setado para fazer upload incremental dos dados em staging
+        download_link = download_link[:1]
+    else:
+        download_link = missing_links(
+            download_link, data_bases_in_staging(dataset_id, table_id)
+        )
+        log(f"{len(download_link)} months missing in staging: {download_link}")
+        if not download_link:
+            raise SKIP(f"{dataset_id}.{table_id} has no missing months")
+
+    with ThreadPoolExecutor(
+        max_workers=br_bcb_estban_constants.MAX_DOWNLOADS.value
+    ) as executor:
+        list(
+            executor.map(
+                lambda link: download_and_unzip(
+                    "https://www4.bcb.gov.br/" + link, path=save_path
+                ),
+                download_link,
+            )
+        )
 
     log("download task successfully !")
     log(f"files {os.listdir(save_path)} were downloaded and unzipped")
@@ -75,13 +97,9 @@ def download_estban_files(xpath: str, save_path: str) -> str:
 def get_id_municipio(table) -> pd.DataFrame:
     """get id municipio from basedosdados"""
 
-    municipio = get_data_from_prod(
-        "br_bd_diretorios_brasil",
-        table,
-        ["id_municipio_bcb", "id_municipio"],
+    municipio = reference_lookup(
+        "br_bd_diretorios_brasil", table, "id_municipio_bcb", "id_municipio"
     )
-
-    municipio = dict(zip(municipio.id_municipio_bcb, municipio.id_municipio))
     log("municipio dataset successfully downloaded!")
     return municipio
 
@@ -91,66 +109,24 @@ def get_id_municipio(table) -> pd.DataFrame:
     max_retries=constants.TASK_MAX_RETRIES.value,
     retry_delay=timedelta(seconds=constants.TASK_RETRY_DELAY.value),
 )
-def cleaning_municipios_data(path, municipio):
+def cleaning_municipios_data(path, municipio, max_workers: int = 1):
     """Perform data cleaning operations with estban municipios data
 
     Args:
         df: a raw municipios estban dataset
+        max_workers (int): files cleaned at the same time, in a process pool
 
     Returns:
         df: a standardized partitioned estban dataset
     """
 
-    files = os.listdir(path)
-    log(f"the following files will be cleaned: {files}")
-
-    for file in files:
-        log(f"the file being cleaned is:{file}")
-
-        build_complete_file_path = os.path.join(path, file)
-
-        log(f"building {build_complete_file_path}")
-        df = read_files(build_complete_file_path)
-
-        log("reading file")
-        df = rename_columns_municipio(df)
-
-        log("renaming columns")
-        df = clean_dataframe(df)
-
-        log("cleaning dataframe")
-        df = create_id_municipio(df, municipio)
-
-        log("creating id municipio")
-        df = pre_cleaning_for_pivot_long_municipio(df)
-
-        log("pre cleaning for pivot long")
-        df = wide_to_long_municipio(df)
-
-        log("wide to long")
-        df = standardize_monetary_units(
-            df, date_column="data_base", value_column="valor"
-        )
-
-        log("standardizing monetary units")
-        df = create_id_verbete_column(df, column_name="id_verbete")
-
-        log("creating id verbete column")
-        df = create_month_year_columns(df, date_column="data_base")
-
-        log("creating month year columns")
-        df = order_cols_municipio(df)
-        # save df
-
-        log("saving and doing partition")
-        # 3. build and save partition
-        to_partitions(
-            df,
-            partition_columns=["ano", "mes", "sigla_uf"],
-            savepath=br_bcb_estban_constants.CLEANED_FILES_PATH_MUNICIPIO.value,
-        )
-
-        del df
+    clean_files(
+        path,
+        clean_municipio_file,
+        municipio,
+        br_bcb_estban_constants.CLEANED_FILES_PATH_MUNICIPIO.value,
+        max_workers,
+    )
 
     return br_bcb_estban_constants.CLEANED_FILES_PATH_MUNICIPIO.value
 
@@ -160,63 +136,24 @@ def cleaning_municipios_data(path, municipio):
     max_retries=constants.TASK_MAX_RETRIES.value,
     retry_delay=timedelta(seconds=constants.TASK_RETRY_DELAY.value),
 )
-def cleaning_agencias_data(path, municipio):
-    """Perform data cleaning operations with estban municipios data
+def cleaning_agencias_data(path, municipio, max_workers: int = 1):
+    """Perform data cleaning operations with estban agencias data
 
     Args:
-        df: a raw municipios estban dataset
+        df: a raw agencias estban dataset
+        max_workers (int): files cleaned at the same time, in a process pool
 
     Returns:
         df: a standardized partitioned estban dataset
     """
-    # limit to 10 for testing purposes
     # be aware, relie only in .csv files its not that good
     # cause bacen can change file format
-    files = os.listdir(path)
-    log(f"the following files will be cleaned: {files}")
-
-    for file in files:
-        log(f"the file being cleaned is:{file}")
-        build_complete_file_path = os.path.join(path, file)
-
-        log(f"building {build_complete_file_path}")
-        df = read_files(build_complete_file_path)
-
-        log("reading file")
-        df = rename_columns_agencia(df)
-
-        log("renaming columns")
-        # see the behavior of the function
-        df = clean_dataframe(df)
-
-        log("cleaning dataframe")
-        df = create_id_municipio(df, municipio)
-
-        log("creating id municipio")
-        df = pre_cleaning_for_pivot_long_agencia(df)
-
-        log("pre cleaning for pivot long")
-        df = wide_to_long_agencia(df)
-
-        log("wide to long")
-        df = standardize_monetary_units(
-            df, date_column="data_base", value_column="valor"
-        )
-        log("standardizing monetary units")
-        df = create_id_verbete_column(df, column_name="id_verbete")
-
-        log("creating id verbete column")
-        df = create_month_year_columns(df, date_column="data_base")
-
-        log("creating month year columns")
-        df = cols_order_agencia(df)
-
-        to_partitions(
-            df,
-            partition_columns=["ano", "mes", "sigla_uf"],
-            savepath=br_bcb_estban_constants.CLEANED_FILES_PATH_AGENCIA.value,
-        )
-
-        del df
+    clean_files(
+        path,
+        clean_agencia_file,
+        municipio,
+        br_bcb_estban_constants.CLEANED_FILES_PATH_AGENCIA.value,
+        max_workers,
+    )
 
     return br_bcb_estban_constants.CLEANED_FILES_PATH_AGENCIA.value
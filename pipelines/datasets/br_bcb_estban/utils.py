@@ -5,17 +5,19 @@ General purpose functions for the br_bcb_estban project
 import os
 import re
 import unicodedata
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from io import BytesIO
 from urllib.request import urlopen
 from zipfile import ZipFile
 
-import basedosdados as bd
 import numpy as np
 import pandas as pd
 import requests
 from lxml import html
 
-from pipelines.utils.utils import log
+from pipelines.utils.reference import read_reference_table
+from pipelines.utils.staging import StagingTableReader, blob_partitions
+from pipelines.utils.utils import clean_dataframe, log, to_partitions
 
 # ------- macro etapa 1 download de dados
 
@@ -215,7 +217,32 @@ def create_id_municipio(df: pd.DataFrame, df2: dict) -> pd.DataFrame:
     return df
 
 
-# todo: to func: do wide para o long
+def melt_verbetes(df: pd.DataFrame, id_vars: list) -> pd.DataFrame:
+    """Pivot verbete columns to long format, like `pd.melt`, but building
+    `verbete_descricao` as a categorical straight from the column positions,
+    instead of repeating the column names as strings.
+
+    Args:
+        df (pd.DataFrame): a wide ESTBAN dataframe
+        id_vars (list): columns that are kept
+
+    Returns:
+        pd.DataFrame: a long dataframe with verbete_descricao and valor columns
+    """
+    verbetes = [col for col in df.columns if col not in id_vars]
+    n_linhas = len(df)
+
+    long = pd.DataFrame(
+        {col: np.tile(df[col].to_numpy(), len(verbetes)) for col in id_vars}
+    )
+    long["verbete_descricao"] = pd.Categorical.from_codes(
+        np.repeat(np.arange(len(verbetes)), n_linhas), categories=verbetes
+    )
+    long["valor"] = df[verbetes].to_numpy().ravel(order="F")
+
+    return long
+
+
 def wide_to_long_municipio(df: pd.DataFrame) -> pd.DataFrame:
     """Pivot verbete columns to long format
 
@@ -225,7 +252,8 @@ def wide_to_long_municipio(df: pd.DataFrame) -> pd.DataFrame:
     Returns:
         pd.DataFrame: _description_
     """
-    df = df.melt(
+    return melt_verbetes(
+        df,
         id_vars=[
             "data_base",
             "sigla_uf",
@@ -235,12 +263,8 @@ def wide_to_long_municipio(df: pd.DataFrame) -> pd.DataFrame:
             "agencias_processadas",
             "id_municipio",
         ],
-        var_name="verbete_descricao",
-        value_name="valor",
     )
 
-    return df
-
 
 def wide_to_long_agencia(df: pd.DataFrame) -> pd.DataFrame:
     """Pivot verbete columns to long format
@@ -251,7 +275,8 @@ def wide_to_long_agencia(df: pd.DataFrame) -> pd.DataFrame:
     Returns:
         pd.DataFrame: _description_
     """
-    df = df.melt(
+    return melt_verbetes(
+        df,
         id_vars=[
             "data_base",
             "sigla_uf",
@@ -260,14 +285,9 @@ def wide_to_long_agencia(df: pd.DataFrame) -> pd.DataFrame:
             "cnpj_agencia",
             "id_municipio",
         ],
-        var_name="verbete_descricao",
-        value_name="valor",
     )
 
-    return df
-
 
-# todo: to func:corrige unidades monetárias
 def condicoes(database, valor) -> None:
     # cruzado
     if database <= 198812:
@@ -286,22 +306,55 @@ def condicoes(database, valor) -> None:
         return round(valor, 0)
 
 
-# todo: not str types. they're arrays i think
+def divisor_e_casas(database: np.ndarray) -> tuple:
+    """Returns the divisor and the decimal places that convert values of each
+    data_base (YYYYMM) to reais, following `condicoes`.
+
+    Args:
+        database (np.ndarray): data_base values
+
+    Returns:
+        tuple: arrays of divisors and decimal places
+    """
+    database = np.asarray(database, dtype="int64")
+    periodos = [
+        database <= 198812,  # cruzado
+        database <= 199307,  # cruzado novo e cruzeiro
+        database <= 199406,  # cruzeiro real
+    ]
+    divisor = np.select(periodos, [1000**2 * 2750, 1000 * 2750, 2750], default=1)
+    casas = np.select(periodos, [6, 4, 2], default=0)
+
+    return divisor, casas
+
+
 def standardize_monetary_units(
     df: pd.DataFrame, date_column, value_column
 ) -> pd.DataFrame:
     """This function corrects monetary units from ESTBAN files.
-    It relies on the data_base column being a string in the format YYYYMM,
-    where YYYY is the year and MM is the month."""
+    It relies on the data_base column being in the format YYYYMM,
+    where YYYY is the year and MM is the month.
+
+    The divisor only depends on data_base, so it is computed once per distinct
+    data_base and broadcast to the rows."""
+
+    datas, codigos = np.unique(
+        pd.to_numeric(df[date_column]).to_numpy(), return_inverse=True
+    )
+    divisor, casas = divisor_e_casas(datas)
 
-    # todo: check the logic
-    database = df[f"{date_column}"]
-    valor = df[f"{value_column}"]
+    # values in reais keep their (integer) dtype
+    if (casas == 0).all() and pd.api.types.is_integer_dtype(df[value_column]):
+        df["valor"] = df[value_column]
+        return df
 
-    # Calling the condicoes function from above
-    condicoes_vetorizada = np.vectorize(condicoes)
+    valor = df[value_column].to_numpy(dtype="float64") / divisor[codigos]
+    casas_linha = casas[codigos]
+    for n_casas in np.unique(casas):
+        linhas = casas_linha == n_casas
+        valor[linhas] = np.round(valor[linhas], n_casas)
 
-    df["valor"] = condicoes_vetorizada(database, valor)  # trocar para valor
+    df["valor"] = valor
 
     return df
 
@@ -309,7 +362,8 @@ def standardize_monetary_units(
 # todo: to func:extrai os ids dos verbetes
 def create_id_verbete_column(df: pd.DataFrame, column_name: str) -> pd.DataFrame:
     """This function creates id_verbete column from a verbete column.
-    It parses numeric digitis from the verbete column strings.
+    It parses numeric digitis from the verbete column strings, once per
+    distinct verbete, and stores the result as a categorical.
 
     Args:
         df (pd.DataFrame): _description_
@@ -320,7 +374,14 @@ def create_id_verbete_column(df: pd.DataFrame, column_name: str) -> pd.DataFrame
     """
     padrao_letras = re.compile(r"\D")
 
-    df[column_name] = [padrao_letras.sub("", x) for x in df["verbete_descricao"]]
+    verbetes = df["verbete_descricao"].astype("category")
+    ids, categorias = pd.factorize(
+        [padrao_letras.sub("", str(x)) for x in verbetes.cat.categories]
+    )
+    codigos = verbetes.cat.codes.to_numpy()
+    df[column_name] = pd.Categorical.from_codes(
+        np.where(codigos < 0, -1, ids[codigos]), categories=categorias
+    )
 
     return df
 
@@ -394,42 +455,156 @@ def cols_order_agencia(df: pd.DataFrame) -> pd.DataFrame:
 
 
 # function copied from datasets.br_tse_eleicoes.utils
-def get_data_from_prod(dataset_id: str, table_id: str, columns: list) -> list:
+def get_data_from_prod(dataset_id: str, table_id: str, columns: list) -> pd.DataFrame:
     """
-    Get select columns from a table in prod.
+    Get select columns from a table in prod, as strings. The table is cached locally
+    and only downloaded again when it changes.
     """
 
-    storage = bd.Storage(dataset_id=dataset_id, table_id=table_id)
-    blobs = list(
-        storage.client["storage_staging"]
-        .bucket("basedosdados-dev")
-        .list_blobs(prefix=f"staging/{storage.dataset_id}/{storage.table_id}/")
-    )
+    return read_reference_table(dataset_id, table_id, columns)
 
-    dfs = []
-
-    for blob in blobs:
-        partitions = re.findall(r"\w+(?==)", blob.name)
-        if len(set(partitions) & set(columns)) == 0:
-            df = pd.read_csv(
-                blob.public_url,
-                usecols=columns,
-                dtype={"id_municipio": str, "id_municipio_bcb": str},
-            )
-            dfs.append(df)
-        else:
-            columns2add = list(set(partitions) & set(columns))
-            for column in columns2add:
-                columns.remove(column)
-            df = pd.read_csv(
-                blob.public_url,
-                usecols=columns,
-                dtype={"id_municipio": str, "id_municipio_bcb": str},
-            )
-            for column in columns2add:
-                df[column] = blob.name.split(column + "=")[1].split("/")[0]
-            dfs.append(df)
-
-    df = pd.concat(dfs)
 
-    return df
+# ------- backfill
+def data_base_from_link(link: str) -> str:
+    """Extracts the data_base (YYYYMM) of an ESTBAN download link,
+    e.g. fis/cosif/cont/estban/municipio/202303_ESTBAN.ZIP -> 202303
+
+    Args:
+        link (str): a download link from the ESTBAN page
+
+    Returns:
+        str: the data_base of the file
+    """
+    return re.search(r"(\d{6})", link.split("/")[-1]).group(1)
+
+
+def complete_data_bases(partitions: list) -> set:
+    """Lists the data_base (YYYYMM) of the complete months among the ano/mes
+    partitions of the staging blobs. Tables partitioned by sigla_uf only count
+    a month when it has as many states as the most complete month, so months
+    whose upload was interrupted are downloaded again
+
+    Args:
+        partitions (list): the partitions of each blob, e.g.
+            {"ano": "2023", "mes": "3", "sigla_uf": "SP"}
+
+    Returns:
+        set: complete data_bases
+    """
+    states = {}
+    for partition in partitions:
+        if "ano" not in partition or "mes" not in partition:
+            continue
+        data_base = f"{int(partition['ano']):04d}{int(partition['mes']):02d}"
+        states.setdefault(data_base, set()).add(partition.get("sigla_uf"))
+    if not states:
+        return set()
+    n_states = max(len(ufs) for ufs in states.values())
+    return {data_base for data_base, ufs in states.items() if len(ufs) == n_states}
+
+
+def data_bases_in_staging(dataset_id: str, table_id: str) -> set:
+    """Lists the data_base (YYYYMM) of the months already uploaded to the
+    staging bucket, see complete_data_bases
+
+    Args:
+        dataset_id (str): dataset id
+        table_id (str): table id
+
+    Returns:
+        set: data_bases already in staging
+    """
+    blobs = StagingTableReader(dataset_id, table_id).list_blobs()
+
+    return complete_data_bases([blob_partitions(blob.name) for blob in blobs])
+
+
+def missing_links(links: list, data_bases: set) -> list:
+    """Filters the download links whose data_base is not in data_bases
+
+    Args:
+        links (list): download links from the ESTBAN page
+        data_bases (set): data_bases already in staging
+
+    Returns:
+        list: links of the missing months
+    """
+    return [link for link in links if data_base_from_link(link) not in data_bases]
+
+
+def clean_municipio_file(file_path: str, municipio: dict, savepath: str) -> str:
+    """Cleans a raw ESTBAN municipio file and saves it partitioned by
+    ano, mes and sigla_uf
+
+    Args:
+        file_path (str): a raw ESTBAN municipio file
+        municipio (dict): id_municipio_bcb as key and id_municipio as value
+        savepath (str): folder of the partitions
+
+    Returns:
+        str: the cleaned file
+    """
+    df = read_files(file_path)
+    df = rename_columns_municipio(df)
+    df = clean_dataframe(df)
+    df = create_id_municipio(df, municipio)
+    df = pre_cleaning_for_pivot_long_municipio(df)
+    df = wide_to_long_municipio(df)
+    df = standardize_monetary_units(df, date_column="data_base", value_column="valor")
+    df = create_id_verbete_column(df, column_name="id_verbete")
+    df = create_month_year_columns(df, date_column="data_base")
+    df = order_cols_municipio(df)
+
+    to_partitions(df, partition_columns=["ano", "mes", "sigla_uf"], savepath=savepath)
+
+    return file_path
+
+
+def clean_agencia_file(file_path: str, municipio: dict, savepath: str) -> str:
+    """Cleans a raw ESTBAN agencia file and saves it partitioned by
+    ano, mes and sigla_uf
+
+    Args:
+        file_path (str): a raw ESTBAN agencia file
+        municipio (dict): id_municipio_bcb as key and id_municipio as value
+        savepath (str): folder of the partitions
+
+    Returns:
+        str: the cleaned file
+    """
+    df = read_files(file_path)
+    df = rename_columns_agencia(df)
+    df = clean_dataframe(df)
+    df = create_id_municipio(df, municipio)
+    df = pre_cleaning_for_pivot_long_agencia(df)
+    df = wide_to_long_agencia(df)
+    df = standardize_monetary_units(df, date_column="data_base", value_column="valor")
+    df = create_id_verbete_column(df, column_name="id_verbete")
+    df = create_month_year_columns(df, date_column="data_base")
+    df = cols_order_agencia(df)
+
+    to_partitions(df, partition_columns=["ano", "mes", "sigla_uf"], savepath=savepath)
+
+    return file_path
+
+
+def clean_files(path, clean_file, municipio, savepath, max_workers: int = 1):
+    """Cleans every raw ESTBAN file in path with clean_file. Each file holds a
+    single month, so files are cleaned in parallel processes without writing
+    to the same partitions."""
+
+    files = [os.path.join(path, file) for file in os.listdir(path)]
+    log(f"the following files will be cleaned: {files}")
+
+    if max_workers <= 1:
+        for file in files:
+            log(f"the file being cleaned is:{file}")
+            clean_file(file, municipio, savepath)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(clean_file, file, municipio, savepath) for file in files
+        ]
+        for future in as_completed(futures):
+            log(f"file {future.result()} cleaned")
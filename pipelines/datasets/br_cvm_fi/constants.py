@@ -151,6 +151,21 @@ class constants(Enum):  # pylint: disable=c0103
         "VL_ATIVO_EXTERIOR",
     ]
 
+    COLUNAS_DECIMAIS = [
+        "QT_VENDA_NEGOC",
+        "VL_VENDA_NEGOC",
+        "QT_AQUIS_NEGOC",
+        "VL_AQUIS_NEGOC",
+        "QT_POS_FINAL",
+        "VL_MERC_POS_FINAL",
+        "VL_CUSTO_POS_FINAL",
+        "PR_INDEXADOR_POSFX",
+        "PR_CUPOM_POSFX",
+        "PR_TAXA_PREFX",
+        "QT_ATIVO_EXTERIOR",
+        "VL_ATIVO_EXTERIOR",
+    ]
+
     MAPEAMENTO = {"S": "1", "N": "0"}
 
     COLUNAS = [
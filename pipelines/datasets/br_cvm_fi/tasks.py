@@ -23,12 +23,23 @@ from tqdm import tqdm
 from pipelines.datasets.br_cvm_fi.constants import constants as cvm_constants
 from pipelines.datasets.br_cvm_fi.utils import (
     check_and_create_column,
-    limpar_string,
+    extrair_ano_mes,
+    iterar_blocos_cda,
+    limpar_colunas_ascii,
+    limpar_documentos,
+    mapear_colunas,
     obter_anos_meses,
     rename_columns,
     sheet_to_df,
+    trocar_virgula_decimal,
+)
+from pipelines.utils.downloader import download_file
+from pipelines.utils.utils import (
+    list_zip_members,
+    log,
+    read_csv_from_zip,
+    to_partitions,
 )
-from pipelines.utils.utils import log, to_partitions
 
 
 @task
@@ -39,19 +50,16 @@ def get_today_date():
 
 
 @task  # noqa
-def download_unzip_csv(
-    url: str, files, chunk_size: int = 128, mkdir: bool = True, id="teste"
-) -> str:
+def download_unzip_csv(url: str, files, mkdir: bool = True, id="teste") -> str:
     """
-    Downloads and unzips a .csv file from a given list of files and saves it to a local directory.
+    Downloads .zip files with .csv files from a given list of files and saves them to a local directory.
+    The .csv files are read straight from the .zip files, without extracting them.
     Parameters:
     -----------
     url: str
         The base URL from which to download the files.
     files: list or str
         The .zip file names or a single .zip file name to download the csv file from.
-    chunk_size: int, optional
-        The size of each chunk to download in bytes. Default is 128 bytes.
     mkdir: bool, optional
         Whether to create a new directory for the downloaded file. Default is False.
     Returns:
@@ -73,47 +81,29 @@ def download_unzip_csv(
             download_url = f"{url}{file}"
             save_path = f"/tmp/data/br_cvm_fi/{id}/input/{file}"
 
-            r = requests.get(
-                download_url, headers=request_headers, stream=True, timeout=50
+            download_file(
+                download_url,
+                save_path,
+                headers=request_headers,
+                timeout=50,
+                use_cache=True,
             )
-            with open(save_path, "wb") as fd:
-                for chunk in tqdm(r.iter_content(chunk_size=chunk_size)):
-                    fd.write(chunk)
-
-            try:
-                with zipfile.ZipFile(save_path) as z:
-                    z.extractall(f"/tmp/data/br_cvm_fi/{id}/input")
-                log("Dados extraídos com sucesso!")
 
-            except zipfile.BadZipFile:
+            if not zipfile.is_zipfile(save_path):
                 log(f"O arquivo {file} não é um arquivo ZIP válido.")
 
-            os.system(
-                f'cd /tmp/data/br_cvm_fi/{id}/input; find . -type f ! -iname "*.csv" -delete'
-            )
-
     elif isinstance(files, str):
         log(f"Baixando o arquivo {files}")
         download_url = f"{url}{files}"
         save_path = f"/tmp/data/br_cvm_fi/{id}/input/{files}"
 
-        r = requests.get(download_url, headers=request_headers, stream=True, timeout=10)
-        with open(save_path, "wb") as fd:
-            for chunk in tqdm(r.iter_content(chunk_size=chunk_size)):
-                fd.write(chunk)
-
-        try:
-            with zipfile.ZipFile(save_path) as z:
-                z.extractall(f"/tmp/data/br_cvm_fi/{id}/input")
-            log("Dados extraídos com sucesso!")
+        download_file(
+            download_url, save_path, headers=request_headers, timeout=10, use_cache=True
+        )
 
-        except zipfile.BadZipFile:
+        if not zipfile.is_zipfile(save_path):
             log(f"O arquivo {files} não é um arquivo ZIP válido.")
 
-        os.system(
-            f'cd /tmp/data/br_cvm_fi/{id}/input; find . -type f ! -iname "*.csv" -delete'
-        )
-
     else:
         raise ValueError("O argumento 'files' possui um tipo inadequado.")
 
@@ -209,24 +199,18 @@ def clean_data_and_make_partitions(path: str, table_id: str) -> str:
     Clean cvm data based on architecture file and make partitions.
     """
 
-    os.chdir(path)
-    files = glob.glob("*.csv")
+    files = list_zip_members(path)
     df_arq = sheet_to_df(cvm_constants.ARQUITETURA_URL_INF.value)
 
-    for file in files:
-        df = pd.read_csv(f"{path}{file}", sep=";")
+    for zip_path, file in files:
+        df = read_csv_from_zip(zip_path, file, sep=";")
         log(f"File {file} read.")
-        df["CNPJ_FUNDO"] = df["CNPJ_FUNDO"].str.replace(r"[/.-]", "")
+        df = limpar_documentos(df, ["CNPJ_FUNDO"])
         df = rename_columns(df_arq, df)
         df = check_and_create_column(
             df, colunas_totais=cvm_constants.COLUNAS_FINAL_INF.value
         )
-        df["ano"] = df["data_competencia"].apply(
-            lambda x: datetime.strptime(x, "%Y-%m-%d").year
-        )
-        df["mes"] = df["data_competencia"].apply(
-            lambda x: datetime.strptime(x, "%Y-%m-%d").month
-        )
+        df = extrair_ano_mes(df, "data_competencia")
         log(f"File {file} cleaned.")
         os.makedirs(f"/tmp/data/br_cvm_fi/{table_id}/output/", exist_ok=True)
         to_partitions(
@@ -242,71 +226,24 @@ def clean_data_and_make_partitions(path: str, table_id: str) -> str:
 @task
 def clean_data_make_partitions_cda(diretorio, table_id):
     df_arq = sheet_to_df(cvm_constants.ARQUITETURA_URL_CDA.value)
-    anos_meses = obter_anos_meses(diretorio)
+    arquivos = list_zip_members(diretorio)
+    anos_meses = obter_anos_meses([file for _, file in arquivos])
 
     for i in anos_meses:
-        df_final = pd.DataFrame()
-        arquivos = glob.glob(f"{diretorio}*.csv")
-        padrao = diretorio + f"cda_fi_BLC_[1-8]_{i}.csv"
-        arquivos_filtrados = [arq for arq in arquivos if re.match(padrao, arq)]
-
-        for file in tqdm(arquivos_filtrados):
-            log(f"Baixando o arquivo ------> {file}")
-
-            df = pd.read_csv(file, sep=";", encoding="ISO-8859-1", dtype="string")
-            df["ano"] = df["DT_COMPTC"].apply(
-                lambda x: datetime.strptime(x, "%Y-%m-%d").year
-            )
-            df["mes"] = df["DT_COMPTC"].apply(
-                lambda x: datetime.strptime(x, "%Y-%m-%d").month
-            )
-
-            # pattern = r"(BLC_[1-8])"
-
-            match = re.search(r"(BLC_[1-8])", file)
-            df["bloco"] = match.group(1)
-
-            df_final = pd.concat([df_final, df], ignore_index=True)
-
-        df_final = check_and_create_column(
-            df_final, colunas_totais=cvm_constants.COLUNAS_FINAL.value
-        )
-        df_final[cvm_constants.COLUNAS.value] = df_final[
-            cvm_constants.COLUNAS.value
-        ].applymap(lambda x: cvm_constants.MAPEAMENTO.value.get(x, x))
-
-        df_final["CNPJ_FUNDO"] = df_final["CNPJ_FUNDO"].str.replace(r"[/.-]", "")
-
-        df_final["CNPJ_INSTITUICAO_FINANC_COOBR"] = df_final[
-            "CNPJ_INSTITUICAO_FINANC_COOBR"
-        ].str.replace(r"[/.-]", "")
-
-        df_final["CPF_CNPJ_EMISSOR"] = df_final["CPF_CNPJ_EMISSOR"].str.replace(
-            r"[/.-]", ""
-        )
-        df_final["CNPJ_EMISSOR"] = df_final["CNPJ_EMISSOR"].str.replace(r"[/.-]", "")
-        df_final["CNPJ_FUNDO_COTA"] = df_final["CNPJ_FUNDO_COTA"].str.replace(
-            r"[/.-]", ""
-        )
-        df_final = rename_columns(df_arq, df_final)
-        df_final = df_final.replace(",", ".", regex=True)
-
-        df_final[cvm_constants.COLUNAS_ASCI.value] = df_final[
-            cvm_constants.COLUNAS_ASCI.value
-        ].fillna("")
-
-        df_final[cvm_constants.COLUNAS_ASCI.value] = df_final[
-            cvm_constants.COLUNAS_ASCI.value
-        ].applymap(limpar_string)
-
-        df_final = df_final[cvm_constants.COLUNAS_TOTAIS.value]
+        padrao = f"cda_fi_BLC_[1-8]_{i}.csv"
+        arquivos_filtrados = [
+            (zip_path, file)
+            for zip_path, file in arquivos
+            if re.match(padrao, os.path.basename(file))
+        ]
 
         log(f"Fazendo partições para o ano ------> {i}")
 
         os.makedirs(f"/tmp/data/br_cvm_fi/{table_id}/output/", exist_ok=True)
 
+        # cada bloco é limpo e escrito antes da leitura do próximo
         to_partitions(
-            df_final,
+            iterar_blocos_cda(arquivos_filtrados, df_arq),
             partition_columns=["ano", "mes"],
             savepath=f"/tmp/data/br_cvm_fi/{table_id}/output/",
         )  # constant
@@ -321,27 +258,22 @@ def clean_data_make_partitions_ext(diretorio, table_id):
     arquivos = glob.glob(f"{diretorio}*.csv")[0]
 
     df = pd.read_csv(arquivos, sep=";", encoding="ISO-8859-1", dtype="string")
-    df["ano"] = df["DT_COMPTC"].apply(lambda x: datetime.strptime(x, "%Y-%m-%d").year)
-    df["mes"] = df["DT_COMPTC"].apply(lambda x: datetime.strptime(x, "%Y-%m-%d").month)
+    df = extrair_ano_mes(df)
 
     df_final = df
     log(df_final.head())
     df_final = check_and_create_column(
         df_final, colunas_totais=cvm_constants.COLUNAS_TOTAIS_EXT.value
     )
-    df_final[cvm_constants.COLUNAS_MAPEAMENTO_EXT.value] = df_final[
-        cvm_constants.COLUNAS_MAPEAMENTO_EXT.value
-    ].applymap(lambda x: cvm_constants.MAPEAMENTO.value.get(x, x))
-    df_final["CNPJ_FUNDO"] = df_final["CNPJ_FUNDO"].str.replace(r"[/.-]", "")
+    df_final = mapear_colunas(
+        df_final,
+        cvm_constants.COLUNAS_MAPEAMENTO_EXT.value,
+        cvm_constants.MAPEAMENTO.value,
+    )
+    df_final = limpar_documentos(df_final, ["CNPJ_FUNDO"])
     df_final = rename_columns(df_arq, df_final)
-    df_final = df_final.replace(",", ".", regex=True)
-    df_final[cvm_constants.COLUNAS_ASCI_EXT.value] = df_final[
-        cvm_constants.COLUNAS_ASCI_EXT.value
-    ].fillna("")
-    log(df_final.head())
-    df_final[cvm_constants.COLUNAS_ASCI_EXT.value] = df_final[
-        cvm_constants.COLUNAS_ASCI_EXT.value
-    ].applymap(limpar_string)
+    df_final = trocar_virgula_decimal(df_final)
+    df_final = limpar_colunas_ascii(df_final, cvm_constants.COLUNAS_ASCI_EXT.value)
     df_final = df_final[cvm_constants.COLUNAS_FINAIS_EXT.value]
     log(df_final.head())
     # print(f"Fazendo partições para o ano ------> {i}")
@@ -356,9 +288,7 @@ def clean_data_make_partitions_ext(diretorio, table_id):
 
 
 @task
-def download_csv_cvm(
-    url: str, table_id: str, files, chunk_size: int = 128, mkdir: bool = True
-) -> str:
+def download_csv_cvm(url: str, table_id: str, files, mkdir: bool = True) -> str:
     if mkdir:
         os.makedirs(f"/tmp/data/br_cvm_fi/{table_id}/input/", exist_ok=True)
     request_headers = {
@@ -370,21 +300,21 @@ def download_csv_cvm(
             download_url = f"{url}{file}"
             save_path = f"/tmp/data/br_cvm_fi/{table_id}/input/{file}"
 
-            r = requests.get(
-                download_url, headers=request_headers, stream=True, timeout=10
+            download_file(
+                download_url,
+                save_path,
+                headers=request_headers,
+                timeout=10,
+                use_cache=True,
             )
-            with open(save_path, "wb") as fd:
-                for chunk in tqdm(r.iter_content(chunk_size=chunk_size)):
-                    fd.write(chunk)
 
     elif isinstance(files, str):
         log(f"Baixando o arquivo {files}")
         download_url = f"{url}{files}"
         save_path = f"/tmp/data/br_cvm_fi/{table_id}/input/{files}"
-        r = requests.get(download_url, headers=request_headers, stream=True, timeout=10)
-        with open(save_path, "wb") as fd:
-            for chunk in tqdm(r.iter_content(chunk_size=chunk_size)):
-                fd.write(chunk)
+        download_file(
+            download_url, save_path, headers=request_headers, timeout=10, use_cache=True
+        )
 
     return f"/tmp/data/br_cvm_fi/{table_id}/input/"
 
@@ -428,46 +358,31 @@ def clean_data_make_partitions_perfil(diretorio, table_id):
 
         df = pd.read_csv(file, sep=";")
 
-        df["ano"] = df["DT_COMPTC"].apply(
-            lambda x: datetime.strptime(x, "%Y-%m-%d").year
-        )
-        df["mes"] = df["DT_COMPTC"].apply(
-            lambda x: datetime.strptime(x, "%Y-%m-%d").month
-        )
+        df = extrair_ano_mes(df)
 
         df_final = df
 
         df_final = check_and_create_column(df_final, colunas_totais=colunas_totais)
-        df_final[colunas_mapeamento] = df_final[colunas_mapeamento].applymap(
-            lambda x: cvm_constants.MAPEAMENTO.value.get(x, x)
-        )
-        df_final["CNPJ_FUNDO"] = df_final["CNPJ_FUNDO"].str.replace(r"[/.-]", "")
-        df_final["CPF_CNPJ_COMITENTE_1"] = df_final["CPF_CNPJ_COMITENTE_1"].str.replace(
-            r"[/.-]", ""
+        df_final = mapear_colunas(
+            df_final, colunas_mapeamento, cvm_constants.MAPEAMENTO.value
         )
-        df_final["CPF_CNPJ_COMITENTE_2"] = df_final["CPF_CNPJ_COMITENTE_2"].str.replace(
-            r"[/.-]", ""
-        )
-        df_final["CPF_CNPJ_COMITENTE_3"] = df_final["CPF_CNPJ_COMITENTE_3"].str.replace(
-            r"[/.-]", ""
-        )
-        df_final["CPF_CNPJ_EMISSOR_1"] = df_final["CPF_CNPJ_EMISSOR_1"].str.replace(
-            r"[/.-]", ""
-        )
-        df_final["CPF_CNPJ_EMISSOR_2"] = df_final["CPF_CNPJ_EMISSOR_2"].str.replace(
-            r"[/.-]", ""
-        )
-        df_final["CPF_CNPJ_EMISSOR_3"] = df_final["CPF_CNPJ_EMISSOR_3"].str.replace(
-            r"[/.-]", ""
+        df_final = limpar_documentos(
+            df_final,
+            [
+                "CNPJ_FUNDO",
+                "CPF_CNPJ_COMITENTE_1",
+                "CPF_CNPJ_COMITENTE_2",
+                "CPF_CNPJ_COMITENTE_3",
+                "CPF_CNPJ_EMISSOR_1",
+                "CPF_CNPJ_EMISSOR_2",
+                "CPF_CNPJ_EMISSOR_3",
+            ],
         )
         df_final = rename_columns(df_arq, df_final)
-        df_final = df_final.replace(",", ".", regex=True)
-        df_final[cvm_constants.COLUNAS_ASCI_PERFIL_MENSAL.value] = df_final[
-            cvm_constants.COLUNAS_ASCI_PERFIL_MENSAL.value
-        ].fillna("")
-        df_final[cvm_constants.COLUNAS_ASCI_PERFIL_MENSAL.value] = df_final[
-            cvm_constants.COLUNAS_ASCI_PERFIL_MENSAL.value
-        ].applymap(limpar_string)
+        df_final = trocar_virgula_decimal(df_final)
+        df_final = limpar_colunas_ascii(
+            df_final, cvm_constants.COLUNAS_ASCI_PERFIL_MENSAL.value
+        )
         df_final = df_final[colunas_finais]
         os.makedirs(f"/tmp/data/br_cvm_fi/{table_id}/output/", exist_ok=True)
         to_partitions(
@@ -501,28 +416,23 @@ def clean_data_make_partitions_cad(diretorio, table_id):
     df_final = df
 
     df_final = check_and_create_column(df_final, colunas_totais=colunas_totais)
-    df_final[colunas_mapeamento] = df_final[colunas_mapeamento].applymap(
-        lambda x: cvm_constants.MAPEAMENTO.value.get(x, x)
+    df_final = mapear_colunas(
+        df_final, colunas_mapeamento, cvm_constants.MAPEAMENTO.value
     )
-    df_final["CNPJ_FUNDO"] = df_final["CNPJ_FUNDO"].str.replace(r"[/.-]", "")
-    df_final["CNPJ_ADMIN"] = df_final["CNPJ_ADMIN"].str.replace(r"[/.-]", "")
-    df_final["CPF_CNPJ_GESTOR"] = df_final["CPF_CNPJ_GESTOR"].str.replace(r"[/.-]", "")
-    df_final["CNPJ_AUDITOR"] = df_final["CNPJ_AUDITOR"].str.replace(r"[/.-]", "")
-    df_final["CNPJ_CUSTODIANTE"] = df_final["CNPJ_CUSTODIANTE"].str.replace(
-        r"[/.-]", ""
-    )
-    df_final["CNPJ_CONTROLADOR"] = df_final["CNPJ_CONTROLADOR"].str.replace(
-        r"[/.-]", ""
+    df_final = limpar_documentos(
+        df_final,
+        [
+            "CNPJ_FUNDO",
+            "CNPJ_ADMIN",
+            "CPF_CNPJ_GESTOR",
+            "CNPJ_AUDITOR",
+            "CNPJ_CUSTODIANTE",
+            "CNPJ_CONTROLADOR",
+        ],
     )
-
     df_final = rename_columns(df_arq, df_final)
-    df_final = df_final.replace(",", ".", regex=True)
-    df_final[cvm_constants.COLUNAS_ASCI_CAD.value] = df_final[
-        cvm_constants.COLUNAS_ASCI_CAD.value
-    ].fillna("")
-    df_final[cvm_constants.COLUNAS_ASCI_CAD.value] = df_final[
-        cvm_constants.COLUNAS_ASCI_CAD.value
-    ].applymap(limpar_string)
+    df_final = trocar_virgula_decimal(df_final)
+    df_final = limpar_colunas_ascii(df_final, cvm_constants.COLUNAS_ASCI_CAD.value)
     df_final = df_final[colunas_finais]
     # print(f"Fazendo partições para o ano ------> {i}")
     os.makedirs(f"/tmp/data/br_cvm_fi/{table_id}/output/", exist_ok=True)
@@ -544,28 +454,25 @@ def clean_data_make_partitions_balancete(diretorio, table_id):
         "original_name"
     ].to_list()
     df_final = pd.DataFrame()
-    arquivos = glob.glob(f"{diretorio}*.csv")
+    arquivos = list_zip_members(diretorio)
 
-    for file in tqdm(arquivos):
+    for zip_path, file in tqdm(arquivos):
         print(f"Baixando o arquivo ------> {file}")
 
-        df = pd.read_csv(file, sep=";", encoding="ISO-8859-1", dtype="string")
-        df["ano"] = df["DT_COMPTC"].apply(
-            lambda x: datetime.strptime(x, "%Y-%m-%d").year
-        )
-        df["mes"] = df["DT_COMPTC"].apply(
-            lambda x: datetime.strptime(x, "%Y-%m-%d").month
+        df = read_csv_from_zip(
+            zip_path, file, sep=";", encoding="ISO-8859-1", dtype="string"
         )
+        df = extrair_ano_mes(df)
 
         df_final = df
 
         df_final = check_and_create_column(df_final, colunas_totais=colunas_totais)
-        df_final[colunas_mapeamento] = df_final[colunas_mapeamento].applymap(
-            lambda x: cvm_constants.MAPEAMENTO.value.get(x, x)
+        df_final = mapear_colunas(
+            df_final, colunas_mapeamento, cvm_constants.MAPEAMENTO.value
         )
-        df_final["CNPJ_FUNDO"] = df_final["CNPJ_FUNDO"].str.replace(r"[/.-]", "")
+        df_final = limpar_documentos(df_final, ["CNPJ_FUNDO"])
         df_final = rename_columns(df_arq, df_final)
-        df_final = df_final.replace(",", ".", regex=True)
+        df_final = trocar_virgula_decimal(df_final)
         df_final = df_final[colunas_finais]
         os.makedirs(f"/tmp/data/br_cvm_fi/{table_id}/output/", exist_ok=True)
         to_partitions(
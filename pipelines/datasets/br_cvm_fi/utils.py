@@ -4,19 +4,21 @@ General purpose functions for the br_cvm_fi project
 """
 import os
 import re
-from io import StringIO
 
+import numpy as np
 import pandas as pd
-import requests
 from unidecode import unidecode
 
+from pipelines.datasets.br_cvm_fi.constants import constants as cvm_constants
+from pipelines.utils.architecture import get_architecture
+from pipelines.utils.utils import log, read_csv_from_zip
+
 
 def sheet_to_df(columns_config_url_or_path):
     """
     Convert sheet to dataframe. Check if your google sheet Share are: Anyone on the internet with this link can view
     """
-    url = columns_config_url_or_path.replace("edit#gid=", "export?format=csv&gid=")
-    return pd.read_csv(StringIO(requests.get(url, timeout=10).content.decode("utf-8")))
+    return get_architecture(columns_config_url_or_path).table
 
 
 def rename_columns(df_origem, df_destino):
@@ -36,16 +38,15 @@ def rename_columns(df_origem, df_destino):
     return df_destino
 
 
-def obter_anos_meses(diretorio):
+def obter_anos_meses(lista_arquivos):
     """
-    Retorna uma lista com todos os arquivos AAAAMM presentes no diretório.
+    Retorna uma lista com todos os AAAAMM presentes nos nomes dos arquivos.
     """
-    lista_arquivos = os.listdir(diretorio)
     padrao_AAAAMM = re.compile(r"cda_fi_BLC_\d+_(\d{6}).csv")
 
     anos_meses = set()
     for arquivo in lista_arquivos:
-        match = padrao_AAAAMM.match(arquivo)
+        match = padrao_AAAAMM.match(os.path.basename(arquivo))
         if match:
             ano_mes = match.group(1)
             anos_meses.add(ano_mes)
@@ -64,6 +65,66 @@ def limpar_string(texto):
     return texto
 
 
+def extrair_ano_mes(df: pd.DataFrame, coluna: str = "DT_COMPTC") -> pd.DataFrame:
+    """
+    Cria as colunas ano e mes a partir de uma coluna de datas AAAA-MM-DD.
+    """
+    datas = pd.to_datetime(df[coluna], format="%Y-%m-%d")
+    df["ano"] = datas.dt.year
+    df["mes"] = datas.dt.month
+    return df
+
+
+def mapear_colunas(df: pd.DataFrame, colunas: list, mapeamento: dict) -> pd.DataFrame:
+    """
+    Substitui os valores das colunas que estão no mapeamento (e.g. S/N por 1/0).
+    """
+    df[colunas] = df[colunas].replace(mapeamento)
+    return df
+
+
+def limpar_documentos(df: pd.DataFrame, colunas: list) -> pd.DataFrame:
+    """
+    Remove a pontuação (/ . -) das colunas de CPF e CNPJ.
+    """
+    for coluna in colunas:
+        df[coluna] = df[coluna].str.replace(r"[/.-]", "", regex=True)
+    return df
+
+
+def trocar_virgula_decimal(df: pd.DataFrame, colunas: list = None) -> pd.DataFrame:
+    """
+    Troca as vírgulas por pontos nas colunas informadas ou, por padrão, em todas as
+    colunas de texto. Somente os valores de texto são alterados: números e nulos de
+    colunas mistas são mantidos.
+    """
+    if colunas is None:
+        colunas = df.select_dtypes(include=["object", "string"]).columns
+    for coluna in colunas:
+        # `.str` devolve nulo para os valores que não são texto, que são mantidos
+        trocados = df[coluna].str.replace(",", ".", regex=False)
+        df[coluna] = trocados.where(trocados.notna(), df[coluna])
+    return df
+
+
+def normalizar_ascii(serie: pd.Series) -> pd.Series:
+    """
+    Aplica `limpar_string` uma única vez por valor distinto da série.
+    """
+    codigos, valores = pd.factorize(serie.fillna(""))
+    limpos = np.array([limpar_string(valor) for valor in valores], dtype=object)
+    return pd.Series(limpos[codigos], index=serie.index)
+
+
+def limpar_colunas_ascii(df: pd.DataFrame, colunas: list) -> pd.DataFrame:
+    """
+    Preenche os nulos e remove acentos, pontuação e maiúsculas das colunas de texto.
+    """
+    for coluna in colunas:
+        df[coluna] = normalizar_ascii(df[coluna])
+    return df
+
+
 def check_and_create_column(df: pd.DataFrame, colunas_totais: list) -> pd.DataFrame:
     """
     Check if a column exists in a Pandas DataFrame. If it doesn't, create a new column with the given name
@@ -80,3 +141,42 @@ def check_and_create_column(df: pd.DataFrame, colunas_totais: list) -> pd.DataFr
         if col_name not in df.columns:
             df[col_name] = ""
     return df
+
+
+def limpar_bloco_cda(
+    df: pd.DataFrame, bloco: str, df_arq: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Limpa um arquivo BLC da CDA, já com as colunas finais da tabela.
+    """
+    df = extrair_ano_mes(df)
+    df["bloco"] = bloco
+    df = check_and_create_column(df, colunas_totais=cvm_constants.COLUNAS_FINAL.value)
+    df = mapear_colunas(df, cvm_constants.COLUNAS.value, cvm_constants.MAPEAMENTO.value)
+    df = limpar_documentos(
+        df,
+        [
+            "CNPJ_FUNDO",
+            "CNPJ_INSTITUICAO_FINANC_COOBR",
+            "CPF_CNPJ_EMISSOR",
+            "CNPJ_EMISSOR",
+            "CNPJ_FUNDO_COTA",
+        ],
+    )
+    df = trocar_virgula_decimal(df, cvm_constants.COLUNAS_DECIMAIS.value)
+    df = rename_columns(df_arq, df)
+    df = limpar_colunas_ascii(df, cvm_constants.COLUNAS_ASCI.value)
+    return df[cvm_constants.COLUNAS_TOTAIS.value]
+
+
+def iterar_blocos_cda(arquivos: list, df_arq: pd.DataFrame):
+    """
+    Lê e limpa os arquivos BLC da CDA de um mês, um bloco por vez.
+    """
+    for zip_path, file in arquivos:
+        log(f"Lendo o arquivo ------> {file}")
+        df = read_csv_from_zip(
+            zip_path, file, sep=";", encoding="ISO-8859-1", dtype="string"
+        )
+        bloco = re.search(r"(BLC_[1-8])", file).group(1)
+        yield limpar_bloco_cda(df, bloco, df_arq)
@@ -3,6 +3,7 @@
 Tasks for br_ibge_pnadc
 """
 import os
+import shutil
 
 # pylint: disable=invalid-name,unnecessary-dunder-call
 import zipfile
@@ -12,10 +13,10 @@ import numpy as np
 import pandas as pd
 import requests
 from prefect import task
-from tqdm import tqdm
 
 from pipelines.datasets.br_ibge_pnadc.constants import constants as pnad_constants
-from pipelines.utils.utils import log
+from pipelines.utils.downloader import download_file
+from pipelines.utils.utils import log, to_partitions
 
 
 @task
@@ -53,7 +54,7 @@ def get_url_from_template(year: int, quarter: int) -> str:
 
 
 @task
-def download_txt(url, chunk_size=128, mkdir=False) -> str:
+def download_txt(url, mkdir=False) -> str:
     """
     Gets all csv files from a url and saves them to a directory.
     """
@@ -63,12 +64,9 @@ def download_txt(url, chunk_size=128, mkdir=False) -> str:
     request_headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/80.0.3987.149 Safari/537.36",
     }
-    r = requests.get(url, headers=request_headers, stream=True, timeout=10)
     save_path = "/tmp/data/"
     save_path = save_path + url.split("/")[-1]
-    with open(save_path, "wb") as fd:
-        for chunk in tqdm(r.iter_content(chunk_size=chunk_size)):
-            fd.write(chunk)
+    download_file(url, save_path, headers=request_headers, timeout=10, use_cache=True)
 
     with zipfile.ZipFile(save_path) as z:
         z.extractall("/tmp/data/input")
@@ -145,29 +143,20 @@ def save_partitions(filepath: str) -> str:
         str: Path to the saved file.
 
     """
+    # partitions are appended chunk by chunk, so a retry must start from scratch
+    shutil.rmtree("/tmp/data/output/", ignore_errors=True)
     os.system("mkdir -p /tmp/data/output/")
 
-    # get all parquet files
-    parquet_files = glob(f"{filepath}*.parquet")
-    # read all parquet files
-    df = pd.concat([pd.read_parquet(f) for f in parquet_files])
-
-    trimestre = df["trimestre"].unique()[0]
-    ano = df["ano"].unique()[0]
-    df.drop(columns=["trimestre", "ano"], inplace=True)
-    ufs = df["sigla_uf"].unique()
-
-    for uf in ufs:
-        df_uf = df[df["sigla_uf"] == uf]
-        df_uf.drop(columns=["sigla_uf"], inplace=True)
-        os.system(
-            "mkdir -p /tmp/data/output/ano={ano}/trimestre={trimestre}/sigla_uf={uf}".format(
-                ano=ano, trimestre=trimestre, uf=uf
-            )
-        )
-        df_uf.to_csv(
-            f"/tmp/data/output/ano={ano}/trimestre={trimestre}/sigla_uf={uf}/microdados.csv",
-            index=False,
-        )
+    # stream the staging parquet files instead of concatenating them in memory
+    parquet_files = sorted(glob(f"{filepath}*.parquet"))
+    chunks = (pd.read_parquet(f) for f in parquet_files)
+    to_partitions(
+        data=chunks,
+        partition_columns=["ano", "trimestre", "sigla_uf"],
+        savepath="/tmp/data/output/",
+    )
+    # keep the blob names used by previous loads so re-runs replace them in GCS
+    for partition_file in glob("/tmp/data/output/**/data.csv", recursive=True):
+        os.rename(partition_file, partition_file.replace("data.csv", "microdados.csv"))
 
     return "/tmp/data/output/"
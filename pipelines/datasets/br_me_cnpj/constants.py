@@ -49,6 +49,16 @@ class constants(Enum):  # pylint: disable=c0103
 
     URL = "https://dadosabertos.rfb.gov.br/CNPJ/"
 
+    # Ingestão paralela dos 10 arquivos de cada tabela
+    N_ARQUIVOS = 10
+    MAX_WORKERS = 4
+    MAX_DOWNLOADS = 3
+
+    # Tamanho dos chunks lidos de cada CSV, calculado pela memória disponível
+    BYTES_POR_LINHA = 4096
+    CHUNK_SIZE_MIN = 100_000
+    CHUNK_SIZE_MAX = 2_000_000
+
     HEADERS = {
         "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/55.0.2883.87 Safari/537.36"
     }
@@ -3,22 +3,23 @@
 Tasks for br_me_cnpj
 """
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
 
 import pandas as pd
+import prefect
 import requests
 from prefect import task
 from tqdm import tqdm
 
 from pipelines.datasets.br_me_cnpj.constants import constants as constants_cnpj
 from pipelines.datasets.br_me_cnpj.utils import (
+    calcular_chunk_size,
     data_url,
     destino_output,
-    download_unzip_csv,
-    process_csv_empresas,
-    process_csv_estabelecimentos,
+    download_zip,
     process_csv_simples,
-    process_csv_socios,
+    processar_arquivo,
 )
 from pipelines.utils.utils import extract_last_date, log
 
@@ -90,18 +91,32 @@ def check_for_updates(dataset_id, table_id):
 
 
 @task
-def main(tabelas):
+def main(tabelas, max_workers: int = constants_cnpj.MAX_WORKERS.value):
     """
     Performs the download, processing, and organization of CNPJ data.
 
+    The files of each table are downloaded concurrently and every file is processed
+    in a process pool as soon as its download finishes, so downloads overlap with
+    processing. Each worker writes its own `_{i}` output files.
+
     Args:
         tabelas (list): A list of tables to be processed.
+        max_workers (int): Number of files processed at the same time.
 
     Returns:
         str: The path to the output folder where the data has been organized.
     """
-    arquivos_baixados = []  # Lista para rastrear os arquivos baixados
     data_coleta = data_url(url, headers).date()  # Obtém a data da atualização dos dados
+    chunk_size = calcular_chunk_size(max_workers)
+    log(f"Processando {max_workers} arquivos por vez, em chunks de {chunk_size} linhas")
+
+    # O logger do prefect só existe no contexto da thread da task, que é copiado para
+    # as threads de download
+    contexto = prefect.context.to_dict()
+
+    def baixar(url_download, pasta_destino):
+        with prefect.context(**contexto):
+            return download_zip(url_download, pasta_destino)
 
     for tabela in tabelas:
         sufixo = tabela.lower()
@@ -114,28 +129,40 @@ def main(tabelas):
         # Define o caminho para a pasta de saída (output)
         output_path = destino_output(sufixo, data_coleta)
 
-        # Loop para baixar e processar os arquivos
-        for i in range(0, 10):
-            if tabela != "Simples":
-                nome_arquivo = f"{tabela}{i}"
-                url_download = f"https://dadosabertos.rfb.gov.br/CNPJ/{tabela}{i}.zip"
-                if nome_arquivo not in arquivos_baixados:
-                    arquivos_baixados.append(nome_arquivo)
-                    download_unzip_csv(url_download, input_path)
-                    if tabela == "Estabelecimentos":
-                        process_csv_estabelecimentos(
-                            input_path, output_path, data_coleta, i
-                        )
-                    elif tabela == "Socios":
-                        process_csv_socios(input_path, output_path, data_coleta, i)
-                    elif tabela == "Empresas":
-                        process_csv_empresas(input_path, output_path, data_coleta, i)
-            else:
-                nome_arquivo = f"{tabela}"
-                url_download = f"https://dadosabertos.rfb.gov.br/CNPJ/{tabela}.zip"
-                if nome_arquivo not in arquivos_baixados:
-                    arquivos_baixados.append(nome_arquivo)
-                    download_unzip_csv(url_download, input_path)
-                    process_csv_simples(input_path, output_path, data_coleta, sufixo)
+        if tabela == "Simples":
+            url_download = f"https://dadosabertos.rfb.gov.br/CNPJ/{tabela}.zip"
+            zip_path = download_zip(url_download, input_path)
+            process_csv_simples(
+                zip_path, output_path, data_coleta, sufixo, chunk_size=chunk_size
+            )
+            os.remove(zip_path)
+            continue
+
+        # Baixa os arquivos em paralelo e processa cada um assim que o download termina
+        with ThreadPoolExecutor(
+            max_workers=constants_cnpj.MAX_DOWNLOADS.value
+        ) as downloads, ProcessPoolExecutor(max_workers=max_workers) as workers:
+            downloads_futures = {
+                downloads.submit(
+                    baixar,
+                    f"https://dadosabertos.rfb.gov.br/CNPJ/{tabela}{i}.zip",
+                    input_path,
+                ): i
+                for i in range(constants_cnpj.N_ARQUIVOS.value)
+            }
+            workers_futures = [
+                workers.submit(
+                    processar_arquivo,
+                    tabela,
+                    future.result(),
+                    output_path,
+                    data_coleta,
+                    downloads_futures[future],
+                    chunk_size,
+                )
+                for future in as_completed(downloads_futures)
+            ]
+            for future in as_completed(workers_futures):
+                log(f"Arquivo {tabela}{future.result()} processado")
 
     return output_path
@@ -7,6 +7,7 @@ import zipfile
 from datetime import datetime
 
 import pandas as pd
+import psutil
 import pyarrow as pa
 import pyarrow.parquet as pq
 import requests
@@ -14,7 +15,13 @@ from bs4 import BeautifulSoup
 from tqdm import tqdm
 
 from pipelines.datasets.br_me_cnpj.constants import constants as constants_cnpj
-from pipelines.utils.utils import log
+from pipelines.utils.downloader import download_file
+from pipelines.utils.utils import (
+    iter_csv_from_zip,
+    list_zip_members,
+    log,
+    to_partitions,
+)
 
 ufs = constants_cnpj.UFS.value
 headers = constants_cnpj.HEADERS.value
@@ -62,43 +69,82 @@ def fill_left_zeros(df, column, num_digits):
     return df
 
 
+# ! Calcula o tamanho dos chunks pela memória disponível
+def calcular_chunk_size(n_workers: int) -> int:
+    """
+    Retorna o número de linhas por chunk de forma que os chunks de todos os workers
+    ocupem no máximo metade da memória disponível.
+    """
+    memoria = psutil.virtual_memory().available // 2
+    linhas = memoria // (n_workers * constants_cnpj.BYTES_POR_LINHA.value)
+    return int(
+        min(
+            max(linhas, constants_cnpj.CHUNK_SIZE_MIN.value),
+            constants_cnpj.CHUNK_SIZE_MAX.value,
+        )
+    )
+
+
 # ! Executa o download do zip file
-def download_unzip_csv(url, pasta_destino, chunk_size: int = 1000):
+def download_zip(url, pasta_destino):
     log(f"Baixando o arquivo {url}")
     save_path = os.path.join(pasta_destino, f"{os.path.basename(url)}.zip")
 
-    r = requests.get(url, headers=headers, stream=True, timeout=60)
-    with open(save_path, "wb") as fd:
-        for chunk in tqdm(
-            r.iter_content(chunk_size=chunk_size), desc="Baixando o arquivo"
-        ):
-            fd.write(chunk)
-
-    try:
-        with zipfile.ZipFile(save_path) as z:
-            z.extractall(pasta_destino)
-        log("Dados extraídos com sucesso!")
+    # Sem o cache de downloads: o zip é removido depois de processado
+    download_file(url, save_path, headers=headers, timeout=60)
 
-    except zipfile.BadZipFile:
+    if not zipfile.is_zipfile(save_path):
         log(f"O arquivo {os.path.basename(url)} não é um arquivo ZIP válido.")
 
-    os.remove(save_path)
+    return save_path
+
+
+# ! Converte datas AAAAMMDD para AAAA-MM-DD
+def formatar_datas(df, colunas):
+    """
+    Converte as colunas de datas no formato AAAAMMDD para AAAA-MM-DD, deixando nulas
+    as datas inválidas. A formatação é feita pelo numpy, sem `strftime` por linha.
+    """
+    for col in colunas:
+        datas = pd.to_datetime(df[col], format="%Y%m%d", errors="coerce")
+        texto = datas.to_numpy().astype("datetime64[D]").astype(str)
+        df[col] = pd.Series(texto, index=df.index).where(datas.notna())
+    return df
+
+
+# ! Limpa um chunk do CSV Estabelecimentos
+def limpar_estabelecimentos(chunk):
+    ordem = constants_cnpj.COLUNAS_ESTABELECIMENTO_ORDEM.value
+    # Mantém apenas as UFs conhecidas, que viram partições
+    chunk = chunk[chunk["sigla_uf"].isin(ufs)].copy()
+    # Arrumando as colunas datas
+    chunk = formatar_datas(
+        chunk,
+        ["data_situacao_cadastral", "data_inicio_atividade", "data_situacao_especial"],
+    )
+    # Preenchimento de zeros à esquerda nos campos do cnpj
+    chunk["cnpj_basico"] = chunk["cnpj_basico"].str.zfill(8)
+    chunk["cnpj_ordem"] = chunk["cnpj_ordem"].str.zfill(4)
+    chunk["cnpj_dv"] = chunk["cnpj_dv"].str.zfill(2)
+    # Gerando a coluna 'cnpj' e 'id_municipio'
+    chunk["cnpj"] = chunk["cnpj_basico"] + chunk["cnpj_ordem"] + chunk["cnpj_dv"]
+    chunk["id_municipio"] = ""
+    return chunk.loc[:, ordem]
 
 
 # ! Salva os dados CSV Estabelecimentos
 def process_csv_estabelecimentos(
-    input_path: str, output_path: str, data_coleta: str, i: int, chunk_size: int = 1000
+    zip_path: str, output_path: str, data_coleta: str, i: int, chunk_size: int = 1000
 ):
-    ordem = constants_cnpj.COLUNAS_ESTABELECIMENTO_ORDEM.value
     colunas = constants_cnpj.COLUNAS_ESTABELECIMENTO.value
     save_path = f"{output_path}data={data_coleta}/"
-    for nome_arquivo in os.listdir(input_path):
+    for _, nome_arquivo in list_zip_members(zip_path, suffix=""):
         if "estabele" in nome_arquivo.lower():
-            caminho_arquivo_csv = os.path.join(input_path, nome_arquivo)
             log(f"Carregando o arquivo: {nome_arquivo}")
-            for chunk in tqdm(
-                pd.read_csv(
-                    caminho_arquivo_csv,
+            chunks = tqdm(
+                iter_csv_from_zip(
+                    zip_path,
+                    nome_arquivo,
                     encoding="iso-8859-1",
                     sep=";",
                     header=None,
@@ -107,66 +153,35 @@ def process_csv_estabelecimentos(
                     chunksize=chunk_size,
                 ),
                 desc="Lendo o arquivo CSV",
-            ):
-                # Arrumando as colunas datas
-                date_cols = [
-                    "data_situacao_cadastral",
-                    "data_inicio_atividade",
-                    "data_situacao_especial",
-                ]
-                chunk[date_cols] = chunk[date_cols].apply(
-                    pd.to_datetime, format="%Y%m%d", errors="coerce"
-                )
-                chunk[date_cols] = chunk[date_cols].apply(
-                    lambda x: x.dt.strftime("%Y-%m-%d")
-                )
-
-                # Preenchimento de zeros à esquerda no campo 'cnpj_basico'
-                chunk = fill_left_zeros(chunk, "cnpj_basico", 8)
-                # Preenchimento de zeros à esquerda no campo 'cnpj_ordem'
-                chunk = fill_left_zeros(chunk, "cnpj_ordem", 4)
-                # Preenchimento de zeros à esquerda no campo 'cnpj_dv'
-                chunk = fill_left_zeros(chunk, "cnpj_dv", 2)
-                # Gerando a coluna 'cnpj' e 'id_municipio'
-                chunk["cnpj"] = (
-                    chunk["cnpj_basico"] + chunk["cnpj_ordem"] + chunk["cnpj_dv"]
-                )
-                chunk["id_municipio"] = ""
-                chunk = chunk.loc[:, ordem]
-                for uf in ufs:
-                    df_particao = chunk[chunk["sigla_uf"] == uf].copy()
-                    df_particao.drop(["sigla_uf"], axis=1, inplace=True)
-                    particao_path = os.path.join(save_path, f"sigla_uf={uf}")
-                    particao_filename = f"estabelecimentos_{i}.csv"
-                    particao_file_path = os.path.join(particao_path, particao_filename)
-
-                    mode = "a" if os.path.exists(particao_file_path) else "w"
-                    df_particao.to_csv(
-                        particao_file_path,
-                        index=False,
-                        encoding="iso-8859-1",
-                        mode=mode,
-                        header=mode == "w",
-                    )
+            )
+            # Cada chunk é agrupado por UF uma única vez e escrito nos arquivos
+            # sigla_uf=<UF>/estabelecimentos_{i}.csv, que ficam abertos até o fim
+            to_partitions(
+                (limpar_estabelecimentos(chunk) for chunk in chunks),
+                partition_columns=["sigla_uf"],
+                savepath=save_path,
+                max_open_files=len(ufs),
+                basename=f"estabelecimentos_{i}",
+                encoding="iso-8859-1",
+            )
 
             log(f"Arquivo estabelecimento_{i} salvo")
-            os.remove(caminho_arquivo_csv)
 
 
 # ! Salva os dados CSV Empresas
 def process_csv_empresas(
-    input_path: str, output_path: str, data_coleta: str, i: int, chunk_size: int = 1000
+    zip_path: str, output_path: str, data_coleta: str, i: int, chunk_size: int = 1000
 ):
     colunas = constants_cnpj.COLUNAS_EMPRESAS.value
     save_path = f"{output_path}data={data_coleta}/empresas_{i}.csv"
-    for nome_arquivo in os.listdir(input_path):
+    for _, nome_arquivo in list_zip_members(zip_path, suffix=""):
         if nome_arquivo.lower().endswith("csv"):
-            caminho_arquivo_csv = os.path.join(input_path, nome_arquivo)
             log(f"Carregando o arquivo: {nome_arquivo}")
             with open(os.path.join(save_path), "wb") as fd:
                 for chunk in tqdm(
-                    pd.read_csv(
-                        caminho_arquivo_csv,
+                    iter_csv_from_zip(
+                        zip_path,
+                        nome_arquivo,
                         encoding="iso-8859-1",
                         sep=";",
                         header=None,
@@ -188,23 +203,22 @@ def process_csv_empresas(
                     chunk.to_csv(fd, index=False, encoding="iso-8859-1")
 
             log(f"Arquivo empresas_{i} salvo")
-            os.remove(caminho_arquivo_csv)
 
 
 # ! Salva os dados CSV Socios
 def process_csv_socios(
-    input_path: str, output_path: str, data_coleta: str, i: int, chunk_size: int = 1000
+    zip_path: str, output_path: str, data_coleta: str, i: int, chunk_size: int = 1000
 ):
     colunas = constants_cnpj.COLUNAS_SOCIOS.value
     save_path = f"{output_path}data={data_coleta}/socios_{i}.csv"
-    for nome_arquivo in os.listdir(input_path):
+    for _, nome_arquivo in list_zip_members(zip_path, suffix=""):
         if nome_arquivo.lower().endswith("csv"):
-            caminho_arquivo_csv = os.path.join(input_path, nome_arquivo)
             log(f"Carregando o arquivo: {nome_arquivo}")
             with open(os.path.join(save_path), "wb") as fd:
                 for chunk in tqdm(
-                    pd.read_csv(
-                        caminho_arquivo_csv,
+                    iter_csv_from_zip(
+                        zip_path,
+                        nome_arquivo,
                         encoding="iso-8859-1",
                         sep=";",
                         header=None,
@@ -231,12 +245,11 @@ def process_csv_socios(
                     chunk.to_csv(fd, index=False, encoding="iso-8859-1")
 
             log(f"Arquivo socios_{i} salvo")
-            os.remove(caminho_arquivo_csv)
 
 
 # ! Salva os dados CSV Simples
 def process_csv_simples(
-    input_path: str,
+    zip_path: str,
     output_path: str,
     data_coleta: str,
     sufixo: str,
@@ -244,14 +257,14 @@ def process_csv_simples(
 ):
     colunas = constants_cnpj.COLUNAS_SIMPLES.value
     save_path = f"{output_path}{sufixo}.csv"
-    for nome_arquivo in os.listdir(input_path):
+    for _, nome_arquivo in list_zip_members(zip_path, suffix=""):
         if "simples.csv" in nome_arquivo.lower():
-            caminho_arquivo_csv = os.path.join(input_path, nome_arquivo)
             log(f"Carregando o arquivo: {nome_arquivo}")
             with open(os.path.join(save_path), "wb") as fd:
                 for chunk in tqdm(
-                    pd.read_csv(
-                        caminho_arquivo_csv,
+                    iter_csv_from_zip(
+                        zip_path,
+                        nome_arquivo,
                         encoding="iso-8859-1",
                         sep=";",
                         header=None,
@@ -279,4 +292,22 @@ def process_csv_simples(
                     chunk.to_csv(fd, index=False, encoding="iso-8859-1")
 
             log(f"Arquivo {sufixo} salvo")
-            os.remove(caminho_arquivo_csv)
+
+
+# ! Processa um arquivo baixado (executado nos workers)
+def processar_arquivo(
+    tabela: str,
+    zip_path: str,
+    output_path: str,
+    data_coleta: str,
+    i: int,
+    chunk_size: int,
+):
+    if tabela == "Estabelecimentos":
+        process_csv_estabelecimentos(zip_path, output_path, data_coleta, i, chunk_size)
+    elif tabela == "Socios":
+        process_csv_socios(zip_path, output_path, data_coleta, i, chunk_size)
+    elif tabela == "Empresas":
+        process_csv_empresas(zip_path, output_path, data_coleta, i, chunk_size)
+    os.remove(zip_path)
+    return i
@@ -4,9 +4,9 @@
 import os
 import time as tm
 
-import wget
 from tqdm import tqdm
 
+from pipelines.utils.downloader import download_file
 from pipelines.utils.utils import log
 
 
@@ -60,8 +60,12 @@ def download_data(
 
         log(f"Downloading {url}")
 
-        # downloads the file and saves it
-        wget.download(url, out=path + table_name + "/input")
+        # downloads the file (or reuses the cached copy) and saves it
+        download_file(
+            url,
+            os.path.join(path + table_name + "/input", os.path.basename(url)),
+            use_cache=True,
+        )
         # just for precaution,
         # sleep for 8 secs in between iterations
         tm.sleep(8)
@@ -11,6 +11,10 @@ class constants(Enum):  # pylint: disable=c0103
     OFERTA_DIA = "https://www.mercadolivre.com.br/ofertas?promotion_type=deal_of_the_day&container_id=MLB779362-1&page="
     RELAMPAGO = "https://www.mercadolivre.com.br/ofertas?promotion_type=lightning&container_id=MLB779362-1&page="
     # BARATO_DIA = "https://www.mercadolivre.com.br/ofertas?container_id=MLB861109-2&deal_ids=MLB861109-2&page="
+    # limits of the crawler (pipelines.utils.crawler.AsyncCrawler)
+    MAX_PER_HOST = 4
+    REQUESTS_PER_SECOND = 2
+    ATTEMPTS = 5
     KWARGS_LIST = [
         {"class_": "ui-pdp-review__amount"},
         {
@@ -2,60 +2,42 @@
 """
 Custom decorators for pipelines.
 """
-import asyncio
+import functools
 
-import requests
-from bs4 import BeautifulSoup
 
+def extractor(content_function):
+    """Decorator for functions that extract content from an already parsed page.
 
-def retry(content_function):
-    """Decorator function that retries an asynchronous content retrieval function.
+    Pages are downloaded (and retried) once by `utils.PageCache`, so extractors only
+    run against the parsed document. A missing page (`None`) or an element missing
+    from it makes the extractor return `None` instead of raising.
 
     Args:
-        content_function (callable): An asynchronous function that takes BeautifulSoup object and additional keyword arguments as parameters, and returns the desired content.
+        content_function (callable): A function that takes a BeautifulSoup object and additional keyword arguments as parameters, and returns the desired content.
 
     Returns:
-        callable: A wrapper function that retries the content retrieval function.
-
-    Raises:
-        None
+        callable: A wrapper function that returns None when the content is not found.
 
     Example:
-        @retry
-        async def get_title(soup):
+        @extractor
+        def get_title(soup):
             # Retrieves the title from a BeautifulSoup object
             title = soup.title.string
             return title
 
         # Usage
-        url = 'https://example.com'
-        title = await get_title(url)
+        soup = await pages.get('https://example.com')
+        title = get_title(soup)
     """
 
-    async def wrapper(url, attempts=2, wait_time=2, **kwargs):
-        content = None
-        count = 0
-
-        while content is None and count < attempts:
-            # print(f'Attempt {count + 1} of {attempts}')
-            headers = {"User-Agent": "Chrome/39.0.2171.95"}
-            try:
-                response = await asyncio.to_thread(
-                    requests.get, url, headers=headers, timeout=100
-                )
-            except Exception:
-                return None
-            await asyncio.sleep(wait_time)
-            soup = BeautifulSoup(response.text, "html.parser")
-            try:
-                content = content_function(soup, **kwargs)
-            except Exception:
-                if count == (attempts - 1):
-                    # Could not get content
-                    content = None
-            count += 1
-            # await asyncio.sleep(10)
-
-        return content
+    @functools.wraps(content_function)
+    def wrapper(soup, **kwargs):
+        if soup is None:
+            return None
+        try:
+            return content_function(soup, **kwargs)
+        except Exception:
+            # Could not get content
+            return None
 
     return wrapper
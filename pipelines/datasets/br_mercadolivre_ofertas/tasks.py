@@ -16,10 +16,10 @@ from pipelines.datasets.br_mercadolivre_ofertas.constants import (
 )
 from pipelines.datasets.br_mercadolivre_ofertas.utils import (
     clean_experience,
-    get_id,
     main_item,
     main_seller,
 )
+from pipelines.utils.fuzzy import FuzzyIndex
 from pipelines.utils.tasks import log
 
 new_cols_item = const_mercadolivre.NEW_ORDER_COLS.value
@@ -175,10 +175,8 @@ def clean_seller(filepath_raw):
     # clean localizacao: LocalizaçãoJuiz de Fora, Minas Gerais. -> Juiz de Fora, Minas Gerais.
     seller["localizacao"] = seller["localizacao"].str.replace("Localização", "")
     # clean opinioes: [{'Bom': 771, 'Regular': 67, 'Ruim': 174}] -> {'Bom': 771, 'Regular': 67, 'Ruim': 174}
-    dict_municipios = const_mercadolivre.MAP_MUNICIPIO_TO_ID.value
-    seller["localizacao"] = seller["localizacao"].apply(
-        lambda x: get_id(x, dict_municipios)
-    )
+    municipios = FuzzyIndex(const_mercadolivre.MAP_MUNICIPIO_TO_ID.value)
+    seller["localizacao"] = seller["localizacao"].map(municipios.get)
     # rename localizacao to id_municipio
     seller = seller.rename(columns={"localizacao": "id_municipio"})
     seller["opinioes"] = seller["opinioes"].str.replace("[", "")
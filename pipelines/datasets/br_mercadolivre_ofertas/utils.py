@@ -5,16 +5,20 @@ import asyncio
 import hashlib
 import json
 import re
+from collections import OrderedDict
 from datetime import datetime
+from typing import Optional
 
-import Levenshtein
 import pandas as pd
-import requests
 from bs4 import BeautifulSoup
 from fake_useragent import UserAgent
-from tqdm import tqdm
+from tqdm.asyncio import tqdm_asyncio
 
-from pipelines.datasets.br_mercadolivre_ofertas.decorators import retry
+from pipelines.datasets.br_mercadolivre_ofertas.constants import (
+    constants as const_mercadolivre,
+)
+from pipelines.datasets.br_mercadolivre_ofertas.decorators import extractor
+from pipelines.utils.crawler import AsyncCrawler, html_parser
 from pipelines.utils.tasks import log
 
 ua = UserAgent()
@@ -60,38 +64,58 @@ def generate_unique_id(text: str):
     return unique_id
 
 
-# ! tratamento dos dados
-def get_id(input_string, dictionary):
+class PageCache:
     """
-    Retrieves the value from a dictionary based on the input string, using the key with the closest Levenshtein distance.
-    Args:
-        input_string (str): The input string for which to find the closest matching key in the dictionary.
-        dictionary (dict): The dictionary containing key-value pairs.
+    Downloads and parses each page once for the lifetime of a crawl.
 
-    Returns:
-        Any: The value associated with the key that has the closest Levenshtein distance to the input string.
-             Returns None if the input_string is not a string, the dictionary is empty, or no match is found.
+    All the extractors of a page run against the same BeautifulSoup object, and
+    concurrent requests for the same URL share a single download. Downloads go through
+    an `AsyncCrawler`, which limits and retries them. The most recent `max_pages` pages
+    are kept. Failed downloads are not kept, so the page is downloaded again the next
+    time it is requested.
     """
-    if input_string is None:
-        return None
-
-    if not isinstance(input_string, str):
-        return None
 
-    best_match = None
-    min_distance = float("inf")
+    def __init__(self, crawler: AsyncCrawler, max_pages=256):
+        self.crawler = crawler
+        self.max_pages = max_pages
+        self._pages = OrderedDict()
+
+    async def get(self, url) -> Optional[BeautifulSoup]:
+        """
+        Returns the parsed page, or None if it could not be downloaded.
+        """
+        if url not in self._pages:
+            self._pages[url] = asyncio.ensure_future(
+                self.crawler.fetch(url, parser=html_parser)
+            )
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(url)
+        future = self._pages[url]
+        page = None
+        try:
+            page = await future
+        finally:
+            if page is None and self._pages.get(url) is future:
+                del self._pages[url]
+        return page
 
-    for key in dictionary:
-        distance = Levenshtein.distance(input_string.lower(), key.lower())
-        if distance < min_distance:
-            min_distance = distance
-            best_match = key
 
-    return dictionary.get(best_match)
+def new_crawler() -> AsyncCrawler:
+    """
+    Returns the crawler used for the Mercado Livre pages.
+    """
+    return AsyncCrawler(
+        max_per_host=const_mercadolivre.MAX_PER_HOST.value,
+        requests_per_second=const_mercadolivre.REQUESTS_PER_SECOND.value,
+        attempts=const_mercadolivre.ATTEMPTS.value,
+        headers={"User-Agent": "Chrome/39.0.2171.95"},
+    )
 
 
 # ! função genérica na coleta de itens e vendedores
-@retry
+@extractor
 def get_byelement(soup, **kwargs):
     """
     Retrieves the content of an HTML element identified by the given attributes from a BeautifulSoup object.
@@ -109,20 +133,21 @@ def get_byelement(soup, **kwargs):
 
 
 # ! utilizado no processo da tabela de itens
-def get_items_urls(urls):
+async def get_items_urls(urls, crawler):
     """
-    Collects item URLs from the given table URL, performing HTML content extraction.
+    Collects item URLs from the given table URLs, performing HTML content extraction.
     Args:
-        url (str): The URL of the webpage containing the items.
+        urls (list): The URLs of the webpages containing the items.
+        crawler (AsyncCrawler): The crawler that downloads the pages concurrently.
 
     Returns:
         list: A list of URLs of the items found on the webpage.
     """
     items_urls = []
 
-    for url in urls:
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, "html.parser")
+    for soup in await crawler.fetch_all(urls, parser=html_parser):
+        if soup is None:
+            continue
 
         items = soup.find_all(class_="promotion-item__link-container")
 
@@ -135,7 +160,7 @@ def get_items_urls(urls):
 
 
 # ! utilizado no processo da tabela de itens
-@retry
+@extractor
 def get_features(soup):
     """
     Retrieves the features from the HTML content represented by a BeautifulSoup object.
@@ -155,7 +180,7 @@ def get_features(soup):
 
 
 # ! utilizado no processo da tabela de itens
-@retry
+@extractor
 def get_review(soup):
     script_elements = soup.find_all("script", type="application/ld+json")
 
@@ -184,7 +209,7 @@ def get_review(soup):
 #     return review_info
 
 
-@retry
+@extractor
 def get_categories(soup):
     script_elements = soup.find_all("script", type="application/ld+json")
     categories = []
@@ -205,7 +230,7 @@ def get_categories(soup):
 
 
 # ! utilizado no processo da tabela de itens (coleta dos links de vendedores)
-@retry
+@extractor
 def get_seller_link(soup):
     """
     Retrieves the link to the seller from the HTML content represented by a BeautifulSoup object.
@@ -218,7 +243,7 @@ def get_seller_link(soup):
     return seller_link
 
 
-@retry
+@extractor
 def get_prices(soup, **kwargs):
     """
     Retrieves the price values from the HTML content represented by a BeautifulSoup object.
@@ -276,25 +301,20 @@ def get_prices(soup, **kwargs):
 
 
 # ! parte do processo da tabela de itens
-async def process_item_url(item_url, kwargs_list):
+async def process_item_url(item_url, kwargs_list, pages):
     """
     Processes an item URL by retrieving various information using asynchronous operations.
     Args:
         item_url (str): The URL of the item to process.
+        pages (PageCache): The pages of the crawl. The item page is downloaded once
+            and shared by all the extractors.
     Returns:
         dict: A dictionary containing the extracted information about the item.
     """
-    # tasks = [
-    #     get_byelement(url=item_url, attempts=5, wait_time=20, **kwargs)
-    #     for kwargs in kwargs_list
-    # ]
-
-    # results = await asyncio.gather(*tasks)
-    # keys = ["review_amount", "stars"]
-    # info = dict(zip(keys, results))
     info = {}
-    review_info = await get_review(item_url, attempts=5, wait_time=10)
-    prices = await get_prices(item_url, attempts=10, wait_time=20)
+    soup = await pages.get(item_url)
+    review_info = get_review(soup)
+    prices = get_prices(soup)
 
     if review_info is not None:
         info["stars"] = review_info["stars"]
@@ -316,11 +336,6 @@ async def process_item_url(item_url, kwargs_list):
         info["discount"] = None
         info["transport_condition"] = None
 
-    # info["price"] = prices["price"]
-    # info["price_original"] = prices["price_original"]
-    # info["title"] = prices["title"]
-    # info["discount"] = prices["discount"]
-    # info["transport_condition"] = prices["transport_condition"]
     log(info)
 
     # Gerando o ID item
@@ -329,7 +344,7 @@ async def process_item_url(item_url, kwargs_list):
     else:
         info["item_id_bd"] = None
     # Dados do vendedor
-    seller_link = await get_seller_link(item_url, attempts=5, wait_time=20)
+    seller_link = get_seller_link(soup)
     info["seller_link"] = seller_link
     if info["seller_link"] is not None:
         seller = info["seller_link"]
@@ -340,32 +355,31 @@ async def process_item_url(item_url, kwargs_list):
     else:
         info["seller_id"] = None
         info["seller"] = None
-    info["categories"] = await get_categories(item_url, attempts=2)
+    info["categories"] = get_categories(soup)
     info["datetime"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    info["features"] = await get_features(item_url, attempts=2)
+    info["features"] = get_features(soup)
     info["item_url"] = item_url
     return info
 
 
 # ! parte do processo da tabela de itens
-async def process_table(table, url, kwargs_list):
+async def process_table(table, url, kwargs_list, pages):
     """
     Processes a table of items by retrieving information for each item using asynchronous operations.
     Args:
         table (str): The name or identifier of the table.
         url (str): The URL of the webpage containing the items.
         kwargs_list (list): A list of keyword argument dictionaries for the 'process_item_url' function.
+        pages (PageCache): The pages of the crawl.
 
     Returns:
         list: A list of dictionaries containing the extracted information for each item.
     """
     log(f"Starting processing table '{table}'")
-    items_urls = get_items_urls(url)
-    tasks = [
-        process_item_url(item_url, kwargs_list)
-        for item_url in tqdm(items_urls, desc="link")
-    ]
-    results = await asyncio.gather(*tasks)
+    items_urls = await get_items_urls(url, pages.crawler)
+    tasks = [process_item_url(item_url, kwargs_list, pages) for item_url in items_urls]
+    # the bar advances as the items finish, in the order of the urls
+    results = await tqdm_asyncio.gather(*tasks, desc="link")
 
     for result in results:
         result["site_section"] = table
@@ -386,17 +400,20 @@ async def main_item(dict_tables, kwargs_list):
         list: A list containing the consolidated results from processing all the tables.
     """
     contents = []
-    coroutines = [
-        process_table(table, url, kwargs_list) for table, url in dict_tables.items()
-    ]
-    results = await asyncio.gather(*coroutines)
+    async with new_crawler() as crawler:
+        pages = PageCache(crawler)
+        coroutines = [
+            process_table(table, url, kwargs_list, pages)
+            for table, url in dict_tables.items()
+        ]
+        results = await asyncio.gather(*coroutines)
     for table_results in results:
         contents.extend(table_results)
     return contents
 
 
 # ! utilizado no processo da tabela de vendedor
-@retry
+@extractor
 def get_features_seller(soup):
     """
     Function to extract seller qualification information from <span> elements.
@@ -416,7 +433,7 @@ def get_features_seller(soup):
 
 
 # ! parte do processo da tabela de vendedor
-async def get_seller_async(url, seller_id):
+async def get_seller_async(url, seller_id, pages):
     kwargs_list = [
         {"class_": "experience"},
         {"class_": "seller-info__subtitle-sales"},
@@ -424,15 +441,15 @@ async def get_seller_async(url, seller_id):
         {"class_": "location__wrapper"},
     ]
     keys = ["experience", "reputation", "classification", "location"]
-    tasks = [get_byelement(url=url, attempts=2, **kwargs) for kwargs in kwargs_list]
-    results = await asyncio.gather(*tasks)
+    soup = await pages.get(url)
+    results = [get_byelement(soup, **kwargs) for kwargs in kwargs_list]
     info = {}
     info["title"] = (
         " ".join(re.findall(r"([A-Z]+)+", url.split("?")[0])).strip().title()
     )
     for key, value in dict(zip(keys, results)).items():
         info[key] = value
-    info["opinions"] = await asyncio.gather(get_features_seller(url, attempts=2))
+    info["opinions"] = [get_features_seller(soup)]
     info["date"] = datetime.now().strftime("%Y-%m-%d")
     info["seller_id"] = seller_id
 
@@ -444,10 +461,16 @@ async def main_seller(seller_ids, seller_links, file_dest):
     # get list of unique sellers
     dict_id_link = dict(zip(seller_ids, seller_links))
 
-    sellers = []
-    for seller_id, link in tqdm(dict_id_link.items()):
-        seller = await get_seller_async(link, seller_id)
-        sellers.append(seller)
+    async with new_crawler() as crawler:
+        pages = PageCache(crawler)
+        # the sellers are fetched concurrently, within the limits of the crawler
+        sellers = await tqdm_asyncio.gather(
+            *[
+                get_seller_async(link, seller_id, pages)
+                for seller_id, link in dict_id_link.items()
+            ],
+            desc="seller",
+        )
 
     # save sellers as a pandas dataframe
     df_sellers = pd.DataFrame(sellers)
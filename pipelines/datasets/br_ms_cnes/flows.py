@@ -31,7 +31,7 @@ from pipelines.datasets.br_ms_cnes.tasks import (
     access_ftp_donwload_files,
     check_files_to_parse,
     is_empty,
-    read_dbc_save_csv,
+    read_dbc_save_file,
 )
 from pipelines.utils.constants import constants as utils_constants
 from pipelines.utils.decorators import Flow
@@ -40,6 +40,7 @@ from pipelines.utils.metadata.flows import update_django_metadata
 from pipelines.utils.tasks import (
     create_table_and_upload_to_gcs,
     get_current_flow_labels,
+    get_staging_source_format,
     log_task,
     rename_current_flow_run_dataset_table,
 )
@@ -83,10 +84,16 @@ with Flow(
             table=br_ms_cnes_constants.TABLE.value[0],
         )
 
-        filepath = read_dbc_save_csv(
+        # existing staging tables keep the format of the files they were created with
+        source_format = get_staging_source_format(
+            dataset_id=dataset_id, table_id=table_id
+        )
+
+        filepath = read_dbc_save_file(
             file_list=dbc_files,
             path=br_ms_cnes_constants.PATH.value[1],
             table=br_ms_cnes_constants.TABLE.value[0],
+            source_format=source_format,
             upstream_tasks=[files_path, dbc_files],
         )
 
@@ -95,6 +102,7 @@ with Flow(
             dataset_id=dataset_id,
             table_id=table_id,
             dump_mode="append",
+            source_format=source_format,
             wait=filepath,
         )
 
@@ -194,10 +202,16 @@ with Flow(
             table=br_ms_cnes_constants.TABLE.value[1],
         )
 
-        filepath = read_dbc_save_csv(
+        # existing staging tables keep the format of the files they were created with
+        source_format = get_staging_source_format(
+            dataset_id=dataset_id, table_id=table_id
+        )
+
+        filepath = read_dbc_save_file(
             file_list=dbc_files,
             path=br_ms_cnes_constants.PATH.value[1],
             table=br_ms_cnes_constants.TABLE.value[1],
+            source_format=source_format,
             upstream_tasks=[files_path, dbc_files],
         )
 
@@ -206,6 +220,7 @@ with Flow(
             dataset_id=dataset_id,
             table_id=table_id,
             dump_mode="append",
+            source_format=source_format,
             wait=filepath,
         )
 
@@ -299,10 +314,16 @@ with Flow(name="br_ms_cnes.equipe", code_owners=["Gabriel Pisa"]) as br_ms_cnes_
             table=br_ms_cnes_constants.TABLE.value[4],
         )
 
-        filepath = read_dbc_save_csv(
+        # existing staging tables keep the format of the files they were created with
+        source_format = get_staging_source_format(
+            dataset_id=dataset_id, table_id=table_id
+        )
+
+        filepath = read_dbc_save_file(
             file_list=dbc_files,
             path=br_ms_cnes_constants.PATH.value[1],
             table=br_ms_cnes_constants.TABLE.value[4],
+            source_format=source_format,
             upstream_tasks=[files_path, dbc_files],
         )
 
@@ -311,6 +332,7 @@ with Flow(name="br_ms_cnes.equipe", code_owners=["Gabriel Pisa"]) as br_ms_cnes_
             dataset_id=dataset_id,
             table_id=table_id,
             dump_mode="append",
+            source_format=source_format,
             wait=filepath,
         )
 
@@ -404,10 +426,16 @@ with Flow(name="br_ms_cnes.leito", code_owners=["Gabriel Pisa"]) as br_ms_cnes_l
             table=br_ms_cnes_constants.TABLE.value[3],
         )
 
-        filepath = read_dbc_save_csv(
+        # existing staging tables keep the format of the files they were created with
+        source_format = get_staging_source_format(
+            dataset_id=dataset_id, table_id=table_id
+        )
+
+        filepath = read_dbc_save_file(
             file_list=dbc_files,
             path=br_ms_cnes_constants.PATH.value[1],
             table=br_ms_cnes_constants.TABLE.value[3],
+            source_format=source_format,
             upstream_tasks=[files_path, dbc_files],
         )
 
@@ -416,6 +444,7 @@ with Flow(name="br_ms_cnes.leito", code_owners=["Gabriel Pisa"]) as br_ms_cnes_l
             dataset_id=dataset_id,
             table_id=table_id,
             dump_mode="append",
+            source_format=source_format,
             wait=filepath,
         )
 
@@ -514,10 +543,16 @@ with Flow(
             table=br_ms_cnes_constants.TABLE.value[2],
         )
 
-        filepath = read_dbc_save_csv(
+        # existing staging tables keep the format of the files they were created with
+        source_format = get_staging_source_format(
+            dataset_id=dataset_id, table_id=table_id
+        )
+
+        filepath = read_dbc_save_file(
             file_list=dbc_files,
             path=br_ms_cnes_constants.PATH.value[1],
             table=br_ms_cnes_constants.TABLE.value[2],
+            source_format=source_format,
             upstream_tasks=[files_path, dbc_files],
         )
 
@@ -526,6 +561,7 @@ with Flow(
             dataset_id=dataset_id,
             table_id=table_id,
             dump_mode="append",
+            source_format=source_format,
             wait=filepath,
         )
 
@@ -620,10 +656,16 @@ with Flow(
             table=br_ms_cnes_constants.TABLE.value[5],
         )
 
-        filepath = read_dbc_save_csv(
+        # existing staging tables keep the format of the files they were created with
+        source_format = get_staging_source_format(
+            dataset_id=dataset_id, table_id=table_id
+        )
+
+        filepath = read_dbc_save_file(
             file_list=dbc_files,
             path=br_ms_cnes_constants.PATH.value[1],
             table=br_ms_cnes_constants.TABLE.value[5],
+            source_format=source_format,
             upstream_tasks=[files_path, dbc_files],
         )
 
@@ -632,6 +674,7 @@ with Flow(
             dataset_id=dataset_id,
             table_id=table_id,
             dump_mode="append",
+            source_format=source_format,
             wait=filepath,
         )
 
@@ -726,10 +769,16 @@ with Flow(
             table=br_ms_cnes_constants.TABLE.value[6],
         )
 
-        filepath = read_dbc_save_csv(
+        # existing staging tables keep the format of the files they were created with
+        source_format = get_staging_source_format(
+            dataset_id=dataset_id, table_id=table_id
+        )
+
+        filepath = read_dbc_save_file(
             file_list=dbc_files,
             path=br_ms_cnes_constants.PATH.value[1],
             table=br_ms_cnes_constants.TABLE.value[6],
+            source_format=source_format,
             upstream_tasks=[files_path, dbc_files],
         )
 
@@ -738,6 +787,7 @@ with Flow(
             dataset_id=dataset_id,
             table_id=table_id,
             dump_mode="append",
+            source_format=source_format,
             wait=filepath,
         )
 
@@ -834,10 +884,16 @@ with Flow(
             table=br_ms_cnes_constants.TABLE.value[7],
         )
 
-        filepath = read_dbc_save_csv(
+        # existing staging tables keep the format of the files they were created with
+        source_format = get_staging_source_format(
+            dataset_id=dataset_id, table_id=table_id
+        )
+
+        filepath = read_dbc_save_file(
             file_list=dbc_files,
             path=br_ms_cnes_constants.PATH.value[1],
             table=br_ms_cnes_constants.TABLE.value[7],
+            source_format=source_format,
             upstream_tasks=[files_path, dbc_files],
         )
 
@@ -846,6 +902,7 @@ with Flow(
             dataset_id=dataset_id,
             table_id=table_id,
             dump_mode="append",
+            source_format=source_format,
             wait=filepath,
         )
 
@@ -944,10 +1001,16 @@ with Flow(
             table=br_ms_cnes_constants.TABLE.value[8],
         )
 
-        filepath = read_dbc_save_csv(
+        # existing staging tables keep the format of the files they were created with
+        source_format = get_staging_source_format(
+            dataset_id=dataset_id, table_id=table_id
+        )
+
+        filepath = read_dbc_save_file(
             file_list=dbc_files,
             path=br_ms_cnes_constants.PATH.value[1],
             table=br_ms_cnes_constants.TABLE.value[8],
+            source_format=source_format,
             upstream_tasks=[files_path, dbc_files],
         )
 
@@ -956,6 +1019,7 @@ with Flow(
             dataset_id=dataset_id,
             table_id=table_id,
             dump_mode="append",
+            source_format=source_format,
             wait=filepath,
         )
 
@@ -1050,10 +1114,16 @@ with Flow(
             table=br_ms_cnes_constants.TABLE.value[9],
         )
 
-        filepath = read_dbc_save_csv(
+        # existing staging tables keep the format of the files they were created with
+        source_format = get_staging_source_format(
+            dataset_id=dataset_id, table_id=table_id
+        )
+
+        filepath = read_dbc_save_file(
             file_list=dbc_files,
             path=br_ms_cnes_constants.PATH.value[1],
             table=br_ms_cnes_constants.TABLE.value[9],
+            source_format=source_format,
             upstream_tasks=[files_path, dbc_files],
         )
 
@@ -1062,6 +1132,7 @@ with Flow(
             dataset_id=dataset_id,
             table_id=table_id,
             dump_mode="append",
+            source_format=source_format,
             wait=filepath,
         )
 
@@ -1157,10 +1228,16 @@ with Flow(
             table=br_ms_cnes_constants.TABLE.value[10],
         )
 
-        filepath = read_dbc_save_csv(
+        # existing staging tables keep the format of the files they were created with
+        source_format = get_staging_source_format(
+            dataset_id=dataset_id, table_id=table_id
+        )
+
+        filepath = read_dbc_save_file(
             file_list=dbc_files,
             path=br_ms_cnes_constants.PATH.value[1],
             table=br_ms_cnes_constants.TABLE.value[10],
+            source_format=source_format,
             upstream_tasks=[files_path, dbc_files],
         )
 
@@ -1169,6 +1246,7 @@ with Flow(
             dataset_id=dataset_id,
             table_id=table_id,
             dump_mode="append",
+            source_format=source_format,
             wait=filepath,
         )
 
@@ -1263,10 +1341,16 @@ with Flow(
             table=br_ms_cnes_constants.TABLE.value[11],
         )
 
-        filepath = read_dbc_save_csv(
+        # existing staging tables keep the format of the files they were created with
+        source_format = get_staging_source_format(
+            dataset_id=dataset_id, table_id=table_id
+        )
+
+        filepath = read_dbc_save_file(
             file_list=dbc_files,
             path=br_ms_cnes_constants.PATH.value[1],
             table=br_ms_cnes_constants.TABLE.value[11],
+            source_format=source_format,
             upstream_tasks=[files_path, dbc_files],
         )
 
@@ -1275,6 +1359,7 @@ with Flow(
             dataset_id=dataset_id,
             table_id=table_id,
             dump_mode="append",
+            source_format=source_format,
             wait=filepath,
         )
 
@@ -1371,10 +1456,16 @@ with Flow(
             table=br_ms_cnes_constants.TABLE.value[12],
         )
 
-        filepath = read_dbc_save_csv(
+        # existing staging tables keep the format of the files they were created with
+        source_format = get_staging_source_format(
+            dataset_id=dataset_id, table_id=table_id
+        )
+
+        filepath = read_dbc_save_file(
             file_list=dbc_files,
             path=br_ms_cnes_constants.PATH.value[1],
             table=br_ms_cnes_constants.TABLE.value[12],
+            source_format=source_format,
             upstream_tasks=[files_path, dbc_files],
         )
 
@@ -1383,6 +1474,7 @@ with Flow(
             dataset_id=dataset_id,
             table_id=table_id,
             dump_mode="append",
+            source_format=source_format,
             wait=filepath,
         )
 
@@ -7,24 +7,17 @@ Tasks for br_ms_cnes
 import os
 from datetime import timedelta
 
-import pandas as pd
-import rpy2.robjects as ro
-import rpy2.robjects.packages as rpackages
-import wget
 from prefect import task
-from rpy2.robjects import pandas2ri
-from rpy2.robjects.packages import importr
 
 from pipelines.constants import constants
-from pipelines.datasets.br_ms_cnes.constants import constants as cnes_constants
 from pipelines.datasets.br_ms_cnes.utils import (
-    check_and_create_column,
+    columns_and_transform,
     extract_last_date,
-    if_column_exist_delete,
     list_all_cnes_dbc_files,
-    pre_cleaning_to_utf8,
     year_month_sigla_uf_parser,
 )
+from pipelines.utils.dbc import dbc_to_csv, dbc_to_parquet
+from pipelines.utils.downloader import download_file
 from pipelines.utils.utils import log
 
 
@@ -111,8 +104,8 @@ def access_ftp_donwload_files(file_list: list, path: str, table: str) -> list[st
         log(f"created input dir {path + table + '/' + year_month_sigla_uf}")
 
         url = f"ftp://ftp.datasus.gov.br/{file}"
-        # access ftp
-        wget.download(url, out=input_path)
+        # access ftp, without the download cache: the files are removed once parsed
+        download_file(url, os.path.join(input_path, os.path.basename(file)))
 
         # list downloaded files
         dbc_file = os.listdir(input_path)
@@ -128,126 +121,42 @@ def access_ftp_donwload_files(file_list: list, path: str, table: str) -> list[st
     return dbc_files_path_list
 
 
-# task to convert dbc to csv and save to a partitioned dir
+# task to convert dbc to csv or parquet and save to a partitioned dir
 @task
-def read_dbc_save_csv(file_list: list, path: str, table: str) -> str:
+def read_dbc_save_file(
+    file_list: list, path: str, table: str, source_format: str = "parquet"
+) -> str:
     """
-    Convert dbc to csv
+    Convert dbc to csv or parquet, reading only the columns kept for the table
     """
+    if source_format not in ("csv", "parquet"):
+        raise ValueError(f"Invalid source format: {source_format}")
     log(f"wrangling {table} data")
-    # import R's utility package
-    utils = rpackages.importr("utils")
+    columns, optional_columns, transform = columns_and_transform(table)
+    convert = dbc_to_parquet if source_format == "parquet" else dbc_to_csv
 
-    # select a mirror for R packages
-    utils.chooseCRANmirror(ind=1)
-
-    log("installing read.dbc package")
-    utils.install_packages("read.dbc")
-    readdbc = importr("read.dbc")
-
-    # list files
     for file in file_list:
-        log(f"the file {file} is being converted to csv")
-        # read dbc
-        dbc_file = readdbc.read_dbc(file)
-        # convert from r to pandas
-        # https://rpy2.github.io/doc/latest/html/generated_rst/pandas.html#from-r-to-pandas
+        log(f"the file {file} is being converted to {source_format}")
 
         # parse year month sigla_uf
         year_month_sigla_uf = year_month_sigla_uf_parser(file=file)
         log(f"year_month_sigla_uf of {file} parsed")
         output_path = path + table + "/" + year_month_sigla_uf
+        output_file = output_path + "/" + table + "." + source_format
 
-        os.system(f"mkdir -p {output_path}")
-
-        log(f"created output partition dir {path + table + '/'+ year_month_sigla_uf}")
-
-        output_file = output_path + "/" + table + ".csv"
-
-        log(f"{file} 1 saved")
-        # salvar df
-        dbc_file.to_csvfile(
+        convert(
+            file,
             output_file,
-            sep=",",
-            na="",
-            row_names=False,
+            columns=columns,
+            transform=transform,
+            optional_columns=optional_columns,
         )
-        # delete dbc file
-        os.system(f"rm {file}")
-
-        # ler df
-
-        log("file 2 being read")
-        df = pd.read_csv(output_file, dtype=str, encoding="latin1")
-
-        # tratar
-        list_columns_to_delete = [
-            "AP01CV07",
-            "AP02CV07",
-            "AP03CV07",
-            "AP04CV07",
-            "AP05CV07",
-            "AP06CV07",
-            "AP07CV07",
-        ]
-
-        if table == "estabelecimento":
-            df = pre_cleaning_to_utf8(df)
-            df = if_column_exist_delete(df=df, col_list=list_columns_to_delete)
-            df = check_and_create_column(df=df, col_name="NAT_JUR")
-
-        elif table == "profissional":
-            df = df[cnes_constants.COLUMNS_TO_KEEP.value["PF"]]
-
-        elif table == "leito":
-            df = df[cnes_constants.COLUMNS_TO_KEEP.value["LT"]]
-
-        elif table == "equipamento":
-            df = df[cnes_constants.COLUMNS_TO_KEEP.value["EP"]]
 
-        elif table == "equipe":
-            # equipe
-            # the EQ table has different names for same variables across the years
-            # this is a workaround to standardize the names
-            standardize_colums = {
-                "IDEQUIPE": "ID_EQUIPE",
-                "AREA_EQP": "ID_AREA",
-            }
-
-            df.rename(columns=standardize_colums, inplace=True)
-
-            df = df[cnes_constants.COLUMNS_TO_KEEP.value["EQ"]]
-
-        elif table == "estabelecimento_ensino":
-            df = df[cnes_constants.COLUMNS_TO_KEEP.value["EE"]]
-
-        elif table == "dados_complementares":
-            df = df[cnes_constants.COLUMNS_TO_KEEP.value["DC"]]
-
-        elif table == "estabelecimento_filantropico":
-            df = df[cnes_constants.COLUMNS_TO_KEEP.value["EF"]]
-
-        elif table == "gestao_metas":
-            df = df[cnes_constants.COLUMNS_TO_KEEP.value["GM"]]
-
-        elif table == "habilitacao":
-            df = check_and_create_column(df=df, col_name="NAT_JUR")
-            df = df[cnes_constants.COLUMNS_TO_KEEP.value["HB"]]
-
-        elif table == "incentivos":
-            df = df[cnes_constants.COLUMNS_TO_KEEP.value["IN"]]
-
-        elif table == "regra_contratual":
-            df = df[cnes_constants.COLUMNS_TO_KEEP.value["RC"]]
-
-        elif table == "servico_especializado":
-            df = df[cnes_constants.COLUMNS_TO_KEEP.value["SR"]]
-
-        # salvar de novo
-        df.to_csv(output_file, sep=",", na_rep="", index=False, encoding="utf-8")
+        # delete dbc file
+        os.remove(file)
 
         log(
-            f"The file {file} was converted to csv and saved at {output_path + file + '.csv'}"
+            f"The file {file} was converted to {source_format} and saved at {output_file}"
         )
 
     return path + table
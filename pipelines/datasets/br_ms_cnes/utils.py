@@ -4,10 +4,12 @@ General purpose functions for the br_ms_cnes project
 """
 
 from ftplib import FTP
+from typing import Callable, List, Optional, Tuple
 
 import basedosdados as bd
 import pandas as pd
 
+from pipelines.datasets.br_ms_cnes.constants import constants as cnes_constants
 from pipelines.utils.utils import log
 
 
@@ -137,6 +139,78 @@ def if_column_exist_delete(df: pd.DataFrame, col_list: str):
     return df
 
 
+def columns_and_transform(
+    table: str,
+) -> Tuple[Optional[List[str]], List[str], Callable[[pd.DataFrame], pd.DataFrame]]:
+    """Returns the columns read from the dbc files of a CNES table, the columns read
+    only when the file has them and the cleaning applied to every batch of rows read
+
+    Args:
+        table (str): the table name, e.g. profissional
+
+    Returns:
+        (list, list, callable): the columns to read (None reads all of them), the
+        optional columns and the cleaning function
+    """
+    columns_to_keep = cnes_constants.COLUMNS_TO_KEEP.value
+
+    if table == "estabelecimento":
+        list_columns_to_delete = [
+            "AP01CV07",
+            "AP02CV07",
+            "AP03CV07",
+            "AP04CV07",
+            "AP05CV07",
+            "AP06CV07",
+            "AP07CV07",
+        ]
+
+        def transform(df: pd.DataFrame) -> pd.DataFrame:
+            df = pre_cleaning_to_utf8(df)
+            df = if_column_exist_delete(df=df, col_list=list_columns_to_delete)
+            return check_and_create_column(df=df, col_name="NAT_JUR")
+
+        return None, [], transform
+
+    if table == "equipe":
+        # the EQ table has different names for same variables across the years
+        # this is a workaround to standardize the names
+        standardize_colums = {
+            "IDEQUIPE": "ID_EQUIPE",
+            "AREA_EQP": "ID_AREA",
+        }
+        columns = columns_to_keep["EQ"]
+        renamed = list(standardize_colums) + list(standardize_colums.values())
+        return (
+            [column for column in columns if column not in renamed],
+            renamed,
+            lambda df: df.rename(columns=standardize_colums)[columns],
+        )
+
+    if table == "habilitacao":
+        columns = columns_to_keep["HB"]
+        return (
+            [column for column in columns if column != "NAT_JUR"],
+            ["NAT_JUR"],
+            lambda df: check_and_create_column(df=df, col_name="NAT_JUR")[columns],
+        )
+
+    group = {
+        "profissional": "PF",
+        "leito": "LT",
+        "equipamento": "EP",
+        "estabelecimento_ensino": "EE",
+        "dados_complementares": "DC",
+        "estabelecimento_filantropico": "EF",
+        "gestao_metas": "GM",
+        "incentivos": "IN",
+        "regra_contratual": "RC",
+        "servico_especializado": "SR",
+    }[table]
+    columns = columns_to_keep[group]
+    return columns, [], lambda df: df[columns]
+
+
 def extract_last_date(dataset_id, table_id, billing_project_id: str):
     """
     Extracts the last update date of a given dataset table.
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Identity resolution of the TSE candidates (id_candidato_bd).
+
+Rows are linked when they share a cpf or a título eleitoral, and the linked rows are
+grouped with a union-find over integer-coded documents. Groups holding more than one
+cpf or título are split by the first and last names of the candidate, following
+https://github.com/basedosdados/mais/blob/master/bases/br_tse_eleicoes/code/sub/cria_id_candidato.do
+"""
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+from unidecode import unidecode
+
+
+class UnionFind:
+    """
+    Disjoint sets over the integers `0..n-1`, with path halving and union by size.
+    Plain lists are used because indexing them is much faster than indexing numpy
+    arrays one element at a time.
+    """
+
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, node: int) -> int:
+        """
+        Returns the root of the set of `node`.
+        """
+        parent = self.parent
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def union(self, a: int, b: int) -> None:
+        """
+        Merges the sets of `a` and `b`.
+        """
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+    def roots(self) -> np.ndarray:
+        """
+        Returns the root of every node.
+        """
+        return np.array(
+            [self.find(node) for node in range(len(self.parent))], dtype=np.int64
+        )
+
+
+def encode_documents(values: pd.Series) -> np.ndarray:
+    """
+    Integer codes of a cpf or título column, ordered by the document. Missing,
+    non-numeric, negative (e.g. `-1`, `-4`) and all-zero documents get -1.
+    """
+    codes, uniques = pd.factorize(values)
+    # the same document may be written with and without padding zeros or as a float
+    numbers = pd.to_numeric(pd.Series(uniques, dtype=object), errors="coerce")
+    numbers = numbers.where(numbers > 0)
+    document_codes, _ = pd.factorize(numbers, sort=True)
+    # -1 codes (missing values) pick the sentinel
+    return np.append(document_codes, -1)[codes]
+
+
+def encode_names(names: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Integer codes of the first and of the last name, after removing accents and
+    case. Each distinct name is normalized once. Missing names get -1.
+    """
+    codes, uniques = pd.factorize(names)
+    tokens = [unidecode(str(name)).upper().split() for name in uniques]
+    first, _ = pd.factorize(
+        pd.Series([name[0] if name else None for name in tokens], dtype=object)
+    )
+    last, _ = pd.factorize(
+        pd.Series([name[-1] if name else None for name in tokens], dtype=object)
+    )
+    first = np.append(first, -1)
+    last = np.append(last, -1)
+    return first[codes], last[codes]
+
+
+def link_documents(cpf: np.ndarray, titulo: np.ndarray) -> np.ndarray:
+    """
+    Returns the group of every row, linking rows that share a cpf or a título. Rows
+    without both documents get -1.
+    """
+    n_cpf = cpf.max(initial=-1) + 1
+    n_titulo = titulo.max(initial=-1) + 1
+    # cpfs are the nodes 0..n_cpf-1 and títulos the nodes n_cpf..
+    sets = UnionFind(n_cpf + n_titulo)
+    both = (cpf >= 0) & (titulo >= 0)
+    edges = pd.unique(cpf[both] * n_titulo + titulo[both])
+    for a, b in zip((edges // n_titulo).tolist(), (edges % n_titulo + n_cpf).tolist()):
+        sets.union(a, b)
+    # a sentinel node maps missing documents to -1
+    roots = np.append(sets.roots(), -1)
+    return np.where(
+        cpf >= 0,
+        roots[np.where(cpf >= 0, cpf, -1)],
+        roots[np.where(titulo >= 0, titulo + n_cpf, -1)],
+    )
+
+
+def n_distinct(groups: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Number of distinct non-missing `values` of the group of every row.
+    """
+    valid = (groups >= 0) & (values >= 0)
+    n_values = values.max(initial=-1) + 1
+    pairs = pd.unique(groups[valid] * n_values + values[valid])
+    counts = np.bincount(
+        pairs // max(n_values, 1), minlength=groups.max(initial=-1) + 1
+    )
+    return np.where(groups >= 0, counts[np.maximum(groups, 0)], 0)
+
+
+def resolve_candidates(cpf: pd.Series, titulo: pd.Series, nome: pd.Series) -> pd.Series:
+    """
+    Returns the id_candidato_bd of every row, as a nullable integer.
+
+    1. Rows sharing a cpf or a título are linked (union-find).
+    2. Groups with a single cpf and a single título are candidates.
+    3. Other groups are split by first and last name, if all their rows share the
+       first name. Remaining rows, and rows without cpf and título, get no id.
+
+    Ids are numbered in the order of the smallest cpf (then título) of each candidate.
+    """
+    cpf_codes = encode_documents(cpf)
+    titulo_codes = encode_documents(titulo)
+    groups = link_documents(cpf_codes, titulo_codes)
+
+    single = (n_distinct(groups, cpf_codes) <= 1) & (
+        n_distinct(groups, titulo_codes) <= 1
+    )
+    keys = np.where((groups >= 0) & single, groups, -1).astype(np.int64)
+
+    split = (groups >= 0) & ~single
+    if split.any():
+        first, last = encode_names(nome[split].reset_index(drop=True))
+        split_groups = groups[split]
+        same_first = (n_distinct(split_groups, first) == 1) & (first >= 0)
+        combos, _ = pd.factorize(pd.MultiIndex.from_arrays([split_groups, first, last]))
+        offset = groups.max() + 1
+        keys[np.flatnonzero(split)] = np.where(same_first, combos + offset, -1)
+
+    # number the candidates in the order of their documents, missing ones last
+    order = np.lexsort(
+        (
+            np.where(titulo_codes >= 0, titulo_codes, np.iinfo(np.int64).max),
+            np.where(cpf_codes >= 0, cpf_codes, np.iinfo(np.int64).max),
+        )
+    )
+    order = order[keys[order] >= 0]
+    ids = np.zeros(len(keys), dtype=np.int64)
+    ids[order] = pd.factorize(keys[order])[0] + 1
+
+    result = pd.Series(ids, index=cpf.index, dtype="Int64")
+    result[keys < 0] = pd.NA
+    return result
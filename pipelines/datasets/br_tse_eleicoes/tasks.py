@@ -13,7 +13,6 @@ from itertools import product
 
 import numpy as np
 import pandas as pd
-import requests
 from prefect import task
 from tqdm import tqdm
 from unidecode import unidecode
@@ -21,11 +20,13 @@ from unidecode import unidecode
 from pipelines.constants import constants
 from pipelines.datasets.br_tse_eleicoes.utils import (
     clean_digit_id,
+    clean_digit_ids,
     get_blobs_from_raw,
     get_data_from_prod,
     get_id_candidato_bd,
     normalize_dahis,
 )
+from pipelines.utils.downloader import download_file
 from pipelines.utils.utils import log
 
 
@@ -53,7 +54,7 @@ def download_before22(table_id: str, start: int) -> None:
     max_retries=constants.TASK_MAX_RETRIES.value,
     retry_delay=timedelta(seconds=constants.TASK_RETRY_DELAY.value),
 )
-def get_csv_files(url, save_path, chunk_size=128, mkdir=False) -> None:
+def get_csv_files(url, save_path, mkdir=False) -> None:
     """
     Gets all csv files from a url and saves them to a directory.
     """
@@ -63,11 +64,8 @@ def get_csv_files(url, save_path, chunk_size=128, mkdir=False) -> None:
     request_headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/80.0.3987.149 Safari/537.36",
     }
-    r = requests.get(url, headers=request_headers, stream=True, timeout=10)
     save_path = save_path + url.split("/")[-1]
-    with open(save_path, "wb") as fd:
-        for chunk in r.iter_content(chunk_size=chunk_size):
-            fd.write(chunk)
+    download_file(url, save_path, headers=request_headers, timeout=10, use_cache=True)
 
     with zipfile.ZipFile(save_path) as z:
         z.extractall("/tmp/data/input")
@@ -245,23 +243,10 @@ def build_candidatos(folder: str, start: int, end: int, id_candidato_bd: bool =
 
         df = normalize_dahis(df)
 
-        for ano in range(end, start, -2):
+        # cpf, titulo_eleitoral and sequencial were read as (already padded) strings
+        for ano, table in df.groupby("ano", sort=False):
             os.system(f"mkdir -p /tmp/data/output/ano={ano}/")
-            table = df[df["ano"] == ano]
-            table["cpf"] = [
-                clean_digit_id(number=k, n_digits=11) if isinstance(k, int) else k
-                for k in table["cpf"].to_list()
-            ]
-            table["titulo_eleitoral"] = [
-                clean_digit_id(number=k, n_digits=12) if isinstance(k, int) else k
-                for k in table["titulo_eleitoral"].to_list()
-            ]
-            table["sequencial"] = [
-                clean_digit_id(number=k, n_digits=12) if isinstance(k, int) else k
-                for k in table["sequencial"].to_list()
-            ]
-            table.drop_duplicates(inplace=True)
-            table.drop("ano", axis=1, inplace=True)
+            table = table.drop_duplicates().drop("ano", axis=1)
             table.to_csv(f"/tmp/data/output/ano={ano}/candidatos.csv", index=False)
     else:
         for ano in range(end, start, -2):
@@ -270,18 +255,11 @@ def build_candidatos(folder: str, start: int, end: int, id_candidato_bd: bool =
                 sep=";",
                 encoding="utf-8",
             )
-            df["cpf"] = [
-                clean_digit_id(number=k, n_digits=11) if pd.notna(k) else k
-                for k in df["cpf"].to_list()
-            ]
-            df["titulo_eleitoral"] = [
-                clean_digit_id(number=k, n_digits=12) if pd.notna(k) else k
-                for k in df["titulo_eleitoral"].to_list()
-            ]
-            df["sequencial"] = [
-                clean_digit_id(number=k, n_digits=12) if pd.notna(k) else k
-                for k in df["sequencial"].to_list()
-            ]
+            df["cpf"] = clean_digit_ids(df["cpf"], n_digits=11)
+            df["titulo_eleitoral"] = clean_digit_ids(
+                df["titulo_eleitoral"], n_digits=12
+            )
+            df["sequencial"] = clean_digit_ids(df["sequencial"], n_digits=12)
             df.replace("#NULO#", np.nan, inplace=True)
             df.replace("#Nulo#", np.nan, inplace=True)
             df.replace("#NI#", np.nan, inplace=True)
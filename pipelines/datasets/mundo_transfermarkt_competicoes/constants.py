@@ -16,6 +16,13 @@ class constants(Enum):  # pylint: disable=c0103
     DATA_ATUAL = datetime.datetime.now().strftime("%Y-%m-%d")
     DATA_ATUAL_ANO = datetime.datetime.now().year
     SEASON = datetime.datetime.now().year - 1
+    # requisições simultâneas ao transfermarkt (pipelines.utils.crawler.AsyncCrawler)
+    MAX_PER_HOST = 4
+    # partidas baixadas ao mesmo tempo (estatísticas e escalações de cada uma)
+    MAX_PARTIDAS = 4
+    HEADERS = {
+        "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/55.0.2883.87 Safari/537.36"
+    }
     ORDEM_COLUNA_FINAL = [
         "ano_campeonato",
         "data",
@@ -55,11 +55,13 @@ with Flow(
         "materialize_after_dump", default=True, required=False
     )
     dbt_alias = Parameter("dbt_alias", default=True, required=False)
+    # anos do campeonato a coletar, e.g. [2019, 2020, 2021], por padrão o atual
+    anos_campeonato = Parameter("anos_campeonato", default=None, required=False)
 
     rename_flow_run = rename_current_flow_run_dataset_table(
         prefix="Dump: ", dataset_id=dataset_id, table_id=table_id, wait=table_id
     )
-    df = execucao_coleta_sync(table_id)
+    df = execucao_coleta_sync(table_id, anos_campeonato)
     output_filepath = make_partitions(df, upstream_tasks=[df])
     data_maxima = get_max_data(output_filepath, upstream_tasks=[output_filepath])
 
@@ -139,11 +141,13 @@ with Flow(
         "materialize_after_dump", default=True, required=False
     )
     dbt_alias = Parameter("dbt_alias", default=True, required=False)
+    # anos do campeonato a coletar, e.g. [2019, 2020, 2021], por padrão o atual
+    anos_campeonato = Parameter("anos_campeonato", default=None, required=False)
 
     rename_flow_run = rename_current_flow_run_dataset_table(
         prefix="Dump: ", dataset_id=dataset_id, table_id=table_id, wait=table_id
     )
-    df = execucao_coleta_sync(table_id)
+    df = execucao_coleta_sync(table_id, anos_campeonato)
     output_filepath = make_partitions(df, upstream_tasks=[df])
     data_maxima = get_max_data(output_filepath, upstream_tasks=[output_filepath])
 
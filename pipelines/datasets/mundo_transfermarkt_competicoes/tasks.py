@@ -4,15 +4,13 @@ Tasks for mundo_transfermarkt_competicoes
 """
 
 import asyncio
+from pathlib import Path
 
 import numpy as np
 import pandas as pd
 from prefect import task
 
 ###############################################################################
-from pipelines.datasets.mundo_transfermarkt_competicoes.constants import (
-    constants as mundo_constants,
-)
 from pipelines.datasets.mundo_transfermarkt_competicoes.utils import (
     execucao_coleta,
     execucao_coleta_copa,
@@ -21,13 +19,13 @@ from pipelines.utils.utils import log, to_partitions
 
 
 @task
-def execucao_coleta_sync(tabela):
+def execucao_coleta_sync(tabela, anos_campeonato=None):
     # Obter o loop de eventos atual e executar a tarefa nele
     loop = asyncio.get_event_loop()
     if tabela == "brasileirao_serie_a":
-        df = loop.run_until_complete(execucao_coleta())
+        df = loop.run_until_complete(execucao_coleta(anos_campeonato))
     else:
-        df = loop.run_until_complete(execucao_coleta_copa())
+        df = loop.run_until_complete(execucao_coleta_copa(anos_campeonato))
     return df
 
 
@@ -46,7 +44,11 @@ def make_partitions(df):
 
 @task
 def get_max_data(file_path):
-    ano = mundo_constants.DATA_ATUAL_ANO.value
+    # o último ano coletado, que não é o atual em coletas de anos passados
+    ano = max(
+        int(path.name.split("=")[1])
+        for path in Path(file_path).glob("ano_campeonato=*")
+    )
     df = pd.read_csv(f"{file_path}ano_campeonato={ano}/data.csv")
     df["data"] = pd.to_datetime(df["data"]).dt.date
     max_data = df["data"].max().strftime("%Y-%m-%d")
@@ -4,27 +4,30 @@ General purpose functions for the mundo_transfermarkt_competicoes project
 """
 
 ###############################################################################
+import asyncio
 import re
+from typing import List
 
 import numpy as np
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
 
 from pipelines.datasets.mundo_transfermarkt_competicoes.constants import (
     constants as mundo_constants,
 )
-from pipelines.datasets.mundo_transfermarkt_competicoes.decorators import retry
+from pipelines.datasets.mundo_transfermarkt_competicoes.decorators import fetch_content
+from pipelines.utils.crawler import AsyncCrawler, html_parser
 from pipelines.utils.utils import log
 
+HEADERS = mundo_constants.HEADERS.value
 
-@retry
+
+@fetch_content
 def get_content(link_soup):
     content = link_soup.find("div", id="main")
     return content
 
 
-def process_basico(df, content):
+def process_basico(content):
     """
     Process data
     """
@@ -86,11 +89,10 @@ def process_basico(df, content):
         "hfk": None,
         "afk": None,
     }
-    df = pd.concat([df, pd.DataFrame([new_content])], ignore_index=True)
-    return df
+    return new_content
 
 
-def process(df, content):
+def process(content):
     """
     Process complete
     """
@@ -169,12 +171,10 @@ def process(df, content):
             9
         ].get_text(),
     }
+    return new_content
 
-    df = pd.concat([df, pd.DataFrame([new_content])], ignore_index=True)
-    return df
 
-
-def pegar_valor(df, content):
+def pegar_valor(content):
     """
     Get value
     """
@@ -199,11 +199,10 @@ def pegar_valor(df, content):
         "tecnico_man": content.find_all("a", attrs={"id": "0"})[1].get_text(),
         "tecnico_vis": content.find_all("a", attrs={"id": "0"})[3].get_text(),
     }
-    df = pd.concat([df, pd.DataFrame([valor_content])], ignore_index=True)
-    return df
+    return valor_content
 
 
-def pegar_valor_sem_tecnico(df, content):
+def pegar_valor_sem_tecnico(content):
     """
     Get value without technical
     """
@@ -227,13 +226,12 @@ def pegar_valor_sem_tecnico(df, content):
         "tecnico_man": None,
         "tecnico_vis": None,
     }
-    df = pd.concat([df, pd.DataFrame([valor_content])], ignore_index=True)
-    return df
+    return valor_content
 
 
-def valor_vazio(df):
+def valor_vazio():
     """
-    Return a temmplate DataFrame
+    Return an empty row
     """
     valor_content = {
         "valor_equipe_titular_man": None,
@@ -243,13 +241,12 @@ def valor_vazio(df):
         "tecnico_man": None,
         "tecnico_vis": None,
     }
-    df = pd.concat([df, pd.DataFrame([valor_content])], ignore_index=True)
-    return df
+    return valor_content
 
 
-def vazio(df):
+def vazio():
     """
-    Return a template DataFrame
+    Return an empty row
     """
     null_content = {
         "estadio": None,
@@ -276,19 +273,81 @@ def vazio(df):
         "hfk": None,
         "afk": None,
     }
-    df = pd.concat([df, pd.DataFrame([null_content])], ignore_index=True)
-    return df
+    return null_content
+
+
+def extrai_linha(content, extratores, linha_vazia):
+    """
+    Extrai uma linha do conteúdo de uma página com o primeiro extrator que funcionar,
+    ou retorna uma linha vazia
+    """
+    if content:
+        for extrator in extratores:
+            try:
+                return extrator(content)
+            except Exception:
+                pass
+    return linha_vazia()
 
 
-async def execucao_coleta():
+async def coleta_partidas(
+    crawler, semaforo, links_esta, links_valor, extracao_esta, extracao_valor
+):
+    """
+    Baixa ao mesmo tempo as páginas de estatísticas e de escalações de cada partida,
+    com no máximo `semaforo` partidas em andamento, e extrai uma linha de cada página.
+    Retorna as linhas de estatísticas e as de valores, na ordem das partidas.
+    """
+    n_links = len(links_esta)
+    extraidas = 0
+
+    async def coleta_partida(link_esta, link_valor):
+        nonlocal extraidas
+        async with semaforo:
+            content_esta, content_valor = await asyncio.gather(
+                get_content(link_esta, crawler), get_content(link_valor, crawler)
+            )
+        extraidas += 1
+        log(f"{extraidas} partidas de {n_links} extraídas.")
+        return (
+            extrai_linha(content_esta, *extracao_esta),
+            extrai_linha(content_valor, *extracao_valor),
+        )
+
+    linhas = await asyncio.gather(
+        *[coleta_partida(esta, valor) for esta, valor in zip(links_esta, links_valor)]
+    )
+    return [esta for esta, _ in linhas], [valor for _, valor in linhas]
+
+
+async def execucao_coleta(anos_campeonato: List[int] = None) -> pd.DataFrame:
     """
     Execute the program
+
+    Args:
+        anos_campeonato (list): Optional. Anos do campeonato a coletar, por padrão o
+            atual. As temporadas são coletadas ao mesmo tempo.
+    """
+    anos_campeonato = anos_campeonato or [mundo_constants.DATA_ATUAL_ANO.value]
+    semaforo = asyncio.Semaphore(mundo_constants.MAX_PARTIDAS.value)
+    async with AsyncCrawler(
+        max_per_host=mundo_constants.MAX_PER_HOST.value, headers=HEADERS
+    ) as crawler:
+        dfs = await asyncio.gather(
+            *[
+                coleta_temporada(crawler, semaforo, ano_campeonato)
+                for ano_campeonato in anos_campeonato
+            ]
+        )
+    return pd.concat(dfs, ignore_index=True)
+
+
+async def coleta_temporada(crawler, semaforo, ano_campeonato: int) -> pd.DataFrame:
+    """
+    Coleta as partidas de uma temporada do Brasileirão
     """
     # Armazena informações do site em um único dataframe.
     base_url = "https://www.transfermarkt.com/campeonato-brasileiro-serie-a/gesamtspielplan/wettbewerb/BRA1?saison_id={season}&spieltagVon=1&spieltagBis=38"
-    headers = {
-        "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/55.0.2883.87 Safari/537.36"
-    }
     base_link = "https://www.transfermarkt.com"
     links = []
 
@@ -308,19 +367,14 @@ async def execucao_coleta():
     # expressão regular para encontrar o número de gols marcados pelo time visitante
     pattern_ftag = re.compile(r":\d")
 
-    # para armazenar os dados das partidas
-    df = pd.DataFrame(
-        {"ht": [], "at": [], "fthg": [], "ftag": [], "col_home": [], "col_away": []}
-    )
-    df_valor = pd.DataFrame({})
-
-    # season = data_atual.year - 1
-    season = mundo_constants.SEASON.value
+    # a temporada do transfermarkt começa no ano anterior ao do campeonato
+    season = ano_campeonato - 1
     # Pegar o link das partidas
     # Para cada temporada, adiciona os links dos jogos em `links`
     log(f"Obtendo links: temporada {season}")
-    site_data = requests.get(base_url.format(season=season), headers=headers)
-    soup = BeautifulSoup(site_data.content, "html.parser")
+    soup = await crawler.fetch(base_url.format(season=season), parser=html_parser)
+    if soup is None:
+        raise ValueError(f"Não foi possível obter as partidas da temporada {season}")
     link_tags = soup.find_all("a", attrs={"class": "ergebnis-link"})
     for tag in link_tags:
         links.append(re.sub(r"\s", "", tag["href"]))
@@ -360,37 +414,19 @@ async def execucao_coleta():
         valor = link.replace("index", "aufstellung")
         links_valor.append(valor)
 
-    n_links = len(links)
-    log(f"Encontrados {n_links} partidas.")
+    log(f"Encontrados {len(links)} partidas.")
     log("Extraindo dados...")
-    for n, link in enumerate(links_esta):
-        # Tentativas de obter os links
-        content = await get_content(base_link + link, wait_time=0.01)
-        if content:
-            try:
-                df = process(df, content)
-            except Exception:
-                try:
-                    df = process_basico(df, content)
-                except Exception:
-                    df = vazio(df)
-        else:
-            df = vazio(df)
-        log(f"{n+1} dados de {n_links} extraídos.")
-    for n, link in enumerate(links_valor):
-        # Tentativas de obter os links
-        content = await get_content(base_link + link, wait_time=0.01)
-        if content:
-            try:
-                df_valor = pegar_valor(df_valor, content)
-            except Exception:
-                try:
-                    df_valor = pegar_valor_sem_tecnico(df_valor, content)
-                except Exception:
-                    df_valor = valor_vazio(df_valor)
-        else:
-            df_valor = valor_vazio(df_valor)
-        log(f"{n+1} valores de {n_links} extraídos.")
+    # uma linha de estatísticas e uma de valores por partida
+    linhas, linhas_valor = await coleta_partidas(
+        crawler,
+        semaforo,
+        [base_link + link for link in links_esta],
+        [base_link + link for link in links_valor],
+        ([process, process_basico], vazio),
+        ([pegar_valor, pegar_valor_sem_tecnico], valor_vazio),
+    )
+    df = pd.DataFrame(linhas)
+    df_valor = pd.DataFrame(linhas_valor)
 
     df["ht"] = ht
     df["at"] = at
@@ -495,7 +531,7 @@ async def execucao_coleta():
     df = pd.concat([df, df_valor], axis=1)
 
     df["data"] = pd.to_datetime(df["data"])
-    df["ano_campeonato"] = mundo_constants.DATA_ATUAL_ANO.value
+    df["ano_campeonato"] = ano_campeonato
 
     df = df[mundo_constants.ORDEM_COLUNA_FINAL.value]
 
@@ -503,7 +539,7 @@ async def execucao_coleta():
 
 
 # ! Código para a Copa do Brasil
-def process_copa_brasil(df, content):
+def process_copa_brasil(content):
     """
     Process complete
     """
@@ -577,11 +613,10 @@ def process_copa_brasil(df, content):
             "div", attrs={"class": "sb-statistik-zahl"}
         )[9].get_text(),
     }
-    df = pd.concat([df, pd.DataFrame([new_content])], ignore_index=True)
-    return df
+    return new_content
 
 
-def process_basico_copa_brasil(df, content):
+def process_basico_copa_brasil(content):
     """
     Process data
     """
@@ -621,13 +656,12 @@ def process_basico_copa_brasil(df, content):
         "chutes_bola_parada_man": None,
         "chutes_bola_parada_vis": None,
     }
-    df = pd.concat([df, pd.DataFrame([new_content])], ignore_index=True)
-    return df
+    return new_content
 
 
-def vazio_copa_brasil(df):
+def vazio_copa_brasil():
     """
-    Return a template DataFrame
+    Return an empty row
     """
     new_content = {
         "estadio": None,
@@ -654,11 +688,10 @@ def vazio_copa_brasil(df):
         "chutes_bola_parada_man": None,
         "chutes_bola_parada_vis": None,
     }
-    df = pd.concat([df, pd.DataFrame([new_content])], ignore_index=True)
-    return df
+    return new_content
 
 
-def pegar_valor_copa_brasil(df, content):
+def pegar_valor_copa_brasil(content):
     """
     Get value
     """
@@ -685,11 +718,10 @@ def pegar_valor_copa_brasil(df, content):
         "tecnico_man": content.find_all("a", attrs={"id": "0"})[1].get_text(),
         "tecnico_vis": content.find_all("a", attrs={"id": "0"})[3].get_text(),
     }
-    df = pd.concat([df, pd.DataFrame([valor_content])], ignore_index=True)
-    return df
+    return valor_content
 
 
-def pegar_valor_sem_tecnico_copa_brasil(df, content):
+def pegar_valor_sem_tecnico_copa_brasil(content):
     """
     Get value without technical
     """
@@ -715,13 +747,12 @@ def pegar_valor_sem_tecnico_copa_brasil(df, content):
         "tecnico_man": None,
         "tecnico_vis": None,
     }
-    df = pd.concat([df, pd.DataFrame([valor_content])], ignore_index=True)
-    return df
+    return valor_content
 
 
-def valor_vazio_copa_brasil(df):
+def valor_vazio_copa_brasil():
     """
-    Return a temmplate DataFrame
+    Return an empty row
     """
     valor_content = {
         "valor_equipe_titular_man": None,
@@ -731,15 +762,60 @@ def valor_vazio_copa_brasil(df):
         "tecnico_man": None,
         "tecnico_vis": None,
     }
-    df = pd.concat([df, pd.DataFrame([valor_content])], ignore_index=True)
-    return df
+    return valor_content
+
+
+async def execucao_coleta_copa(anos_campeonato: List[int] = None) -> pd.DataFrame:
+    """
+    Execute the program for the Copa do Brasil
+
+    Args:
+        anos_campeonato (list): Optional. Anos do campeonato a coletar, por padrão o
+            atual. As temporadas são coletadas ao mesmo tempo.
+    """
+    anos_campeonato = anos_campeonato or [mundo_constants.DATA_ATUAL_ANO.value]
+    semaforo = asyncio.Semaphore(mundo_constants.MAX_PARTIDAS.value)
+    async with AsyncCrawler(
+        max_per_host=mundo_constants.MAX_PER_HOST.value, headers=HEADERS
+    ) as crawler:
+        dfs = await asyncio.gather(
+            *[
+                coleta_temporada_copa(crawler, semaforo, ano_campeonato)
+                for ano_campeonato in anos_campeonato
+            ]
+        )
+    return pd.concat(dfs, ignore_index=True)
 
 
-async def execucao_coleta_copa():
+def placar_penaltis(content):
+    """
+    Extrai o placar da disputa de pênaltis da página de uma partida
+    """
+    # Encontre a tag h2 com a classe "content-box-headline"
+    h2_tags = content.find_all("h2", class_="content-box-headline")
+
+    resultado = None
+    # Itere pelas tags h2 encontradas
+    for h2_tag in h2_tags:
+        if "Goals" in h2_tag.text:
+            content_gol = content.find_all("div", attrs={"class": "sb-ereignisse"})
+            resultado = (
+                content_gol[0]
+                .find_all("div", attrs={"class": "sb-aktion-spielstand"})[-1]
+                .get_text()
+            )
+            break  # Pare a iteração assim que encontrar "Goals"
+    # Se nenhum gol foi encontrado, o placar é '0:0'
+    if resultado is None:
+        return "0:0"
+    return resultado
+
+
+async def coleta_temporada_copa(crawler, semaforo, ano_campeonato: int) -> pd.DataFrame:
+    """
+    Coleta as partidas de uma temporada da Copa do Brasil
+    """
     base_url = "https://www.transfermarkt.com/copa-do-brasil/gesamtspielplan/pokalwettbewerb/BRC/saison_id/{season}"
-    headers = {
-        "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/55.0.2883.87 Safari/537.36"
-    }
 
     pattern_man = re.compile(r"\d+:")
     pattern_vis = re.compile(r":\d+")
@@ -753,14 +829,15 @@ async def execucao_coleta_copa():
     gols_man = []
     gols_vis = []
     penalti = []
-    lista_nova = []
 
-    season = mundo_constants.SEASON.value
+    # a temporada do transfermarkt começa no ano anterior ao do campeonato
+    season = ano_campeonato - 1
     # Pegar o link das partidas
     # Para cada temporada, adiciona os links dos jogos em `links`
     log(f"Obtendo links: temporada {season}")
-    site_data = requests.get(base_url.format(season=season), headers=headers)
-    soup = BeautifulSoup(site_data.content, "html.parser")
+    soup = await crawler.fetch(base_url.format(season=season), parser=html_parser)
+    if soup is None:
+        raise ValueError(f"Não foi possível obter as partidas da temporada {season}")
     link_tags = soup.find_all("a", attrs={"class": "ergebnis-link"})
     for tag in link_tags:
         links.append(re.sub(r"\s", "", tag["href"]))
@@ -793,37 +870,23 @@ async def execucao_coleta_copa():
     for gol in gols:
         penalti.append(1 if "on pens" in gol else 0)
 
-    pares = zip(links, penalti)
-    for link, valor_penalti in pares:
-        if valor_penalti == 1:
-            link_data = requests.get(base_link + link, headers=headers)
-            link_soup = BeautifulSoup(link_data.content, "html.parser")
-            content = link_soup.find("div", id="main")
-            content_gol = content.find_all("div", attrs={"class": "sb-ereignisse"})
-            # Encontre a tag h2 com a classe "content-box-headline"
-            h2_tags = content.find_all("h2", class_="content-box-headline")
-
-            # Itere pelas tags h2 encontradas
-            for h2_tag in h2_tags:
-                if "Goals" in h2_tag.text:
-                    content_gol = content.find_all(
-                        "div", attrs={"class": "sb-ereignisse"}
-                    )
-                    resultado = (
-                        content_gol[0]
-                        .find_all("div", attrs={"class": "sb-aktion-spielstand"})[-1]
-                        .get_text()
-                    )
-                    break  # Pare a iteração assim que encontrar "Goals"
-                else:
-                    resultado = None
-            # Após a iteração, verifique se resultado é None e, se for, adicione '0:0' à lista
-            if resultado is None:
-                lista_nova.append("0:0")
-            else:
-                lista_nova.append(resultado)
-        else:
-            lista_nova.append(None)
+    async def resultado_penaltis(link):
+        async with semaforo:
+            content = await get_content(base_link + link, crawler)
+        if content is None:
+            raise ValueError(f"Não foi possível obter a partida {base_link + link}")
+        return placar_penaltis(content)
+
+    # as partidas decididas nos pênaltis são baixadas ao mesmo tempo
+    links_penaltis = [link for link, valor in zip(links, penalti) if valor == 1]
+    placares = await asyncio.gather(
+        *[resultado_penaltis(link) for link in links_penaltis]
+    )
+    placares = dict(zip(links_penaltis, placares))
+    lista_nova = [
+        placares[link] if valor_penalti == 1 else None
+        for link, valor_penalti in zip(links, penalti)
+    ]
 
     if len(lista_nova) == len(gols):
         for i in range(len(lista_nova)):
@@ -859,43 +922,22 @@ async def execucao_coleta_copa():
         valor = link.replace("index", "aufstellung")
         links_valor.append(valor)
 
-    n_links = len(links)
-    log(f"Encontrados {n_links} partidas.")
+    log(f"Encontrados {len(links)} partidas.")
     log("Extraindo dados...")
-
-    df = pd.DataFrame(
-        {"time_man": [], "time_vis": [], "gols_man": [], "gols_vis": [], "penalti": []}
+    # uma linha de estatísticas e uma de valores por partida
+    linhas, linhas_valor = await coleta_partidas(
+        crawler,
+        semaforo,
+        [base_link_br + link for link in links_esta],
+        [base_link + link for link in links_valor],
+        ([process_copa_brasil, process_basico_copa_brasil], vazio_copa_brasil),
+        (
+            [pegar_valor_copa_brasil, pegar_valor_sem_tecnico_copa_brasil],
+            valor_vazio_copa_brasil,
+        ),
     )
-    df_valor = pd.DataFrame({})
-
-    for n, link in enumerate(links_esta):
-        content = await get_content(base_link_br + link, wait_time=0.01)
-        if content:
-            try:
-                df = process_copa_brasil(df, content)
-            except Exception:
-                try:
-                    df = process_basico_copa_brasil(df, content)
-                except Exception:
-                    df = vazio_copa_brasil(df)
-        else:
-            df = vazio_copa_brasil(df)
-        log(f"{n+1} dados sobre estatística de {n_links} extraídos.")
-
-    for n, link in enumerate(links_valor):
-        content = await get_content(base_link + link, wait_time=0.01)
-
-        if content:
-            try:
-                df_valor = pegar_valor_copa_brasil(df_valor, content)
-            except Exception:
-                try:
-                    df_valor = pegar_valor_sem_tecnico_copa_brasil(df_valor, content)
-                except Exception:
-                    df_valor = valor_vazio_copa_brasil(df_valor)
-        else:
-            df_valor = valor_vazio_copa_brasil(df_valor)
-        log(f"{n+1} valores de {n_links} extraídos.")
+    df = pd.DataFrame(linhas)
+    df_valor = pd.DataFrame(linhas_valor)
 
     df["time_man"] = time_man
     df["time_vis"] = time_vis
@@ -966,7 +1008,7 @@ async def execucao_coleta_copa():
 
     df["data"] = pd.to_datetime(df["data"], format="%d/%m/%y").dt.date
     df["horario"] = pd.to_datetime(df["horario"], format="%H:%M").dt.strftime("%H:%M")
-    df["ano_campeonato"] = mundo_constants.DATA_ATUAL_ANO.value
+    df["ano_campeonato"] = ano_campeonato
 
     df = pd.concat([df, df_valor], axis=1)
     df.fillna("", inplace=True)
@@ -3,13 +3,10 @@
 General purpose functions for the process_df_with_architecture project
 """
 
-
-from io import StringIO
-
 import numpy as np
 import pandas as pd
-import requests
 
+from pipelines.utils.architecture import get_architecture
 from pipelines.utils.utils import log
 
 
@@ -36,10 +33,11 @@ def apply_architecture_to_dataframe(
     Raises:
         Exception: If an error occurs during the transformation process.
     """
-    architecture = read_architecture_table(url_architecture=url_architecture)
+    cached_architecture = get_architecture(url_architecture)
+    architecture = cached_architecture.table.replace(np.nan, "", regex=True)
 
     if apply_rename_columns:
-        df = rename_columns(df, architecture)
+        df = df.rename(columns=cached_architecture.rename_map)
 
     if apply_include_missing_columns:
         df = include_missing_columns(df, architecture)
@@ -57,13 +55,8 @@ def read_architecture_table(url_architecture: str) -> pd.DataFrame:
     Returns:
         df: um df com a tabela de arquitetura
     """
-    # Converte a URL de edição para um link de exportação em formato csv
-    url = url_architecture.replace("edit#gid=", "export?format=csv&gid=")
-
-    # Coloca a arquitetura em um dataframe
-    df_architecture = pd.read_csv(
-        StringIO(requests.get(url, timeout=10).content.decode("utf-8"))
-    )
+    # A arquitetura é lida do cache compartilhado (ver pipelines.utils.architecture)
+    df_architecture = get_architecture(url_architecture).table
 
     return df_architecture.replace(np.nan, "", regex=True)
 
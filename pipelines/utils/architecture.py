@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Registry of the architecture tables (Google Sheets) of the BD+ datasets.
+
+Architecture tables are fetched as csv exports and cached in process and on disk, keyed
+by URL, for `constants.ARCHITECTURE_CACHE_TTL` seconds. Snapshots committed to
+`architecture_snapshots/` are used when offline (`BASEDOSDADOS_ARCHITECTURE_OFFLINE=1`)
+and as a fallback when the sheet cannot be fetched.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from io import StringIO
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import pandas as pd
+import requests
+
+from pipelines.utils.constants import constants
+from pipelines.utils.utils import log
+
+SNAPSHOT_DIR = Path(__file__).parent / "architecture_snapshots"
+
+# bigquery types of the architecture tables -> pandas dtypes
+PANDAS_DTYPES = {
+    "int64": "Int64",
+    "float64": "float64",
+    "numeric": "float64",
+    "bool": "boolean",
+    "string": "string",
+    "date": "string",
+    "datetime": "string",
+    "time": "string",
+}
+
+
+def export_url(url: str) -> str:
+    """
+    Converts the edit URL of a sheet to its csv export URL.
+    """
+    return url.replace("edit#gid=", "export?format=csv&gid=")
+
+
+def snapshot_name(url: str) -> str:
+    """
+    Returns the snapshot file name of a sheet URL: `<sheet_id>_<gid>.csv`, or the
+    sha256 of the URL when it is not a Google Sheets URL.
+    """
+    sheet_id = re.search(r"/spreadsheets/d/([\w-]+)", url)
+    gid = re.search(r"gid=(\d+)", url)
+    if sheet_id is None:
+        return f"{hashlib.sha256(url.encode()).hexdigest()}.csv"
+    return f"{sheet_id.group(1)}_{gid.group(1) if gid else 0}.csv"
+
+
+class Architecture:
+    """
+    A parsed architecture table, with the rename map, column order and dtypes
+    computed once.
+    """
+
+    def __init__(self, url: str, content: str):
+        self.url = url
+        self.content = content
+        self._table = pd.read_csv(StringIO(content))
+        # like `apply_architecture_to_dataframe.rename_columns`, ambiguous original
+        # names are not renamed
+        renamed = self._table[["name", "original_name"]].drop_duplicates(
+            subset=["original_name"], keep=False
+        )
+        renamed = renamed[renamed["original_name"].notna()]
+        self.rename_map: Dict[str, str] = dict(
+            zip(renamed["original_name"], renamed["name"])
+        )
+        self.columns: List[str] = list(self._table["name"])
+        self.original_columns: List[str] = [
+            column for column in self._table["original_name"] if pd.notna(column)
+        ]
+        self.dtypes: Dict[str, str] = {}
+        if "bigquery_type" in self._table:
+            self.dtypes = {
+                name: PANDAS_DTYPES.get(str(bigquery_type).strip().lower(), "string")
+                for name, bigquery_type in zip(
+                    self._table["name"], self._table["bigquery_type"]
+                )
+            }
+
+    @property
+    def table(self) -> pd.DataFrame:
+        """
+        A copy of the architecture table, as read from the csv export.
+        """
+        return self._table.copy()
+
+
+class ArchitectureRegistry:
+    """
+    Fetches architecture tables, caching them in process and on disk.
+
+    Args:
+        cache_dir (str, pathlib.Path): Optional. Defaults to
+            `constants.ARCHITECTURE_CACHE_DIR`.
+        ttl (int): seconds a cached table is used before being fetched again.
+        snapshot_dir (str, pathlib.Path): Optional. Folder of the committed snapshots.
+        offline (bool): Optional. Only use snapshots. Defaults to the
+            `BASEDOSDADOS_ARCHITECTURE_OFFLINE` environment variable.
+        timeout (int): request timeout, in seconds.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Union[str, Path] = None,
+        ttl: Optional[int] = None,
+        snapshot_dir: Union[str, Path] = None,
+        offline: Optional[bool] = None,
+        timeout: int = 10,
+    ):
+        self.cache_dir = Path(cache_dir or constants.ARCHITECTURE_CACHE_DIR.value)
+        self.ttl = ttl if ttl is not None else constants.ARCHITECTURE_CACHE_TTL.value
+        self.snapshot_dir = Path(snapshot_dir or SNAPSHOT_DIR)
+        if offline is None:
+            offline = os.getenv("BASEDOSDADOS_ARCHITECTURE_OFFLINE", "").lower()
+            offline = offline in ("1", "true")
+        self.offline = offline
+        self.timeout = timeout
+        self._architectures: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _cache_path(self, url: str) -> Path:
+        return self.cache_dir / f"{hashlib.sha256(url.encode()).hexdigest()}.csv"
+
+    def _read_cache(self, url: str, max_age: Optional[float]) -> Optional[str]:
+        path = self._cache_path(url)
+        if not path.exists():
+            return None
+        if max_age is not None and time.time() - path.stat().st_mtime > max_age:
+            return None
+        return path.read_text(encoding="utf-8")
+
+    def _write_cache(self, url: str, content: str) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=self.cache_dir, delete=False
+        ) as file:
+            file.write(content)
+        os.replace(file.name, self._cache_path(url))
+
+    def _read_snapshot(self, url: str) -> Optional[str]:
+        path = self.snapshot_dir / snapshot_name(url)
+        return path.read_text(encoding="utf-8") if path.exists() else None
+
+    def _fetch(self, url: str) -> str:
+        response = requests.get(export_url(url), timeout=self.timeout)
+        response.raise_for_status()
+        return response.content.decode("utf-8")
+
+    def _load(self, url: str) -> str:
+        if self.offline:
+            content = self._read_snapshot(url)
+            if content is None:
+                raise FileNotFoundError(
+                    f"No snapshot of {url} in {self.snapshot_dir} "
+                    f"({snapshot_name(url)})"
+                )
+            return content
+
+        content = self._read_cache(url, max_age=self.ttl)
+        if content is not None:
+            return content
+        try:
+            content = self._fetch(url)
+        except requests.RequestException as error:
+            content = self._read_cache(url, max_age=None) or self._read_snapshot(url)
+            if content is None:
+                raise
+            log(f"Could not fetch {url} ({error}), using a stale copy")
+            return content
+        self._write_cache(url, content)
+        return content
+
+    def get(self, url: str) -> Architecture:
+        """
+        Returns the architecture table of `url`, fetching it only when the cached copy
+        is older than `ttl`.
+        """
+        with self._lock:
+            cached = self._architectures.get(url)
+            if cached is not None and time.time() - cached[0] <= self.ttl:
+                return cached[1]
+            architecture = Architecture(url, self._load(url))
+            self._architectures[url] = (time.time(), architecture)
+            return architecture
+
+    def save_snapshot(self, url: str) -> Path:
+        """
+        Writes the current architecture table of `url` to the snapshot folder, to be
+        committed.
+        """
+        path = self.snapshot_dir / snapshot_name(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(self.get(url).content, encoding="utf-8")
+        return path
+
+
+_registry: Optional[ArchitectureRegistry] = None
+
+
+def get_architecture(url: str) -> Architecture:
+    """
+    Returns the architecture table of `url` from the process wide registry.
+    """
+    global _registry  # pylint: disable=global-statement
+    if _registry is None:
+        _registry = ArchitectureRegistry()
+    return _registry.get(url)
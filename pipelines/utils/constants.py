@@ -15,3 +15,11 @@ class constants(Enum):  # pylint: disable=c0103
     FLOW_DUMP_TO_GCS_NAME = "BD template: Ingerir tabela zipada para GCS"
 
     GOOGLE_SHEETS_URL = "https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq?tqx=out:csv&sheet={sheet_name}"
+
+    DOWNLOAD_CACHE_DIR = "/tmp/data/.download_cache"
+    DOWNLOAD_CACHE_MAX_SIZE = 30 * 1024**3  # bytes
+
+    ARCHITECTURE_CACHE_DIR = "/tmp/data/.architecture_cache"
+    ARCHITECTURE_CACHE_TTL = 6 * 60 * 60  # seconds
+
+    REFERENCE_CACHE_DIR = "/tmp/data/.reference_cache"
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Async HTTP client shared by the scraping flows.
+
+A single `aiohttp` session pools the connections of a crawl. Requests to a host are
+limited both in concurrency (`max_per_host`) and in rate (a token bucket of
+`requests_per_second`), and failed requests (connection errors, timeouts, 429 and 5xx
+responses) are retried with exponential backoff, honoring `Retry-After`. Pages are
+handed to a pluggable parser (e.g. `html_parser`) outside of the event loop.
+
+Usage:
+    async with AsyncCrawler(max_per_host=4, requests_per_second=2) as crawler:
+        soups = await crawler.fetch_all(urls, parser=html_parser)
+"""
+import asyncio
+import random
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+from pipelines.utils.utils import log
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+Parser = Callable[[str], Any]
+
+
+def html_parser(text: str) -> BeautifulSoup:
+    """
+    Parses an HTML page with BeautifulSoup.
+    """
+    return BeautifulSoup(text, "html.parser")
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second on average, with bursts of up to `capacity`.
+    Must be created inside the event loop that uses it.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """
+        Waits until a token is available and takes it.
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AsyncCrawler:
+    """
+    Pooled async HTTP client with per-host limits, rate limiting and retries.
+
+    Args:
+        max_connections (int): connections open at the same time, over all hosts.
+        max_per_host (int): requests in flight to the same host.
+        requests_per_second (float): Optional. Average requests per second to the same
+            host. Unlimited if None.
+        attempts (int): attempts of each request.
+        backoff (float): seconds before the first retry, doubled at every retry.
+        max_backoff (float): maximum seconds between two attempts.
+        timeout (float): seconds before a request is abandoned.
+        headers (dict): Optional. Headers sent with every request.
+        parser (callable): Optional. Default parser of the pages, from their text.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_per_host: int = 4,
+        requests_per_second: Optional[float] = None,
+        attempts: int = 5,
+        backoff: float = 1,
+        max_backoff: float = 60,
+        timeout: float = 100,
+        headers: Dict[str, str] = None,
+        parser: Parser = None,
+    ):
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.requests_per_second = requests_per_second
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.headers = headers
+        self.parser = parser
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    async def __aenter__(self) -> "AsyncCrawler":
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.max_connections, limit_per_host=self.max_per_host
+            ),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers=self.headers,
+        )
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._session.close()
+        self._session = None
+
+    async def _throttle(self, url: str) -> None:
+        if self.requests_per_second is None:
+            return
+        host = urlsplit(url).netloc
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.requests_per_second)
+        await self._buckets[host].acquire()
+
+    def _delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after is not None and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        delay = min(self.backoff * 2**attempt, self.max_backoff)
+        # jitter, so that concurrent requests do not retry in lockstep
+        return delay * random.uniform(0.5, 1)
+
+    async def fetch(
+        self, url: str, parser: Parser = None, **request_kwargs
+    ) -> Optional[Any]:
+        """
+        Downloads a page and returns it parsed (or its text, without a parser). Returns
+        None when all attempts fail or the server answers with a client error.
+        """
+        if self._session is None:
+            raise RuntimeError(
+                "AsyncCrawler must be used as `async with AsyncCrawler()`"
+            )
+        parser = parser or self.parser
+        for attempt in range(self.attempts):
+            await self._throttle(url)
+            retry_after = None
+            try:
+                async with self._session.get(url, **request_kwargs) as response:
+                    if response.status in RETRY_STATUSES:
+                        retry_after = response.headers.get("Retry-After")
+                        error = f"HTTP {response.status}"
+                    elif response.status >= 400:
+                        log(f"{url} answered HTTP {response.status}, not retrying")
+                        return None
+                    else:
+                        text = await response.text(errors="replace")
+                        if parser is None:
+                            return text
+                        return await asyncio.to_thread(parser, text)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exception:
+                error = repr(exception)
+            if attempt < self.attempts - 1:
+                delay = self._delay(attempt, retry_after)
+                log(
+                    f"Attempt {attempt + 1} of {self.attempts} for {url} failed "
+                    f"({error}), retrying in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+        log(f"Giving up {url} after {self.attempts} attempts ({error})")
+        return None
+
+    async def fetch_all(
+        self, urls: Iterable[str], parser: Parser = None, **request_kwargs
+    ) -> List[Optional[Any]]:
+        """
+        Fetches pages concurrently, within the limits of the crawler, in the order of
+        `urls`.
+        """
+        return await asyncio.gather(
+            *[self.fetch(url, parser, **request_kwargs) for url in urls]
+        )
@@ -9,18 +9,15 @@ import glob
 import os
 import ssl
 from datetime import datetime as dt
-from time import sleep
+from datetime import timedelta
 
 import basedosdados as bd
 import pandas as pd
 import wget
 from prefect import task
-from tqdm import tqdm
 
-from pipelines.utils.crawler_ibge_inflacao.utils import (
-    extract_last_date,
-    get_legacy_session,
-)
+from pipelines.constants import constants
+from pipelines.utils.crawler_ibge_inflacao.utils import SidraClient, extract_last_date
 from pipelines.utils.utils import log
 
 # necessary for use wget, see: https://stackoverflow.com/questions/35569042/ssl-certificate-verify-failed-with-python3
@@ -80,26 +77,10 @@ def check_for_updates(
     success_dwnl = []
 
     os.system('mkdir -p "/tmp/check_for_updates/"')
-    #
-    for key in tqdm(links_keys):
-        try:
-            response = get_legacy_session().get(links[key])
-            # download the csv
-            with open(f"/tmp/check_for_updates/{key}.csv", "wb") as f:
-                f.write(response.content)
+    client = SidraClient()
+    for key in links_keys:
+        if client.download(links[key], f"/tmp/check_for_updates/{key}.csv"):
             success_dwnl.append(key)
-            sleep(5)
-        except Exception as e:
-            log(e)
-            try:
-                sleep(5)
-                response = get_legacy_session().get(links[key])
-                # download the csv
-                with open(f"/tmp/check_for_updates/{key}.csv", "wb") as f:
-                    f.write(response.content)
-                success_dwnl.append(key)
-            except Exception as e:  # pylint: disable=redefined-outer-name
-                log(e)
 
     log(f"success_dwnl: {success_dwnl}")
     if len(links_keys) == len(success_dwnl):
@@ -145,7 +126,10 @@ def check_for_updates(
         return False, str(max_date_ibge)
 
 
-@task
+@task(
+    max_retries=constants.TASK_MAX_RETRIES.value,
+    retry_delay=timedelta(seconds=constants.TASK_RETRY_DELAY.value),
+)
 def crawler(indice: str, folder: str) -> bool:
     """
     Crawler for IBGE Inflacao
@@ -164,7 +148,6 @@ def crawler(indice: str, folder: str) -> bool:
         )
 
     log(f"Crawling {indice}")
-    os.system("[ -e /tmp/data/input/ ] && rm -r /tmp/data/input/")
     os.system("[ -e /tmp/data/output/ ] && rm -r /tmp/data/output/")
     os.system('mkdir -p "/tmp/data"')
     os.system('mkdir -p "/tmp/data/input"')
@@ -261,48 +244,17 @@ def crawler(indice: str, folder: str) -> bool:
     }
     links_keys = list(links.keys())
     log(links_keys)
-    success_dwnl = []
-    if folder != "rm":
-        # precisei adicionar try catchs no loop para conseguir baixar todas
-        # as tabelas sem ter pproblema com o limite de requisição do sidra
-        for key in tqdm(links_keys):
-            try:
-                response = get_legacy_session().get(links[key])
-                # download the csv
-                with open(f"/tmp/data/input/{key}.csv", "wb") as f:
-                    f.write(response.content)
-                success_dwnl.append(key)
-                sleep(10)
-            except Exception:
-                try:
-                    sleep(10)
-                    response = get_legacy_session().get(links[key])
-                    # download the csv
-                    with open(f"/tmp/data/input/{key}.csv", "wb") as f:
-                        f.write(response.content)
-                    success_dwnl.append(key)
-                except Exception:
-                    pass
-    else:
-        for key in tqdm(links_keys):
-            try:
-                response = get_legacy_session().get(links[key])
-                # download the csv
-                with open(f"/tmp/data/input/{key}.csv", "wb") as f:
-                    f.write(response.content)
-                success_dwnl.append(key)
-                sleep(10)
-            except Exception as e:
-                log(e)
-                try:
-                    sleep(10)
-                    response = get_legacy_session().get(links[key])
-                    # download the csv
-                    with open(f"/tmp/data/input/{key}.csv", "wb") as f:
-                        f.write(response.content)
-                    success_dwnl.append(key)
-                except Exception as e:  # pylint: disable=redefined-outer-name
-                    log(e)
+    tabelas = {f"/tmp/data/input/{key}.csv": links[key] for key in links_keys}
+    # as tasks de limpeza leem todos os arquivos da pasta, então só as tabelas desta
+    # coleta são mantidas; as baixadas por uma tentativa anterior da task não são
+    # baixadas de novo
+    for arquivo in glob.glob(f"/tmp/data/input/{folder}/*"):
+        if arquivo not in tabelas:
+            os.remove(arquivo)
+    downloaded = SidraClient().download_all(tabelas)
+    success_dwnl = [
+        key for key in links_keys if f"/tmp/data/input/{key}.csv" in downloaded
+    ]
 
     log(os.system("tree /tmp/data"))
     log(f"success_dwnl: {success_dwnl}")
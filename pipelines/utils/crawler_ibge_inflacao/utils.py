@@ -3,8 +3,13 @@
 Schedules for ibge inflacao
 """
 # pylint: disable=arguments-differ
+import os
 import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
 import basedosdados as bd
 import requests
@@ -55,15 +60,164 @@ class CustomHttpAdapter(requests.adapters.HTTPAdapter):
         )
 
 
-def get_legacy_session():
+def get_legacy_session(pool_maxsize: int = 10):
     """Get the session with the ssl context"""
     ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
     ctx.options |= 0x4  # OP_LEGACY_SERVER_CONNECT
     session = requests.session()
-    session.mount("https://", CustomHttpAdapter(ctx))
+    session.mount("https://", CustomHttpAdapter(ctx, pool_maxsize=pool_maxsize))
     return session
 
 
+def retry_after(exception: Exception) -> Optional[int]:
+    """Seconds to wait asked by the `Retry-After` header of a failed response"""
+    response = getattr(exception, "response", None)
+    value = "" if response is None else response.headers.get("Retry-After", "")
+    return int(value) if value.isdigit() else None
+
+
+def is_table(content: bytes) -> bool:
+    """
+    Whether `content` looks like a csv exported by SIDRA: `;` separated and not an
+    html (error) page.
+    """
+    return b";" in content and not content.lstrip().startswith(b"<")
+
+
+class AdaptiveRateLimiter:
+    """
+    Spaces out requests shared by several threads. Requests are not delayed while they
+    succeed; every failure doubles the interval between requests (starting from
+    `backoff` seconds, up to `max_interval`) and every success halves it back.
+    """
+
+    def __init__(self, backoff: float = 5, max_interval: float = 60):
+        self.backoff = backoff
+        self.max_interval = max_interval
+        self.interval = 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        """
+        Blocks until the next request may be sent.
+        """
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        time.sleep(slot - now)
+
+    def success(self) -> None:
+        """
+        Shrinks the interval after a successful request.
+        """
+        with self._lock:
+            self.interval = self.interval / 2 if self.interval > self.backoff else 0.0
+
+    def failure(self, wait: float = None) -> None:
+        """
+        Grows the interval after a failed request, to at least `wait` seconds
+        when the server asked for it.
+        """
+        with self._lock:
+            self.interval = min(
+                max(self.interval * 2, self.backoff, wait or 0),
+                self.max_interval,
+            )
+            self._next = max(self._next, time.monotonic() + self.interval)
+
+
+class SidraClient:
+    """
+    Downloads SIDRA tables over a single legacy-SSL session, `max_workers` at a time,
+    paced by an `AdaptiveRateLimiter`. Tables are written atomically and tables
+    downloaded less than `max_age` seconds ago are not downloaded again, so a retried
+    task resumes where the previous attempt stopped.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 3,
+        attempts: int = 5,
+        timeout: float = 300,
+        max_age: float = 24 * 60 * 60,
+        limiter: AdaptiveRateLimiter = None,
+    ):
+        self.max_workers = max_workers
+        self.attempts = attempts
+        self.timeout = timeout
+        self.max_age = max_age
+        self.limiter = limiter or AdaptiveRateLimiter()
+        self.session = get_legacy_session(pool_maxsize=max_workers)
+
+    def is_fresh(self, path: str) -> bool:
+        """
+        Whether `path` is a table downloaded less than `max_age` seconds ago.
+        """
+        if not os.path.isfile(path):
+            return False
+        if time.time() - os.path.getmtime(path) >= self.max_age:
+            return False
+        with open(path, "rb") as f:
+            return is_table(f.read(64 * 1024))
+
+    def download(self, url: str, path: str) -> bool:
+        """
+        Downloads `url` to `path`, retrying failed requests. Returns whether it
+        succeeded.
+        """
+        downloaded, errors = self._download(url, path)
+        for error in errors:
+            log(error)
+        return downloaded
+
+    def download_all(self, tables: Dict[str, str]) -> List[str]:
+        """
+        Downloads `{path: url}` tables, skipping the fresh ones. Returns the paths
+        that are available, downloaded now or before.
+        """
+        pending = {path: url for path, url in tables.items() if not self.is_fresh(path)}
+        log(f"{len(tables) - len(pending)} of {len(tables)} tables already downloaded")
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            outcomes = executor.map(self._download, pending.values(), pending)
+            # the prefect logger only exists in the thread of the task
+            for path, (downloaded, errors) in zip(pending, outcomes):
+                for error in errors:
+                    log(error)
+                results[path] = downloaded
+        return [path for path in tables if path not in pending or results[path]]
+
+    def _download(self, url: str, path: str) -> Tuple[bool, List[str]]:
+        """
+        Downloads `url` to `path` without logging, as it runs in worker threads.
+        Returns whether it succeeded and the errors of the failed attempts.
+        """
+        errors = []
+        for attempt in range(1, self.attempts + 1):
+            self.limiter.wait()
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                response.raise_for_status()
+                if not is_table(response.content):
+                    raise ValueError("the response is not a csv table")
+            except (requests.RequestException, ValueError) as e:
+                self.limiter.failure(retry_after(e))
+                errors.append(
+                    f"Attempt {attempt} of {self.attempts} for {path} failed: {e}. "
+                    f"Interval between requests: {self.limiter.interval:.0f}s"
+                )
+                continue
+            self.limiter.success()
+            # a partial file must not pass for a downloaded table
+            with open(f"{path}.part", "wb") as f:
+                f.write(response.content)
+            os.replace(f"{path}.part", path)
+            return True, errors
+        return False, errors
+
+
 def extract_last_date(
     dataset_id: str,
     table_id: str,
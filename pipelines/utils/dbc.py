@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming reader for the DBC/DBF files published by DATASUS.
+
+DBC files are DBF tables compressed with PKWare's blast. They are decompressed with
+`pyreaddbc` and the DBF records are decoded with numpy, a batch of fixed width
+records at a time, straight into Arrow record batches.
+"""
+import os
+import struct
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyreaddbc import dbc2dbf
+
+
+def _read_dbf_fields(file) -> Tuple[List[Dict], int, int, int]:
+    """
+    Parses the DBF header. Returns the field descriptors, the number of records, the
+    header length and the record length.
+    """
+    header = file.read(32)
+    n_records, header_length, record_length = struct.unpack("<IHH", header[4:12])
+    fields = []
+    while True:
+        descriptor = file.read(32)
+        if not descriptor or descriptor[0] == 0x0D:
+            break
+        fields.append(
+            {
+                "name": descriptor[:11].split(b"\x00")[0].decode("ascii").strip(),
+                "type": chr(descriptor[11]),
+                "length": descriptor[16],
+                "decimals": descriptor[17],
+            }
+        )
+    return fields, n_records, header_length, record_length
+
+
+def _decode_column(values: np.ndarray, field: Dict, encoding: str) -> pa.Array:
+    """
+    Decodes the raw bytes of a DBF field into strings, as written by R's `read.dbc`:
+    blanks become nulls, numbers lose padding zeros and dates become `YYYY-MM-DD`.
+    """
+    if len(values) == 0:
+        return pa.array([], type=pa.string())
+    text = pd.Series(np.char.rstrip(np.char.decode(values, encoding)), dtype=object)
+    text = text.where(text != "")
+    if field["type"] in ("N", "F"):
+        numbers = pd.to_numeric(text.str.strip(), errors="coerce")
+        if field["decimals"] == 0 and numbers.dropna().mod(1).eq(0).all():
+            numbers = numbers.astype("Int64")
+        # like R, integral values are written without decimals (10.00 -> 10)
+        text = (
+            numbers.astype(str)
+            .str.replace(r"\.0$", "", regex=True)
+            .where(numbers.notna())
+        )
+    elif field["type"] == "D":
+        dates = pd.to_datetime(text, format="%Y%m%d", errors="coerce")
+        text = pd.Series(
+            dates.to_numpy().astype("datetime64[D]").astype(str), dtype=object
+        ).where(dates.notna())
+    elif field["type"] == "L":
+        text = text.str.upper().map(
+            {"T": "TRUE", "Y": "TRUE", "F": "FALSE", "N": "FALSE"}
+        )
+    return pa.array(text.to_numpy(dtype=object, na_value=None), type=pa.string())
+
+
+def read_dbf_batches(
+    path: Union[str, Path],
+    columns: Optional[List[str]] = None,
+    batch_size: int = 500_000,
+    encoding: str = "iso-8859-1",
+    optional_columns: Optional[List[str]] = None,
+) -> Iterator[pa.RecordBatch]:
+    """
+    Yields the records of a DBF file as Arrow record batches of string columns.
+
+    Args:
+        path (str, pathlib.Path): DBF file.
+        columns (list): Optional. Columns to decode, in this order. Other columns are
+            skipped without being decoded.
+        batch_size (int): number of records per batch.
+        encoding (str): encoding of the character fields.
+        optional_columns (list): Optional. Columns decoded after `columns` when the
+            file has them, e.g. columns renamed across the years.
+
+    Raises:
+        KeyError: if the file misses any of `columns`.
+    """
+    with open(path, "rb") as file:
+        fields, n_records, header_length, record_length = _read_dbf_fields(file)
+        dtype = np.dtype(
+            [("_deleted", "S1")]
+            + [(field["name"], f"S{field['length']}") for field in fields]
+        )
+        if dtype.itemsize != record_length:
+            raise ValueError(
+                f"Invalid DBF {path}: record length {record_length} does not match "
+                f"its fields ({dtype.itemsize})"
+            )
+        fields_by_name = {field["name"]: field for field in fields}
+        if columns is None:
+            columns = list(fields_by_name)
+        missing = [column for column in columns if column not in fields_by_name]
+        if missing:
+            raise KeyError(f"Columns {missing} not found in {path}")
+        columns = list(columns) + [
+            column
+            for column in optional_columns or []
+            if column in fields_by_name and column not in columns
+        ]
+
+        def to_batch(records: np.ndarray) -> pa.RecordBatch:
+            records = records[records["_deleted"] != b"*"]
+            return pa.RecordBatch.from_arrays(
+                [
+                    _decode_column(records[column], fields_by_name[column], encoding)
+                    for column in columns
+                ],
+                names=columns,
+            )
+
+        file.seek(header_length)
+        remaining = n_records
+        while remaining > 0:
+            buffer = file.read(min(batch_size, remaining) * record_length)
+            count = len(buffer) // record_length
+            if count == 0:
+                break
+            remaining -= count
+            yield to_batch(np.frombuffer(buffer, dtype=dtype, count=count))
+
+        if remaining == n_records:
+            # empty files still yield their (empty) columns
+            yield to_batch(np.empty(0, dtype=dtype))
+
+
+def read_dbc_batches(
+    path: Union[str, Path],
+    columns: Optional[List[str]] = None,
+    batch_size: int = 500_000,
+    encoding: str = "iso-8859-1",
+    optional_columns: Optional[List[str]] = None,
+) -> Iterator[pa.RecordBatch]:
+    """
+    Yields the records of a DBC (or DBF) file as Arrow record batches of string
+    columns. DBC files are decompressed to a temporary DBF, removed afterwards.
+    See `read_dbf_batches` for the arguments.
+    """
+    path = Path(path)
+    if path.suffix.lower() == ".dbf":
+        yield from read_dbf_batches(
+            path, columns, batch_size, encoding, optional_columns
+        )
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dbf_path = os.path.join(tmp_dir, path.with_suffix(".dbf").name)
+        dbc2dbf(str(path), dbf_path)
+        yield from read_dbf_batches(
+            dbf_path, columns, batch_size, encoding, optional_columns
+        )
+
+
+def _iter_tables(
+    path: Union[str, Path],
+    columns: Optional[List[str]],
+    transform: Optional[Callable[[pd.DataFrame], pd.DataFrame]],
+    batch_size: int,
+    optional_columns: Optional[List[str]],
+) -> Iterator[pa.Table]:
+    """
+    Yields the batches of a DBC (or DBF) file as tables of string columns, after
+    `transform`.
+    """
+    for batch in read_dbc_batches(
+        path, columns, batch_size, optional_columns=optional_columns
+    ):
+        if transform is None:
+            yield pa.Table.from_batches([batch])
+        else:
+            dataframe = transform(batch.to_pandas())
+            yield pa.Table.from_pandas(
+                dataframe,
+                schema=pa.schema([(column, pa.string()) for column in dataframe]),
+                preserve_index=False,
+            )
+
+
+def dbc_to_parquet(
+    path: Union[str, Path],
+    destination: Union[str, Path],
+    columns: Optional[List[str]] = None,
+    transform: Callable[[pd.DataFrame], pd.DataFrame] = None,
+    batch_size: int = 500_000,
+    compression: str = "snappy",
+    optional_columns: Optional[List[str]] = None,
+) -> str:
+    """
+    Converts a DBC (or DBF) file to a single parquet file of string columns, one batch
+    at a time.
+
+    Args:
+        path (str, pathlib.Path): DBC or DBF file.
+        destination (str, pathlib.Path): parquet file to be written.
+        columns (list): Optional. Columns to read, see `read_dbf_batches`.
+        transform (callable): Optional. Function applied to every batch, converted to a
+            pandas DataFrame. It must return the same columns for every batch.
+        batch_size (int): number of records per batch.
+        compression (str): parquet codec.
+        optional_columns (list): Optional. Columns read when present, see
+            `read_dbf_batches`.
+
+    Returns:
+        str: `destination`.
+    """
+    Path(destination).parent.mkdir(parents=True, exist_ok=True)
+    writer = None
+    try:
+        for table in _iter_tables(
+            path, columns, transform, batch_size, optional_columns
+        ):
+            if writer is None:
+                writer = pq.ParquetWriter(
+                    str(destination), table.schema, compression=compression
+                )
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    return str(destination)
+
+
+def dbc_to_csv(
+    path: Union[str, Path],
+    destination: Union[str, Path],
+    columns: Optional[List[str]] = None,
+    transform: Callable[[pd.DataFrame], pd.DataFrame] = None,
+    batch_size: int = 500_000,
+    optional_columns: Optional[List[str]] = None,
+) -> str:
+    """
+    Converts a DBC (or DBF) file to a single utf-8 csv file, one batch at a time, with
+    blanks as empty fields. See `dbc_to_parquet` for the arguments.
+
+    Returns:
+        str: `destination`.
+    """
+    Path(destination).parent.mkdir(parents=True, exist_ok=True)
+    with open(destination, "w", encoding="utf-8", newline="") as file:
+        for i, table in enumerate(
+            _iter_tables(path, columns, transform, batch_size, optional_columns)
+        ):
+            table.to_pandas().to_csv(
+                file, sep=",", na_rep="", index=False, header=i == 0
+            )
+    return str(destination)
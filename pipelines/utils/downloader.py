@@ -0,0 +1,569 @@
+# -*- coding: utf-8 -*-
+"""
+Downloads shared by the dataset flows.
+
+Flows that keep their files can opt in to a content-addressed cache on disk, so task
+retries and flows that fetch the same archive reuse the local copy after
+revalidating it with the server (ETag, Last-Modified and Content-Length).
+
+Large files from servers that accept HTTP Range requests are fetched in concurrent
+segments, and interrupted downloads are resumed from what was already written.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ftplib import FTP, error_perm
+from pathlib import Path
+from typing import Callable, Dict, Optional, Union
+from urllib.parse import urlparse
+
+import requests
+
+from pipelines.utils.constants import constants
+from pipelines.utils.utils import human_readable, log
+
+
+class _HashingWriter:
+    """
+    File wrapper that computes the sha256 and size of everything written to it.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        """
+        Writes `data` to the file, updating the hash.
+        """
+        self.file.write(data)
+        self.sha256.update(data)
+        self.size += len(data)
+
+
+class DownloadCache:
+    """
+    On-disk cache of downloaded files.
+
+    Contents are stored once, named by their sha256 (`objects/<sha256>`), and every URL
+    points to its content through `entries/<sha256 of url>.json`, together with the
+    validators returned by the server. Files are written to a temporary file and then
+    renamed, so an interrupted download never leaves a partial object behind. When the
+    cache grows over `max_size` bytes, the least recently used objects are removed.
+    """
+
+    def __init__(
+        self, cache_dir: Union[str, Path] = None, max_size: Optional[int] = None
+    ):
+        self.cache_dir = Path(cache_dir or constants.DOWNLOAD_CACHE_DIR.value)
+        self.max_size = (
+            max_size
+            if max_size is not None
+            else constants.DOWNLOAD_CACHE_MAX_SIZE.value
+        )
+        self.objects_dir = self.cache_dir / "objects"
+        self.entries_dir = self.cache_dir / "entries"
+        self.tmp_dir = self.cache_dir / "tmp"
+        for folder in (self.objects_dir, self.entries_dir, self.tmp_dir):
+            folder.mkdir(parents=True, exist_ok=True)
+
+    def _entry_path(self, url: str) -> Path:
+        return self.entries_dir / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+
+    def partial_path(self, url: str) -> Path:
+        """
+        Returns where an in-progress download of `url` is kept between retries.
+        """
+        return self.tmp_dir / f"{hashlib.sha256(url.encode()).hexdigest()}.part"
+
+    def get(self, url: str) -> Optional[Dict]:
+        """
+        Returns the cache entry of `url`, or None if it is missing or was evicted.
+        """
+        entry_path = self._entry_path(url)
+        if not entry_path.exists():
+            return None
+        with open(entry_path, encoding="utf-8") as file:
+            entry = json.load(file)
+        if not self.object_path(entry).exists():
+            return None
+        return entry
+
+    def object_path(self, entry: Dict) -> Path:
+        """
+        Returns the path of the content of a cache entry, marking it as recently used.
+        """
+        path = self.objects_dir / entry["sha256"]
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return path
+
+    def store(
+        self, url: str, validators: Dict, fill: Callable[[_HashingWriter], None]
+    ) -> Path:
+        """
+        Calls `fill` with a writer for the new content of `url` and stores it
+        atomically. Returns the path of the cached object.
+        """
+        file = tempfile.NamedTemporaryFile(  # pylint: disable=consider-using-with
+            dir=self.tmp_dir, delete=False
+        )
+        try:
+            with file:
+                writer = _HashingWriter(file)
+                fill(writer)
+        except BaseException:
+            os.remove(file.name)
+            raise
+
+        return self._commit(url, validators, file.name, writer.sha256.hexdigest())
+
+    def store_file(self, url: str, validators: Dict, path: Union[str, Path]) -> Path:
+        """
+        Moves an already downloaded file into the cache as the content of `url`.
+        Returns the path of the cached object.
+        """
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(8 * 1024 * 1024), b""):
+                sha256.update(chunk)
+        return self._commit(url, validators, path, sha256.hexdigest())
+
+    def _commit(
+        self, url: str, validators: Dict, path: Union[str, Path], sha256: str
+    ) -> Path:
+        object_path = self.objects_dir / sha256
+        os.replace(path, object_path)
+
+        entry = {
+            "url": url,
+            "sha256": sha256,
+            "size": object_path.stat().st_size,
+            **validators,
+        }
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.tmp_dir, delete=False, encoding="utf-8"
+        ) as file:
+            json.dump(entry, file)
+        os.replace(file.name, self._entry_path(url))
+
+        self.evict(keep=object_path)
+        return object_path
+
+    def evict(self, keep: Optional[Path] = None) -> None:
+        """
+        Removes the least recently used objects until the cache fits in `max_size`.
+        """
+        objects = []
+        for path in self.objects_dir.iterdir():
+            # concurrent downloads may evict the same objects
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            objects.append((stat.st_mtime, stat.st_size, path))
+        objects.sort()
+        total_size = sum(size for _, size, _ in objects)
+        for _, size, path in objects:
+            if total_size <= self.max_size:
+                break
+            if path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            total_size -= size
+            log(f"Evicted {path.name} from the download cache")
+
+
+def _same_validators(cached: Dict, current: Dict) -> bool:
+    """
+    Tells if the validators sent by the server still match the cached ones. At least
+    an ETag or a Last-Modified is required; Content-Length alone is not trusted.
+    """
+    strong = [key for key in ("etag", "last_modified") if current.get(key)]
+    if not strong:
+        return False
+    keys = strong + (["content_length"] if current.get("content_length") else [])
+    return all(cached.get(key) == current[key] for key in keys)
+
+
+def _http_validators(response: requests.Response) -> Dict:
+    return {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "content_length": response.headers.get("Content-Length"),
+    }
+
+
+def _if_range(validators: Dict) -> Optional[str]:
+    """
+    Returns the validator sent as `If-Range`, so a range request returns the whole
+    (new) file instead of a segment when the file changed on the server. Weak ETags
+    are not allowed in `If-Range`.
+    """
+    etag = validators.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return validators.get("last_modified")
+
+
+def _load_partial(part_path: Path, validators: Dict, mode: str) -> Dict:
+    """
+    Returns the progress of a previous attempt to download the same file, discarding
+    it when the file changed on the server or cannot be safely resumed.
+    """
+    state_path = part_path.with_suffix(".json")
+    state = {"validators": validators, "mode": mode, "segments": []}
+    if state_path.exists():
+        with open(state_path, encoding="utf-8") as file:
+            previous = json.load(file)
+        if (
+            previous["validators"] == validators
+            and previous["mode"] == mode
+            and _if_range(validators)
+        ):
+            return previous
+    if part_path.exists():
+        part_path.unlink()
+    _save_partial(part_path, state)
+    return state
+
+
+def _save_partial(part_path: Path, state: Dict) -> None:
+    with tempfile.NamedTemporaryFile(
+        "w", dir=part_path.parent, delete=False, encoding="utf-8"
+    ) as file:
+        json.dump(state, file)
+    os.replace(file.name, part_path.with_suffix(".json"))
+
+
+def _download_segments(
+    url: str,
+    part_path: Path,
+    size: int,
+    validators: Dict,
+    headers: Dict,
+    timeout: int,
+    chunk_size: int,
+    max_workers: int,
+    segment_size: int,
+) -> None:
+    """
+    Downloads `url` with concurrent range requests, each one writing its segment in
+    place. Finished segments are recorded, so a retry only fetches the missing ones.
+    """
+    state = _load_partial(part_path, validators, mode="segments")
+    if state["segments"] and (
+        not part_path.exists() or part_path.stat().st_size < size
+    ):
+        # the recorded segments were written to a file that is gone or truncated
+        log(f"Partial download of {url} was lost, starting over")
+        state["segments"] = []
+        _save_partial(part_path, state)
+        part_path.unlink(missing_ok=True)
+    if not part_path.exists():
+        with open(part_path, "wb") as file:
+            file.truncate(size)
+
+    done = set(state["segments"])
+    segments = [
+        (start, min(start + segment_size, size) - 1)
+        for start in range(0, size, segment_size)
+        if start not in done
+    ]
+    if done:
+        log(f"Resuming {url}: {len(segments)} of {len(done) + len(segments)} segments")
+
+    if_range = _if_range(validators)
+    lock = threading.Lock()
+
+    def fetch(segment):
+        start, end = segment
+        segment_headers = {**headers, "Range": f"bytes={start}-{end}"}
+        if if_range:
+            segment_headers["If-Range"] = if_range
+        with requests.get(
+            url, headers=segment_headers, stream=True, timeout=timeout
+        ) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise RuntimeError(f"{url} changed on the server during the download")
+            written = 0
+            with open(part_path, "r+b") as file:
+                file.seek(start)
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    file.write(chunk)
+                    written += len(chunk)
+        if written != end - start + 1:
+            raise RuntimeError(f"Incomplete segment {start}-{end} of {url}")
+        with lock:
+            state["segments"].append(start)
+            _save_partial(part_path, state)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for future in [executor.submit(fetch, segment) for segment in segments]:
+            future.result()
+
+
+def _download_stream(
+    url: str,
+    response: requests.Response,
+    part_path: Path,
+    validators: Dict,
+    accepts_ranges: bool,
+    headers: Dict,
+    timeout: int,
+    chunk_size: int,
+) -> None:
+    """
+    Downloads `url` as a single stream. A partial file left by a previous attempt is
+    continued with a range request when the server supports it.
+    """
+    _load_partial(part_path, validators, mode="stream")
+    offset = part_path.stat().st_size if part_path.exists() else 0
+
+    if offset and accepts_ranges:
+        log(f"Resuming {url} from byte {offset}")
+        response.close()
+        response = requests.get(
+            url,
+            headers={
+                **headers,
+                "Range": f"bytes={offset}-",
+                "If-Range": _if_range(validators),
+            },
+            stream=True,
+            timeout=timeout,
+        )
+        if response.status_code == 416:
+            response.close()
+            return
+        response.raise_for_status()
+
+    with response, open(
+        part_path, "ab" if response.status_code == 206 else "wb"
+    ) as file:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            file.write(chunk)
+
+
+def _download_http(
+    url: str,
+    save_path: Path,
+    cache: Optional[DownloadCache],
+    headers: Optional[Dict],
+    timeout: int,
+    chunk_size: int,
+    max_workers: int,
+    segment_size: int,
+) -> Path:
+    """
+    Downloads `url` to the cache, or straight to `save_path` without a cache.
+    Returns the path of the downloaded file.
+    """
+    headers = dict(headers or {})
+    entry = cache.get(url) if cache is not None else None
+    request_headers = dict(headers)
+    if entry is not None:
+        if entry.get("etag"):
+            request_headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            request_headers["If-Modified-Since"] = entry["last_modified"]
+
+    with requests.get(
+        url, headers=request_headers, stream=True, timeout=timeout
+    ) as response:
+        if entry is not None and response.status_code == 304:
+            log(f"Using cached {url} (not modified)")
+            return cache.object_path(entry)
+        response.raise_for_status()
+
+        validators = _http_validators(response)
+        if entry is not None and _same_validators(entry, validators):
+            log(f"Using cached {url} (same validators)")
+            return cache.object_path(entry)
+
+        size = int(validators["content_length"] or 0)
+        # Content-Length counts the encoded bytes, which are decoded while written
+        encoded = response.headers.get("Content-Encoding", "identity") != "identity"
+        accepts_ranges = response.headers.get("Accept-Ranges") == "bytes" and size > 0
+        part_path = (
+            cache.partial_path(url)
+            if cache is not None
+            else save_path.with_name(f"{save_path.name}.part")
+        )
+        start = time.perf_counter()
+        if accepts_ranges and max_workers > 1 and size > segment_size:
+            response.close()
+            _download_segments(
+                url,
+                part_path,
+                size,
+                validators,
+                headers,
+                timeout,
+                chunk_size,
+                max_workers,
+                segment_size,
+            )
+        else:
+            _download_stream(
+                url,
+                response,
+                part_path,
+                validators,
+                accepts_ranges,
+                headers,
+                timeout,
+                chunk_size,
+            )
+
+    elapsed = time.perf_counter() - start
+    downloaded = part_path.stat().st_size
+    if size and not encoded and downloaded != size:
+        # a truncated transfer must never be cached as the content of `url`
+        part_path.unlink(missing_ok=True)
+        part_path.with_suffix(".json").unlink(missing_ok=True)
+        raise RuntimeError(
+            f"Incomplete download of {url}: {downloaded} of {size} bytes, discarded"
+        )
+    throughput = downloaded / elapsed if elapsed > 0 else 0
+    log(
+        f"Fetched {url} in {elapsed:.1f}s "
+        f"({human_readable(throughput, unit='B/s', unit_divider=1024)})"
+    )
+    if cache is not None:
+        downloaded_path = cache.store_file(url, validators, part_path)
+    else:
+        downloaded_path = save_path
+        os.replace(part_path, save_path)
+    part_path.with_suffix(".json").unlink(missing_ok=True)
+    return downloaded_path
+
+
+def _download_ftp(
+    url: str, save_path: Path, cache: Optional[DownloadCache], timeout: int
+) -> Path:
+    """
+    Downloads `url` to the cache, or straight to `save_path` without a cache.
+    Returns the path of the downloaded file.
+    """
+    parsed = urlparse(url)
+    with FTP(parsed.hostname, timeout=timeout) as ftp:
+        ftp.login(parsed.username or "", parsed.password or "")
+        ftp.voidcmd("TYPE I")
+        try:
+            last_modified = ftp.sendcmd(f"MDTM {parsed.path}").split()[-1]
+        except error_perm:
+            last_modified = None
+        validators = {
+            "etag": None,
+            "last_modified": last_modified,
+            "content_length": str(ftp.size(parsed.path)),
+        }
+
+        entry = cache.get(url) if cache is not None else None
+        if entry is not None and _same_validators(entry, validators):
+            log(f"Using cached {url} (same validators)")
+            return cache.object_path(entry)
+
+        def fill(writer: _HashingWriter) -> None:
+            ftp.retrbinary(f"RETR {parsed.path}", writer.write)
+            expected = validators["content_length"]
+            if expected.isdigit() and writer.size != int(expected):
+                raise RuntimeError(
+                    f"Incomplete download of {url}: {writer.size} of {expected} "
+                    "bytes, discarded"
+                )
+
+        if cache is not None:
+            return cache.store(url, validators, fill)
+        part_path = save_path.with_name(f"{save_path.name}.part")
+        try:
+            with open(part_path, "wb") as file:
+                fill(_HashingWriter(file))
+        except BaseException:
+            part_path.unlink(missing_ok=True)
+            raise
+        os.replace(part_path, save_path)
+        return save_path
+
+
+def _link_or_copy(source: Path, destination: Path) -> None:
+    """
+    Hard links the cached file to `destination`, copying it when linking is not
+    possible (e.g. another filesystem).
+    """
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    if destination.exists():
+        destination.unlink()
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def download_file(
+    url: str,
+    save_path: Union[str, Path],
+    headers: Optional[Dict] = None,
+    timeout: int = 60,
+    chunk_size: int = 1024 * 1024,
+    use_cache: bool = False,
+    cache: DownloadCache = None,
+    max_workers: int = 4,
+    segment_size: int = 64 * 1024 * 1024,
+) -> str:
+    """
+    Downloads `url` (http, https or ftp) to `save_path`, optionally through the
+    download cache. Cached files are revalidated with the server before being reused.
+
+    Args:
+        url (str): file url.
+        save_path (str, pathlib.Path): where the file is saved. With the cache, the
+            file is a hard link to the cached copy, so it must not be modified in
+            place, and removing it does not free disk.
+        headers (dict): Optional. HTTP headers sent with the request.
+        timeout (int): connection timeout in seconds.
+        chunk_size (int): size of the chunks read from the response, in bytes.
+        use_cache (bool): whether to download through the cache. Flows that remove
+            their files after processing them must not use it.
+        cache (DownloadCache): Optional. The cache used with `use_cache`. Defaults to
+            the shared cache at `constants.DOWNLOAD_CACHE_DIR`.
+        max_workers (int): concurrent range requests for files bigger than
+            `segment_size`. Servers without range support get a single stream.
+        segment_size (int): size of each range request, in bytes.
+
+    Returns:
+        str: `save_path`.
+    """
+    cache = (cache or DownloadCache()) if use_cache else None
+    save_path = Path(save_path)
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+    if urlparse(url).scheme == "ftp":
+        downloaded_path = _download_ftp(url, save_path, cache, timeout)
+    else:
+        downloaded_path = _download_http(
+            url,
+            save_path,
+            cache,
+            headers,
+            timeout,
+            chunk_size,
+            max_workers,
+            segment_size,
+        )
+    if cache is not None:
+        _link_or_copy(downloaded_path, save_path)
+    log(
+        f"Downloaded {url} to {save_path} "
+        f"({human_readable(save_path.stat().st_size, unit='B', unit_divider=1024)})"
+    )
+    return str(save_path)
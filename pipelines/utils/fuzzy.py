@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Fuzzy lookup of free-text names (e.g. "Juiz de Fora, Minas Gerais.") in a dictionary of
+known names (e.g. `{"Juiz de Fora, Minas Gerais": 3136702}`).
+
+A query is resolved, in order, by:
+1. the results of previous queries (memoized);
+2. an exact match of the lowercased name;
+3. an exact match of the normalized name (no accents, punctuation or extra spaces);
+4. the nearest name by Levenshtein distance, comparing the query only with the few
+   names that the n-grams they share with it cannot rule out.
+
+Usage:
+    index = FuzzyIndex(constants.MAP_MUNICIPIO_TO_ID.value)
+    df["id_municipio"] = df["localizacao"].map(index.get)
+"""
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import Levenshtein
+import numpy as np
+from unidecode import unidecode
+
+# marks normalized names shared by keys with different values
+_AMBIGUOUS = object()
+
+
+def normalize_name(text: str) -> str:
+    """
+    Lowercases a name and removes its accents, punctuation and extra spaces, e.g.
+    `"São João d'Aliança, Goiás."` -> `"sao joao d alianca goias"`.
+    """
+    return " ".join(re.findall(r"[a-z0-9]+", unidecode(text).lower()))
+
+
+class NGramIndex:
+    """
+    Nearest-neighbour search of strings by Levenshtein distance, pruned with n-grams.
+
+    An edit changes at most `n` of the n-grams of a string, so a key sharing `shared`
+    distinct n-grams with the query is at least `(max(grams) - shared) / n` edits
+    away, and at least as many as their difference in length. These bounds are
+    computed for every key at once with numpy, and the exact distance is only
+    computed for keys whose bound does not exceed the best distance found so far.
+    """
+
+    def __init__(self, keys: List[str], n: int = 2):
+        self.n = n
+        self.keys = list(keys)
+        self._gram_ids: Dict[str, int] = {}
+        postings: List[List[int]] = []
+        n_grams = []
+        for position, key in enumerate(self.keys):
+            grams = self._grams(key)
+            n_grams.append(len(grams))
+            for gram in grams:
+                if gram not in self._gram_ids:
+                    self._gram_ids[gram] = len(postings)
+                    postings.append([])
+                postings[self._gram_ids[gram]].append(position)
+        self._postings = [np.array(positions, dtype=np.int64) for positions in postings]
+        self._n_grams = np.array(n_grams, dtype=np.int64)
+        self._lengths = np.array([len(key) for key in self.keys], dtype=np.int64)
+
+    def _grams(self, text: str) -> set:
+        padded = f" {text} "
+        return {padded[i : i + self.n] for i in range(len(padded) - self.n + 1)}
+
+    def nearest(self, query: str) -> Optional[Tuple[int, int]]:
+        """
+        Returns `(distance, position)` of the key nearest to `query`, or None if there
+        are no keys. Among keys at the same distance, the first one wins.
+        """
+        if not self.keys:
+            return None
+        grams = self._grams(query)
+        known = [
+            self._postings[self._gram_ids[g]] for g in grams if g in self._gram_ids
+        ]
+        shared = np.bincount(
+            np.concatenate(known) if known else np.array([], dtype=np.int64),
+            minlength=len(self.keys),
+        )
+        bounds = np.maximum(
+            -(-(np.maximum(self._n_grams, len(grams)) - shared) // self.n),
+            np.abs(self._lengths - len(query)),
+        )
+        # the key with the lowest bound gives a first distance, and only the keys
+        # whose bound does not exceed it can be nearer (or as near and first)
+        position = int(np.argmin(bounds))
+        best_distance = Levenshtein.distance(query, self.keys[position])
+        best_position = position
+        candidates = np.flatnonzero(bounds <= best_distance)
+        for position, bound in zip(candidates.tolist(), bounds[candidates].tolist()):
+            if bound > best_distance or position == best_position:
+                continue
+            distance = Levenshtein.distance(
+                query, self.keys[position], score_cutoff=best_distance
+            )
+            if (distance, position) < (best_distance, best_position):
+                best_distance, best_position = distance, position
+        return best_distance, best_position
+
+
+class FuzzyIndex:
+    """
+    Resolves free-text names to the values of the nearest known names.
+
+    Args:
+        mapping (dict): known names and their values, e.g. municipality names and
+            their `id_municipio`. When names collide, the first one wins.
+        max_distance (int): Optional. Queries farther than this (in Levenshtein
+            distance of the lowercased names) from every known name resolve to None,
+            unless they match a name once normalized. Unlimited by default.
+        cache_size (int): Optional. Distinct queries memoized. Unlimited if None.
+    """
+
+    def __init__(
+        self,
+        mapping: Dict[str, Any],
+        max_distance: int = None,
+        cache_size: Optional[int] = 2**16,
+    ):
+        self.max_distance = max_distance
+        self._exact: Dict[str, Any] = {}
+        self._normalized: Dict[str, Any] = {}
+        for name, value in mapping.items():
+            lowered = name.lower()
+            if lowered in self._exact:
+                continue
+            self._exact[lowered] = value
+            normalized = normalize_name(name)
+            if normalized in self._normalized and self._normalized[normalized] != value:
+                self._normalized[normalized] = _AMBIGUOUS
+            else:
+                self._normalized[normalized] = value
+        self._ngrams = NGramIndex(list(self._exact))
+        self._resolve_cached = lru_cache(maxsize=cache_size)(self._resolve)
+
+    def __len__(self) -> int:
+        return len(self._exact)
+
+    def _resolve(self, query: str) -> Any:
+        lowered = query.lower()
+        if lowered in self._exact:
+            return self._exact[lowered]
+        value = self._normalized.get(normalize_name(query), _AMBIGUOUS)
+        if value is not _AMBIGUOUS:
+            return value
+        nearest = self._ngrams.nearest(lowered)
+        if nearest is None:
+            return None
+        distance, position = nearest
+        if self.max_distance is not None and distance > self.max_distance:
+            return None
+        return self._exact[self._ngrams.keys[position]]
+
+    def get(self, query: Any) -> Any:
+        """
+        Returns the value of the name nearest to `query`, or None if `query` is not a
+        string (e.g. NaN).
+        """
+        if not isinstance(query, str):
+            return None
+        return self._resolve_cached(query)
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Client for the GraphQL API of the BD+ metadata (Django) backend.
+
+A single client keeps a pooled `requests.Session`, reuses its JWT until it is about to
+expire and memoizes the IDs it finds, so a metadata update logs in once instead of once
+per query.
+"""
+import base64
+import json
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+API_URLS = {
+    "prod": "https://api.basedosdados.org/api/v1/graphql",
+    "staging": "https://staging.api.basedosdados.org/api/v1/graphql",
+}
+
+# tokens without an `exp` claim are renewed after this many seconds
+DEFAULT_TOKEN_TTL = 5 * 60
+# tokens are renewed this many seconds before they expire
+TOKEN_EXPIRY_MARGIN = 60
+
+
+def token_expiration(token: str) -> Optional[float]:
+    """
+    Returns the `exp` claim (unix time) of a JWT, without verifying it, or None.
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def parse_query_parameters(query_parameters: Dict) -> Tuple[List, List, Dict]:
+    """
+    Splits `{"$name: Type": value}` parameters into the variable declarations, the
+    argument names and the variables of a GraphQL query.
+    """
+    declarations = list(query_parameters.keys())
+    keys = [parameter.replace("$", "").split(":")[0] for parameter in declarations]
+    return declarations, keys, dict(zip(keys, query_parameters.values()))
+
+
+def node_fields(cloud_table: bool) -> str:
+    """
+    Returns the fields requested for every node of an ID lookup.
+    """
+    return "id, table{ _id }" if cloud_table else "id,"
+
+
+def first_id(response: Dict, query_class: str) -> Optional[str]:
+    """
+    Returns the ID (without the type prefix) of the first node of `query_class`.
+    """
+    edges = response.get("data", {}).get(query_class, {}).get("edges")
+    if not edges:
+        return None
+    return edges[0]["node"]["id"].split(":")[1]
+
+
+class MetadataClient:
+    """
+    GraphQL client of the metadata API.
+
+    Args:
+        email (str): API user.
+        password (str): API password.
+        api_mode (str): `prod` or `staging`.
+        url (str): Optional. GraphQL endpoint, overriding `api_mode` (e.g. a stub
+            server in tests).
+        timeout (int): request timeout, in seconds.
+    """
+
+    def __init__(
+        self,
+        email: str,
+        password: str,
+        api_mode: str = "prod",
+        url: Optional[str] = None,
+        timeout: int = 60,
+    ):
+        self.email = email
+        self.password = password
+        self.url = url or API_URLS[api_mode]
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+        self._token: Optional[str] = None
+        self._token_expiration = 0.0
+        self._ids: Dict[tuple, Tuple[Dict, str]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def token(self) -> str:
+        """
+        A valid JWT, requested again only when the cached one is about to expire.
+        """
+        with self._lock:
+            if (
+                self._token is None
+                or time.time() > self._token_expiration - TOKEN_EXPIRY_MARGIN
+            ):
+                response = self.session.post(
+                    self.url,
+                    json={
+                        "query": """
+                mutation ($email: String!, $password: String!) {
+                    tokenAuth(email: $email, password: $password) {
+                        token
+                    }
+                }
+            """,
+                        "variables": {"email": self.email, "password": self.password},
+                    },
+                    timeout=self.timeout,
+                )
+                response.raise_for_status()
+                self._token = response.json()["data"]["tokenAuth"]["token"]
+                self._token_expiration = token_expiration(self._token) or (
+                    time.time() + DEFAULT_TOKEN_TTL
+                )
+            return self._token
+
+    def execute(self, query: str, variables: Optional[Dict] = None) -> Dict:
+        """
+        Runs an authenticated query or mutation and returns the decoded response.
+        """
+        token = self.token
+        response = self.session.post(
+            self.url,
+            json={"query": query, "variables": variables or {}},
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=self.timeout,
+        )
+        if response.status_code == 401:
+            # the token was revoked before its expiration; other threads may have
+            # renewed it already
+            with self._lock:
+                if self._token == token:
+                    self._token = None
+            response = self.session.post(
+                self.url,
+                json={"query": query, "variables": variables or {}},
+                headers={"Authorization": f"Bearer {self.token}"},
+                timeout=self.timeout,
+            )
+        return response.json()
+
+    @staticmethod
+    def _cache_key(query_class: str, query_parameters: Dict, cloud_table: bool):
+        return (
+            query_class,
+            json.dumps(query_parameters, sort_keys=True, default=str),
+            cloud_table,
+        )
+
+    def get_id(
+        self, query_class: str, query_parameters: Dict, cloud_table: bool = True
+    ) -> Tuple[Dict, Optional[str]]:
+        """
+        Returns the response and the ID of the first node of `query_class` matching
+        `query_parameters`, e.g. `{"$gcpTableId: String": "microdados"}`. IDs that were
+        found are memoized.
+        """
+        return self.get_ids_batch([(query_class, query_parameters, cloud_table)])[0]
+
+    def get_ids_batch(self, lookups: List[Tuple[str, Dict, bool]]) -> List[Tuple]:
+        """
+        Looks up several `(query_class, query_parameters, cloud_table)` IDs with a single
+        request, one aliased field per lookup. Returns `(response, id)` for each lookup,
+        where `response` has the same format as a single lookup.
+        """
+        results: List[Optional[Tuple]] = [
+            self._ids.get(self._cache_key(*lookup)) for lookup in lookups
+        ]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+
+        declarations, fields, variables = [], [], {}
+        for i in missing:
+            query_class, query_parameters, cloud_table = lookups[i]
+            _, keys, values = parse_query_parameters(query_parameters)
+            arguments = []
+            for declaration, key in zip(query_parameters, keys):
+                declarations.append(declaration.replace(f"${key}", f"${key}_{i}", 1))
+                arguments.append(f"{key}: ${key}_{i}")
+                variables[f"{key}_{i}"] = values[key]
+            fields.append(
+                f"q{i}: {query_class}({', '.join(arguments)}){{"
+                f" edges{{ node{{ {node_fields(cloud_table)} }} }} }}"
+            )
+        query = f"query({', '.join(declarations)}) {{ {' '.join(fields)} }}"
+        response = self.execute(query, variables)
+        if response is None or "data" not in response or response["data"] is None:
+            print("get:  Error:", json.dumps(response, indent=4, ensure_ascii=False))
+            raise Exception("get: Error")
+
+        for i in missing:
+            query_class = lookups[i][0]
+            single = {"data": {query_class: response["data"].get(f"q{i}") or {}}}
+            results[i] = (single, first_id(single, query_class))
+            if results[i][1] is not None:
+                self._ids[self._cache_key(*lookups[i])] = results[i]
+        return results
+
+    def get_date(self, query_class: str, query_parameters: Dict) -> Dict:
+        """
+        Returns the start date and interval of the nodes of `query_class`.
+        """
+        declarations, keys, variables = parse_query_parameters(query_parameters)
+        arguments = ", ".join(f"{key}:${key}" for key in keys)
+        query = f"""query({", ".join(declarations)}) {{
+                        {query_class}({arguments}){{
+                        edges{{
+                            node{{
+                            startYear,
+                            startMonth,
+                            startDay,
+                            interval,
+                            }}
+                        }}
+                        }}
+                    }}"""
+        return self.execute(query, variables)
+
+    def create_update(
+        self,
+        mutation_class: str,
+        mutation_parameters: Dict,
+        query_class: str,
+        query_parameters: Dict,
+        update: bool = False,
+    ) -> Tuple[Dict, str]:
+        """
+        Creates the object of `mutation_class` unless the lookup of `query_class`
+        finds it, in which case it is only changed when `update` is True.
+        """
+        response, _id = self.get_id(query_class, query_parameters, cloud_table=False)
+        if _id is not None:
+            # the response is memoized, callers get a copy
+            response = {**response, "r": "query"}
+            if update is False:
+                return response, _id
+            mutation_parameters["id"] = _id
+
+        _classe = mutation_class.replace("CreateUpdate", "").lower()
+        query = f"""
+                mutation($input:{mutation_class}Input!){{
+                    {mutation_class}(input: $input){{
+                    errors {{
+                        field,
+                        messages
+                    }},
+                    clientMutationId,
+                    {_classe} {{
+                        id,
+                    }}
+                }}
+                }}
+            """
+        response = self.execute(query, {"input": mutation_parameters})
+        response["r"] = "mutation"
+        if response.get("data") is None:
+            print("\n", "create: query\n", query, "\n")
+            print(
+                "create: input\n",
+                json.dumps(mutation_parameters, indent=4, ensure_ascii=False),
+                "\n",
+            )
+            print("create: error\n", json.dumps(response, indent=4, ensure_ascii=False))
+            raise Exception("create: Error")
+        if response["data"].get(mutation_class, {}).get("errors", []) != []:
+            print(f"create: not found {mutation_class}", mutation_parameters)
+            print("create: error\n", json.dumps(response, indent=4, ensure_ascii=False))
+            raise Exception("create: Error")
+
+        # the object may now match lookups that were memoized before
+        self._ids = {
+            key: value for key, value in self._ids.items() if key[0] != query_class
+        }
+        return response, response["data"][mutation_class][_classe]["id"].split(":")[1]
+
+
+_clients: Dict[tuple, MetadataClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_metadata_client(
+    email: str, password: str, api_mode: str = "prod"
+) -> MetadataClient:
+    """
+    Returns the client of these credentials shared by the whole process.
+    """
+    with _clients_lock:
+        key = (email, password, api_mode)
+        if key not in _clients:
+            _clients[key] = MetadataClient(email, password, api_mode)
+        return _clients[key]
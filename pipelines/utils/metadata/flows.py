@@ -15,6 +15,7 @@ from pipelines.utils.metadata.tasks import (
     get_today_date,
     test_ids,
     update_django_metadata,
+    update_django_metadata_bulk,
 )
 
 # from pipelines.utils.utils import log
@@ -63,3 +64,30 @@ temporal_coverage_updater_flow.run_config = KubernetesRun(
     image=constants.DOCKER_IMAGE.value
 )
 # flow.schedule = every_two_weeks
+
+with Flow(
+    name="update_temporal_coverage_bulk",
+    code_owners=[
+        "arthurfg",
+    ],
+) as temporal_coverage_updater_bulk_flow:
+    # e.g. [{"dataset_id": "br_x", "table_id": "y", "date_format": "yy-mm"}, ...]
+    tables = Parameter("tables", required=True)
+    api_mode = Parameter("api_mode", default="prod", required=True)
+    billing_project_id = Parameter(
+        "billing_project_id", default="basedosdados-dev", required=True
+    )
+    max_workers = Parameter("max_workers", default=8, required=False)
+
+    update_django_metadata_bulk(
+        tables=tables,
+        api_mode=api_mode,
+        billing_project_id=billing_project_id,
+        max_workers=max_workers,
+    )
+
+
+temporal_coverage_updater_bulk_flow.storage = GCS(constants.GCS_FLOWS_BUCKET.value)
+temporal_coverage_updater_bulk_flow.run_config = KubernetesRun(
+    image=constants.DOCKER_IMAGE.value
+)
@@ -3,19 +3,26 @@
 Tasks for metadata
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Dict, List
 
 from dateutil.relativedelta import relativedelta
 from prefect import task
 
 from pipelines.utils.metadata.utils import (
+    build_coverage_mutations,
     create_update,
     extract_last_date,
+    extract_last_dates,
     extract_last_update,
+    extract_last_updates,
+    format_last_update,
     get_credentials_utils,
     get_first_date,
     get_id,
     get_ids,
+    get_ids_bulk,
     parse_temporal_coverage,
 )
 from pipelines.utils.utils import get_credentials_from_secret, log
@@ -527,6 +534,141 @@ def update_django_metadata(
                 )
 
 
+@task
+def update_django_metadata_bulk(
+    tables: List[Dict],
+    api_mode: str = "prod",
+    billing_project_id: str = "basedosdados-dev",
+    max_workers: int = 8,
+):
+    """
+    Updates the DateTimeRange metadata of many tables in one run.
+
+    Every item of `tables` has `dataset_id` and `table_id` and, optionally, the
+    `update_django_metadata` arguments `_last_date`, `date_format`, `bq_last_update`,
+    `bq_table_last_year_month`, `is_bd_pro`, `is_free`, `time_delta` and `time_unit`,
+    with the same defaults. The last modification times are read with one `__TABLES__`
+    query per dataset, the last dates with a single UNION ALL query, the IDs with two
+    API requests, and the coverage mutations are sent by `max_workers` threads.
+
+    Returns:
+        -   dict: the updated DateTimeRange IDs per `dataset_id.table_id`.
+
+    Raises:
+        -   Exception: If the billing_project_id is not supported.
+        -   Exception: after all mutations were sent, if any of them failed or if any
+            table was not found, had no last date, an invalid lag or missing
+            coverages.
+    """
+    accepted_billing_project_id = [
+        "basedosdados-dev",
+        "basedosdados",
+        "basedosdados-staging",
+    ]
+    if billing_project_id not in accepted_billing_project_id:
+        raise Exception(
+            f"The given billing_project_id: {billing_project_id} is invalid. The accepted valuesare {accepted_billing_project_id}"
+        )
+
+    defaults = {
+        "_last_date": None,
+        "date_format": "yy-mm-dd",
+        "bq_last_update": True,
+        "bq_table_last_year_month": False,
+        "is_bd_pro": False,
+        "is_free": False,
+        "time_delta": 1,
+        "time_unit": "days",
+    }
+    tables = [{**defaults, **table} for table in tables]
+    keys = [(table["dataset_id"], table["table_id"]) for table in tables]
+
+    (email, password) = get_credentials_utils(secret_path=f"api_user_{api_mode}")
+    ids = get_ids_bulk(keys, email, password, api_mode)
+    log(f"IDS:{ids}")
+
+    last_updates = {}
+    if any(table["bq_last_update"] for table in tables):
+        last_updates = extract_last_updates(
+            [key for key, table in zip(keys, tables) if table["bq_last_update"]],
+            billing_project_id=billing_project_id,
+        )
+    last_dates = {}
+    last_date_tables = [
+        (*key, table["date_format"])
+        for key, table in zip(keys, tables)
+        if not table["bq_last_update"] and table["bq_table_last_year_month"]
+    ]
+    if last_date_tables:
+        last_dates = extract_last_dates(
+            last_date_tables, billing_project_id=billing_project_id
+        )
+
+    mutations, failed = [], []
+    for key, table in zip(keys, tables):
+        if not table["is_bd_pro"] and not table["is_free"]:
+            log(f"{key[0]}.{key[1]} não é BD Pro nem grátis, nada a atualizar")
+            continue
+        try:
+            if key not in ids:
+                raise ValueError("Tabela não encontrada na API")
+            if table["bq_last_update"]:
+                if key not in last_updates:
+                    raise ValueError("Tabela não encontrada no __TABLES__")
+                last_date = format_last_update(last_updates[key], table["date_format"])
+            elif table["bq_table_last_year_month"]:
+                last_date = last_dates.get(key)
+            else:
+                last_date = table["_last_date"]
+            if not isinstance(last_date, str):
+                raise ValueError("Sem última data")
+            log(f"{key[0]}.{key[1]} ->> {last_date}")
+            table_mutations = build_coverage_mutations(
+                ids[key],
+                last_date,
+                table["date_format"],
+                is_bd_pro=table["is_bd_pro"],
+                is_free=table["is_free"],
+                time_delta=table["time_delta"],
+                time_unit=table["time_unit"],
+            )
+        except ValueError as error:
+            log(f"Falha ao atualizar {key[0]}.{key[1]}: {error}", level="error")
+            failed.append(f"{key[0]}.{key[1]}")
+            continue
+        for coverage_id, parameters in table_mutations:
+            mutations.append((key, coverage_id, parameters))
+
+    def push(coverage_id, parameters):
+        return create_update(
+            query_class="allDatetimerange",
+            query_parameters={"$coverage_Id: ID": coverage_id},
+            mutation_class="CreateUpdateDateTimeRange",
+            mutation_parameters=parameters,
+            update=True,
+            email=email,
+            password=password,
+            api_mode=api_mode,
+        )
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            (f"{key[0]}.{key[1]}", executor.submit(push, coverage_id, parameters))
+            for key, coverage_id, parameters in mutations
+        ]
+        for name, future in futures:
+            try:
+                results.setdefault(name, []).append(future.result()[1])
+            except Exception as error:  # pylint: disable=broad-except
+                log(f"Falha ao atualizar {name}: {error}", level="error")
+                failed.append(name)
+
+    if failed:
+        raise Exception(f"Falha ao atualizar a cobertura de: {sorted(set(failed))}")
+    return results
+
+
 @task
 def test_ids(dataset_id, table_id, api_mode="staging", is_bd_pro=True, is_free=False):
     (email, password) = get_credentials_utils(secret_path=f"api_user_{api_mode}")
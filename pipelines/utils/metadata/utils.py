@@ -3,18 +3,18 @@
 General purpose functions for the metadata project
 """
 
-import json
 import re
 
 # pylint: disable=too-many-arguments
 from datetime import datetime
-from typing import Tuple
+from typing import Dict, List, Tuple
 
 import basedosdados as bd
 import numpy as np
 import pandas as pd
-import requests
+from dateutil.relativedelta import relativedelta
 
+from pipelines.utils.metadata.client import get_metadata_client
 from pipelines.utils.utils import get_credentials_from_secret, log
 
 
@@ -220,43 +220,9 @@ def get_credentials_utils(secret_path: str) -> Tuple[str, str]:
 
 def get_token(email, password, api_mode: str = "prod"):
     """
-    Get api token.
+    Get api token. The token is cached by the shared metadata client until it expires.
     """
-    r = None
-    if api_mode == "prod":
-        r = requests.post(
-            "http://api.basedosdados.org/api/v1/graphql",
-            headers={"Content-Type": "application/json"},
-            json={
-                "query": """
-            mutation ($email: String!, $password: String!) {
-                tokenAuth(email: $email, password: $password) {
-                    token
-                }
-            }
-        """,
-                "variables": {"email": email, "password": password},
-            },
-        )
-
-        r.raise_for_status()
-    elif api_mode == "staging":
-        r = requests.post(
-            "http://staging.api.basedosdados.org/api/v1/graphql",
-            headers={"Content-Type": "application/json"},
-            json={
-                "query": """
-            mutation ($email: String!, $password: String!) {
-                tokenAuth(email: $email, password: $password) {
-                    token
-                }
-            }
-        """,
-                "variables": {"email": email, "password": password},
-            },
-        )
-        r.raise_for_status()
-    return r.json()["data"]["tokenAuth"]["token"]
+    return get_metadata_client(email, password, api_mode).token
 
 
 def get_id(
@@ -267,67 +233,13 @@ def get_id(
     api_mode: str = "prod",
     cloud_table: bool = True,
 ):
-    token = get_token(email, password, api_mode)
-    header = {
-        "Authorization": f"Bearer {token}",
-    }
-    _filter = ", ".join(list(query_parameters.keys()))
-    keys = [
-        parameter.replace("$", "").split(":")[0]
-        for parameter in list(query_parameters.keys())
-    ]
-    values = list(query_parameters.values())
-    _input = ", ".join([f"{key}:${key}" for key in keys])
-
-    if cloud_table:
-        query = f"""query({_filter}) {{
-                            {query_class}({_input}){{
-                            edges{{
-                                node{{
-                                id,
-                                table{{
-                                    _id
-                                    }}
-                                }}
-                            }}
-                            }}
-                        }}"""
-    else:
-        query = f"""query({_filter}) {{
-                            {query_class}({_input}){{
-                            edges{{
-                                node{{
-                                id,
-                                }}
-                            }}
-                            }}
-                        }}"""
-
-    if api_mode == "staging":
-        r = requests.post(
-            url=f"https://{api_mode}.api.basedosdados.org/api/v1/graphql",
-            json={"query": query, "variables": dict(zip(keys, values))},
-            headers=header,
-        ).json()
-    elif api_mode == "prod":
-        r = requests.post(
-            url="https://api.basedosdados.org/api/v1/graphql",
-            json={"query": query, "variables": dict(zip(keys, values))},
-            headers=header,
-        ).json()
-
-    if "data" in r and r is not None:
-        if r.get("data", {}).get(query_class, {}).get("edges") == []:
-            id = None
-            # print(f"get: not found {query_class}", dict(zip(keys, values)))
-        else:
-            id = r["data"][query_class]["edges"][0]["node"]["id"]
-            # print(f"get: found {id}")
-            id = id.split(":")[1]
-        return r, id
-    else:
-        print("get:  Error:", json.dumps(r, indent=4, ensure_ascii=False))
-        raise Exception("get: Error")
+    """
+    Returns the response and the ID of the first `query_class` node matching
+    `query_parameters`. IDs are memoized by the shared metadata client.
+    """
+    return get_metadata_client(email, password, api_mode).get_id(
+        query_class, query_parameters, cloud_table=cloud_table
+    )
 
 
 def get_date(
@@ -337,51 +249,12 @@ def get_date(
     password,
     api_mode: str = "prod",
 ):
-    token = get_token(
-        email=email,
-        password=password,
-        api_mode=api_mode,
+    """
+    Returns the start date and interval of the `query_class` nodes.
+    """
+    return get_metadata_client(email, password, api_mode).get_date(
+        query_class, query_parameters
     )
-    log("puxou token")
-    header = {
-        "Authorization": f"Bearer {token}",
-    }
-    log(f"{header}")
-    _filter = ", ".join(list(query_parameters.keys()))
-    keys = [
-        parameter.replace("$", "").split(":")[0]
-        for parameter in list(query_parameters.keys())
-    ]
-    values = list(query_parameters.values())
-    _input = ", ".join([f"{key}:${key}" for key in keys])
-
-    query = f"""query({_filter}) {{
-                        {query_class}({_input}){{
-                        edges{{
-                            node{{
-                            startYear,
-                            startMonth,
-                            startDay,
-                            interval,
-                            }}
-                        }}
-                        }}
-                    }}"""
-
-    if api_mode == "staging":
-        r = requests.post(
-            url=f"https://{api_mode}.api.basedosdados.org/api/v1/graphql",
-            json={"query": query, "variables": dict(zip(keys, values))},
-            headers=header,
-        ).json()
-    elif api_mode == "prod":
-        r = requests.post(
-            url="https://api.basedosdados.org/api/v1/graphql",
-            json={"query": query, "variables": dict(zip(keys, values))},
-            headers=header,
-        ).json()
-
-    return r
 
 
 def create_update(
@@ -394,81 +267,17 @@ def create_update(
     update=False,
     api_mode: str = "prod",
 ):
-    token = get_token(
-        email=email,
-        password=password,
-        api_mode=api_mode,
-    )
-    header = {
-        "Authorization": f"Bearer {token}",
-    }
-
-    r, id = get_id(
+    """
+    Creates the `mutation_class` object unless the `query_class` lookup finds it, in
+    which case it is only changed when `update` is True.
+    """
+    return get_metadata_client(email, password, api_mode).create_update(
+        mutation_class=mutation_class,
+        mutation_parameters=mutation_parameters,
         query_class=query_class,
         query_parameters=query_parameters,
-        email=email,
-        password=password,
-        cloud_table=False,
-        api_mode=api_mode,
+        update=update,
     )
-    if id is not None:
-        r["r"] = "query"
-        if update is False:
-            return r, id
-
-    _classe = mutation_class.replace("CreateUpdate", "").lower()
-    query = f"""
-                mutation($input:{mutation_class}Input!){{
-                    {mutation_class}(input: $input){{
-                    errors {{
-                        field,
-                        messages
-                    }},
-                    clientMutationId,
-                    {_classe} {{
-                        id,
-                    }}
-                }}
-                }}
-            """
-
-    if update is True and id is not None:
-        mutation_parameters["id"] = id
-
-        if api_mode == "prod":
-            r = requests.post(
-                "https://api.basedosdados.org/api/v1/graphql",
-                json={"query": query, "variables": {"input": mutation_parameters}},
-                headers=header,
-            ).json()
-        elif api_mode == "staging":
-            r = requests.post(
-                f"https://{api_mode}api.basedosdados.org/api/v1/graphql",
-                json={"query": query, "variables": {"input": mutation_parameters}},
-                headers=header,
-            ).json()
-
-    r["r"] = "mutation"
-    if "data" in r and r is not None:
-        if r.get("data", {}).get(mutation_class, {}).get("errors", []) != []:
-            print(f"create: not found {mutation_class}", mutation_parameters)
-            print("create: error\n", json.dumps(r, indent=4, ensure_ascii=False), "\n")
-            id = None
-            raise Exception("create: Error")
-        else:
-            id = r["data"][mutation_class][_classe]["id"]
-            id = id.split(":")[1]
-
-            return r, id
-    else:
-        print("\n", "create: query\n", query, "\n")
-        print(
-            "create: input\n",
-            json.dumps(mutation_parameters, indent=4, ensure_ascii=False),
-            "\n",
-        )
-        print("create: error\n", json.dumps(r, indent=4, ensure_ascii=False), "\n")
-        raise Exception("create: Error")
 
 
 def parse_temporal_coverage(temporal_coverage):
@@ -542,134 +351,250 @@ def get_ids(
             "table"
         ].get("_id")
 
-        if is_bd_pro and is_free:
-            # Get the coverage IDs
-            coverage_result = get_id(
-                email=email,
-                password=password,
-                query_class="allCoverage",
-                query_parameters={
-                    "$table_Id: ID": table_id,
-                    "$isClosed: Boolean": True,
-                },
-                api_mode=api_mode,
-                cloud_table=True,
-            )
-            if not coverage_result:
-                raise ValueError("Coverage ID not found.")
-
-            coverage_ids = coverage_result[0]
+        # The open (free) and closed (BD Pro) coverages are looked up in one request
+        coverages = []
+        if is_free:
+            coverages.append(("coverage_id", False))
+        if is_bd_pro:
+            coverages.append(("coverage_id_pro", True))
+        coverage_results = get_metadata_client(email, password, api_mode).get_ids_batch(
+            [
+                (
+                    "allCoverage",
+                    {"$table_Id: ID": table_id, "$isClosed: Boolean": is_closed},
+                    True,
+                )
+                for _, is_closed in coverages
+            ]
+        )
 
+        ids = {"table_id": table_id}
+        for (key, _), (coverage_ids, _) in zip(coverages, coverage_results):
+            log(coverage_ids)
+            edges = coverage_ids["data"]["allCoverage"]["edges"]
             # Check if there are multiple coverage IDs
-            if len(coverage_ids["data"]["allCoverage"]["edges"]) > 1:
+            if len(edges) > 1:
                 print(
                     "WARNING: Your table has more than one coverage. Only the first ID has been selected."
                 )
-
             # Retrieve the first coverage ID
-            coverage_id_pro = coverage_ids["data"]["allCoverage"]["edges"][0]["node"][
-                "id"
-            ].split(":")[-1]
-            # Get the coverage IDs
-            coverage_result = get_id(
-                email=email,
-                password=password,
-                query_class="allCoverage",
-                query_parameters={
-                    "$table_Id: ID": table_id,
-                    "$isClosed: Boolean": False,
-                },
-                api_mode=api_mode,
-                cloud_table=True,
-            )
-            if not coverage_result:
-                raise ValueError("Coverage ID not found.")
+            ids[key] = edges[0]["node"]["id"].split(":")[-1]
 
-            coverage_ids = coverage_result[0]
+        return ids
+    except Exception as e:
+        print(f"Error occurred while retrieving IDs: {str(e)}")
+        raise
 
-            # Check if there are multiple coverage IDs
-            if len(coverage_ids["data"]["allCoverage"]["edges"]) > 1:
-                print(
-                    "WARNING: Your table has more than one coverage. Only the first ID has been selected."
-                )
 
-            # Retrieve the first coverage ID
-            coverage_id = coverage_ids["data"]["allCoverage"]["edges"][0]["node"][
-                "id"
-            ].split(":")[-1]
-        elif is_bd_pro and not is_free:
-            # Get the coverage IDs
-            coverage_result = get_id(
-                email=email,
-                password=password,
-                query_class="allCoverage",
-                query_parameters={
-                    "$table_Id: ID": table_id,
-                    "$isClosed: Boolean": True,
-                },
-                api_mode=api_mode,
-                cloud_table=True,
+#######################
+# Bulk updates
+#######################
+def format_last_update(date: datetime, date_format: str) -> str:
+    """
+    Formats a date as 'YYYY-MM-DD', 'YYYY-MM' or 'YYYY' for `date_format` 'yy-mm-dd',
+    'yy-mm' or 'yy'.
+    """
+    formats = {"yy-mm-dd": "%Y-%m-%d", "yy-mm": "%Y-%m", "yy": "%Y"}
+    return date.strftime(formats[date_format])
+
+
+def extract_last_updates(
+    tables: List[Tuple[str, str]], billing_project_id: str
+) -> Dict[Tuple[str, str], datetime]:
+    """
+    Returns the last modification time of every `(dataset_id, table_id)`, with one
+    `__TABLES__` query per dataset.
+    """
+    tables_by_dataset = {}
+    for dataset_id, table_id in tables:
+        tables_by_dataset.setdefault(dataset_id, []).append(table_id)
+
+    last_updates = {}
+    for dataset_id, table_ids in tables_by_dataset.items():
+        table_list = ", ".join(f"'{table_id}'" for table_id in sorted(set(table_ids)))
+        query_bd = f"""
+        SELECT
+        table_id, last_modified_time
+        FROM
+        `basedosdados.{dataset_id}.__TABLES__`
+        WHERE
+        table_id IN ({table_list})
+        """
+        t = bd.read_sql(
+            query=query_bd,
+            billing_project_id=billing_project_id,
+            from_file=True,
+        )
+        for table_id, last_modified_time in zip(t["table_id"], t["last_modified_time"]):
+            # Convert to seconds by dividing by 1000
+            last_updates[(dataset_id, table_id)] = datetime.fromtimestamp(
+                last_modified_time / 1000
             )
-            if not coverage_result:
-                raise ValueError("Coverage ID not found.")
+    log(f"Últimas modificações: {last_updates}")
+    return last_updates
 
-            coverage_ids = coverage_result[0]
 
-            # Check if there are multiple coverage IDs
-            if len(coverage_ids["data"]["allCoverage"]["edges"]) > 1:
-                print(
-                    "WARNING: Your table has more than one coverage. Only the first ID has been selected."
-                )
+def extract_last_dates(
+    tables: List[Tuple[str, str, str]], billing_project_id: str
+) -> Dict[Tuple[str, str], str]:
+    """
+    Returns the last date of every `(dataset_id, table_id, date_format)` with a single
+    UNION ALL query, following `extract_last_date`: tables in the 'yy-mm' format are
+    read from their `ano` and `mes` columns, the others from their `data` column.
+    """
+    selects = []
+    for dataset_id, table_id, date_format in tables:
+        if date_format == "yy-mm":
+            max_date = 'MAX(CONCAT(ano,"-",mes))'
+            table = f"{billing_project_id}.{dataset_id}.{table_id}"
+        else:
+            max_date = "MAX(data)"
+            table = f"basedosdados.{dataset_id}.{table_id}"
+        selects.append(
+            f"SELECT '{dataset_id}' AS dataset_id, '{table_id}' AS table_id, "
+            f"CAST({max_date} AS STRING) AS max_date FROM `{table}`"
+        )
+    query_bd = "\nUNION ALL\n".join(selects)
+    log(f"Query: {query_bd}")
+    t = bd.read_sql(
+        query=query_bd,
+        billing_project_id=billing_project_id,
+        from_file=True,
+    )
 
-            # Retrieve the first coverage ID
-            coverage_id_pro = coverage_ids["data"]["allCoverage"]["edges"][0]["node"][
-                "id"
-            ].split(":")[-1]
-        elif is_free and not is_bd_pro:
-            # Get the coverage IDs
-            coverage_result = get_id(
-                email=email,
-                password=password,
-                query_class="allCoverage",
-                query_parameters={
-                    "$table_Id: ID": table_id,
-                    "$isClosed: Boolean": False,
+    date_formats = {
+        (dataset_id, table_id): date_format
+        for dataset_id, table_id, date_format in tables
+    }
+    last_dates = {}
+    for dataset_id, table_id, max_date in zip(
+        t["dataset_id"], t["table_id"], t["max_date"]
+    ):
+        if max_date is None or pd.isna(max_date):
+            # tabelas vazias ficam de fora, como as que não têm última data
+            log(f"Sem última data para {dataset_id}.{table_id}", level="warning")
+            continue
+        if date_formats[(dataset_id, table_id)] == "yy-mm":
+            max_date = datetime.strptime(max_date, "%Y-%m").strftime("%Y-%m")
+        last_dates[(dataset_id, table_id)] = max_date
+    log(f"Últimas datas: {last_dates}")
+    return last_dates
+
+
+def get_ids_bulk(
+    tables: List[Tuple[str, str]],
+    email: str,
+    password: str,
+    api_mode: str = "prod",
+) -> Dict[Tuple[str, str], dict]:
+    """
+    Like `get_ids`, for many `(dataset_id, table_id)` at once: the tables are looked up
+    in a single request and all their open and closed coverages in another one.
+    Tables and coverages that do not exist are left out of the returned IDs.
+    """
+    client = get_metadata_client(email, password, api_mode)
+    table_results = client.get_ids_batch(
+        [
+            (
+                "allCloudtable",
+                {
+                    "$gcpDatasetId: String": dataset_id,
+                    "$gcpTableId: String": table_id,
                 },
-                api_mode=api_mode,
-                cloud_table=True,
+                True,
             )
-            if not coverage_result:
-                raise ValueError("Coverage ID not found.")
+            for dataset_id, table_id in tables
+        ]
+    )
+    table_ids = {}
+    for table, (response, _) in zip(tables, table_results):
+        edges = response["data"]["allCloudtable"].get("edges")
+        if not edges:
+            log(f"Tabela {table[0]}.{table[1]} não encontrada", level="warning")
+            continue
+        table_ids[table] = edges[0]["node"]["table"].get("_id")
+
+    coverages = [
+        (table, table_id, key, is_closed)
+        for table, table_id in table_ids.items()
+        for key, is_closed in [("coverage_id", False), ("coverage_id_pro", True)]
+    ]
+    coverage_results = client.get_ids_batch(
+        [
+            (
+                "allCoverage",
+                {"$table_Id: ID": table_id, "$isClosed: Boolean": is_closed},
+                True,
+            )
+            for _, table_id, _, is_closed in coverages
+        ]
+    )
 
-            coverage_ids = coverage_result[0]
-            log(coverage_ids)
-            # Check if there are multiple coverage IDs
-            if len(coverage_ids["data"]["allCoverage"]["edges"]) > 1:
-                print(
-                    "WARNING: Your table has more than one coverage. Only the first ID has been selected."
-                )
+    ids = {table: {"table_id": table_id} for table, table_id in table_ids.items()}
+    for (table, _, key, _), (_, coverage_id) in zip(coverages, coverage_results):
+        if coverage_id is not None:
+            ids[table][key] = coverage_id
+    return ids
 
-            # Retrieve the first coverage ID
-            coverage_id = coverage_ids["data"]["allCoverage"]["edges"][0]["node"][
-                "id"
-            ].split(":")[-1]
-        # Return the 3 IDs in a dictionary
-        if is_bd_pro and is_free:
-            return {
-                "table_id": table_id,
-                "coverage_id": coverage_id,
-                "coverage_id_pro": coverage_id_pro,
-            }
-        elif is_free and not is_bd_pro:
-            return {
-                "table_id": table_id,
-                "coverage_id": coverage_id,
-            }
-        elif is_bd_pro and not is_free:
-            return {
-                "table_id": table_id,
-                "coverage_id_pro": coverage_id_pro,
-            }
-    except Exception as e:
-        print(f"Error occurred while retrieving IDs: {str(e)}")
-        raise
+
+def build_coverage_mutations(
+    ids: dict,
+    last_date: str,
+    date_format: str,
+    is_bd_pro: bool,
+    is_free: bool,
+    time_delta: int = 1,
+    time_unit: str = "days",
+) -> List[Tuple[str, dict]]:
+    """
+    Returns the `(coverage_id, mutation_parameters)` of the DateTimeRange updates of a
+    table, as done by `update_django_metadata`: the closed (BD Pro) coverage ends at
+    `last_date` and the open one `time_delta` `time_unit` before it. Tables that are
+    neither free nor BD Pro have no updates.
+
+    Raises:
+        -   ValueError: if `time_unit` or `time_delta` are invalid, or a coverage to be
+            updated was not found.
+    """
+    if time_unit not in ("years", "months", "weeks", "days"):
+        raise ValueError(
+            "Unidade temporal inválida. Escolha entre years, months, weeks, days"
+        )
+    keys = []
+    if is_bd_pro:
+        keys.append("coverage_id_pro")
+    if is_free:
+        keys.append("coverage_id")
+    missing = [key for key in keys if ids.get(key) is None]
+    if missing:
+        raise ValueError(f"Cobertura não encontrada: {missing}")
+
+    formats = {"yy-mm-dd": "%Y-%m-%d", "yy-mm": "%Y-%m", "yy": "%Y"}
+    resource_to_temporal_coverage = parse_temporal_coverage(f"{last_date}")
+    if not is_bd_pro and not is_free:
+        return []
+    if is_free and not is_bd_pro:
+        resource_to_temporal_coverage["coverage"] = ids["coverage_id"]
+        return [(ids["coverage_id"], resource_to_temporal_coverage)]
+    if is_bd_pro and not is_free:
+        resource_to_temporal_coverage["coverage"] = ids["coverage_id_pro"]
+        return [(ids["coverage_id_pro"], resource_to_temporal_coverage)]
+
+    if not isinstance(time_delta, int) or time_delta <= 0:
+        raise ValueError("Defasagem deve ser um número inteiro positivo")
+    delta = relativedelta(**{time_unit: time_delta})
+    free_data = datetime.strptime(last_date, formats[date_format]) - delta
+    resource_to_temporal_coverage_free = parse_temporal_coverage(
+        free_data.strftime(formats[date_format])
+    )
+    for part in ["Year", "Month", "Day"]:
+        if f"end{part}" in resource_to_temporal_coverage_free:
+            resource_to_temporal_coverage[
+                f"start{part}"
+            ] = resource_to_temporal_coverage_free[f"end{part}"]
+    resource_to_temporal_coverage["coverage"] = ids["coverage_id_pro"]
+    resource_to_temporal_coverage_free["coverage"] = ids["coverage_id"]
+    return [
+        (ids["coverage_id_pro"], resource_to_temporal_coverage),
+        (ids["coverage_id"], resource_to_temporal_coverage_free),
+    ]
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Local cache of small reference tables, such as the `br_bd_diretorios_brasil`
+directories, used to enrich other datasets.
+
+A table is downloaded once from its staging blobs (see `pipelines.utils.staging`) into
+a local parquet file, stamped with the generations of those blobs. It is downloaded
+again only when a blob is added, removed or overwritten upstream. Cached tables are read memory-mapped and kept in
+process, along with the lookup dicts and categoricals built from them.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from pipelines.utils.constants import constants
+from pipelines.utils.staging import STAGING_BUCKET, StagingTableReader
+from pipelines.utils.utils import log
+
+
+def blobs_version(blobs: List) -> str:
+    """
+    Returns a stamp that changes whenever a blob is added, removed or overwritten.
+    """
+    stamp = "\n".join(sorted(f"{blob.name}:{blob.generation}" for blob in blobs))
+    return hashlib.sha256(stamp.encode()).hexdigest()
+
+
+class ReferenceCache:
+    """
+    Reference tables cached on disk as parquet and in process as Arrow tables.
+
+    Args:
+        cache_dir (str, pathlib.Path): Optional. Defaults to
+            `constants.REFERENCE_CACHE_DIR`.
+        bucket (str): bucket with the `staging/<dataset_id>/<table_id>/` blobs.
+    """
+
+    def __init__(self, cache_dir: Union[str, Path] = None, bucket: str = None):
+        self.cache_dir = Path(cache_dir or constants.REFERENCE_CACHE_DIR.value)
+        self.bucket = bucket or STAGING_BUCKET
+        self._tables: Dict[Tuple[str, str], pa.Table] = {}
+        self._lookups: Dict[tuple, dict] = {}
+        self._lock = threading.Lock()
+
+    def _paths(self, dataset_id: str, table_id: str) -> Tuple[Path, Path]:
+        base = self.cache_dir / dataset_id / table_id
+        return base.with_suffix(".parquet"), base.with_suffix(".json")
+
+    def _reader(self, dataset_id: str, table_id: str) -> StagingTableReader:
+        return StagingTableReader(dataset_id, table_id, bucket=self.bucket)
+
+    def _list_blobs(self, dataset_id: str, table_id: str) -> List:
+        return self._reader(dataset_id, table_id).list_blobs()
+
+    def _cached_version(self, dataset_id: str, table_id: str) -> Optional[str]:
+        parquet_path, stamp_path = self._paths(dataset_id, table_id)
+        if not (parquet_path.exists() and stamp_path.exists()):
+            return None
+        return json.loads(stamp_path.read_text())["version"]
+
+    def _materialize(self, dataset_id: str, table_id: str, blobs: List, version: str):
+        parquet_path, stamp_path = self._paths(dataset_id, table_id)
+        parquet_path.parent.mkdir(parents=True, exist_ok=True)
+        reader = self._reader(dataset_id, table_id)
+        table = pa.concat_tables(
+            list(reader.iter_blobs(blobs, as_strings=True)), promote=True
+        )
+        with tempfile.NamedTemporaryFile(
+            dir=parquet_path.parent, suffix=".parquet", delete=False
+        ) as file:
+            pq.write_table(table, file.name)
+        os.replace(file.name, parquet_path)
+        stamp_path.write_text(
+            json.dumps(
+                {"version": version, "blobs": len(blobs), "rows": table.num_rows}
+            )
+        )
+        log(f"Reference table {dataset_id}.{table_id} cached ({table.num_rows} rows)")
+
+    def _load(self, dataset_id: str, table_id: str) -> pa.Table:
+        parquet_path, _ = self._paths(dataset_id, table_id)
+        cached_version = self._cached_version(dataset_id, table_id)
+        try:
+            blobs = self._list_blobs(dataset_id, table_id)
+        except Exception as error:  # pylint: disable=broad-except
+            if cached_version is None:
+                raise
+            log(f"Could not list {dataset_id}.{table_id} ({error}), using the cache")
+        else:
+            if not blobs:
+                raise FileNotFoundError(
+                    f"No blobs in gs://{self.bucket}/staging/{dataset_id}/{table_id}/"
+                )
+            version = blobs_version(blobs)
+            if version != cached_version:
+                self._materialize(dataset_id, table_id, blobs, version)
+        return pq.read_table(parquet_path, memory_map=True)
+
+    def arrow_table(self, dataset_id: str, table_id: str) -> pa.Table:
+        """
+        Returns the whole reference table, checking the upstream blobs once per process.
+        """
+        key = (dataset_id, table_id)
+        with self._lock:
+            if key not in self._tables:
+                self._tables[key] = self._load(dataset_id, table_id)
+            return self._tables[key]
+
+    def table(
+        self, dataset_id: str, table_id: str, columns: List[str] = None
+    ) -> pd.DataFrame:
+        """
+        Returns the reference table (or some of its columns) as a DataFrame of strings.
+        """
+        table = self.arrow_table(dataset_id, table_id)
+        if columns is not None:
+            table = table.select(list(columns))
+        return table.to_pandas()
+
+    def lookup(
+        self, dataset_id: str, table_id: str, key: str, value: str
+    ) -> Dict[str, str]:
+        """
+        Returns a `{key: value}` dict of two columns of the reference table, e.g.
+        `id_municipio_bcb -> id_municipio`. Null keys are left out.
+        """
+        cache_key = (dataset_id, table_id, key, value)
+        if cache_key not in self._lookups:
+            df = self.table(dataset_id, table_id, [key, value]).dropna(subset=[key])
+            self._lookups[cache_key] = dict(zip(df[key], df[value]))
+        return self._lookups[cache_key]
+
+    def categories(
+        self, dataset_id: str, table_id: str, column: str
+    ) -> pd.CategoricalDtype:
+        """
+        Returns a categorical dtype with the distinct values of a column, to store
+        columns such as `sigla_uf` or `id_municipio` as categoricals.
+        """
+        cache_key = (dataset_id, table_id, column, None)
+        if cache_key not in self._lookups:
+            values = self.arrow_table(dataset_id, table_id).column(column)
+            self._lookups[cache_key] = pd.CategoricalDtype(
+                sorted(v for v in values.unique().to_pylist() if v is not None)
+            )
+        return self._lookups[cache_key]
+
+
+_cache: Optional[ReferenceCache] = None
+
+
+def get_reference_cache() -> ReferenceCache:
+    """
+    Returns the process wide reference cache.
+    """
+    global _cache  # pylint: disable=global-statement
+    if _cache is None:
+        _cache = ReferenceCache()
+    return _cache
+
+
+def read_reference_table(
+    dataset_id: str, table_id: str, columns: List[str] = None
+) -> pd.DataFrame:
+    """
+    Returns a reference table (e.g. `br_bd_diretorios_brasil.municipio`) from the local
+    cache, downloading it only when it changed upstream.
+    """
+    return get_reference_cache().table(dataset_id, table_id, columns)
+
+
+def reference_lookup(
+    dataset_id: str, table_id: str, key: str, value: str
+) -> Dict[str, str]:
+    """
+    Returns a `{key: value}` dict of two columns of a cached reference table.
+    """
+    return get_reference_cache().lookup(dataset_id, table_id, key, value)
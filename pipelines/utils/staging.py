@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+Reader of the tables in the staging bucket (`staging/<dataset_id>/<table_id>/`).
+
+Blobs are pruned by their hive partitions (`column=value/`) before being downloaded,
+then downloaded and parsed concurrently with Arrow, reading only the requested
+columns. Tables are returned as a single Arrow table or as one table per blob, or
+parsed with pandas, as by the readers that preceded this module.
+"""
+import csv
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+import basedosdados as bd
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from pipelines.utils.utils import _promote_type
+
+STAGING_BUCKET = "basedosdados-dev"
+
+# a filter is a value, a list of accepted values or a predicate on the (str) value
+PartitionFilter = Union[Any, List[Any], Callable[[str], bool]]
+
+
+def blob_partitions(name: str) -> Dict[str, str]:
+    """
+    Returns the hive partitions of a blob name, e.g. `{"ano": "2022", "sigla_uf": "SP"}`.
+    """
+    return dict(re.findall(r"(\w+)=([^/]+)/", name))
+
+
+def match_partitions(
+    partitions: Dict[str, str], filters: Optional[Dict[str, PartitionFilter]]
+) -> bool:
+    """
+    Checks the partitions of a blob against `filters`. Filters on columns the blob is
+    not partitioned by are ignored.
+    """
+    for column, accepted in (filters or {}).items():
+        if column not in partitions:
+            continue
+        value = partitions[column]
+        if callable(accepted):
+            if not accepted(value):
+                return False
+        elif isinstance(accepted, (list, tuple, set)):
+            if value not in {str(item) for item in accepted}:
+                return False
+        elif value != str(accepted):
+            return False
+    return True
+
+
+def parse_blob(
+    data: bytes,
+    name: str,
+    columns: Optional[List[str]] = None,
+    as_strings: bool = False,
+) -> pa.Table:
+    """
+    Parses a csv or parquet blob, projecting `columns` and adding its partitions as
+    string columns.
+    """
+    partitions = blob_partitions(name)
+    file_columns = None
+    if columns is not None:
+        file_columns = [column for column in columns if column not in partitions]
+
+    if name.endswith(".parquet"):
+        table = pq.read_table(BytesIO(data), columns=file_columns)
+        if as_strings:
+            table = table.cast(
+                pa.schema([(field.name, pa.string()) for field in table.schema])
+            )
+    else:
+        column_types = {}
+        if as_strings:
+            header = next(csv.reader([data.split(b"\n", 1)[0].decode("utf-8-sig")]))
+            column_types = {column: pa.string() for column in header}
+        table = pa_csv.read_csv(
+            BytesIO(data),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=file_columns,
+                include_missing_columns=True,
+                column_types=column_types,
+                strings_can_be_null=True,
+            ),
+        )
+
+    for column, value in partitions.items():
+        if columns is None or column in columns:
+            table = table.append_column(
+                column, pa.array([value] * table.num_rows, type=pa.string())
+            )
+    if columns is not None:
+        table = table.select(
+            [column for column in columns if column in table.schema.names]
+        )
+    return table
+
+
+def parse_blob_pandas(
+    data: bytes, name: str, columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """
+    Parses a csv or parquet blob with pandas, projecting `columns` and adding its
+    partitions as string columns. Types are inferred by `pd.read_csv` for each blob.
+    """
+    partitions = blob_partitions(name)
+    file_columns = None
+    if columns is not None:
+        file_columns = [column for column in columns if column not in partitions]
+
+    if name.endswith(".parquet"):
+        dataframe = pd.read_parquet(BytesIO(data), columns=file_columns)
+    else:
+        dataframe = pd.read_csv(BytesIO(data), usecols=file_columns)
+
+    for column, value in partitions.items():
+        if columns is None or column in columns:
+            dataframe[column] = value
+    if columns is not None:
+        dataframe = dataframe[
+            [column for column in columns if column in dataframe.columns]
+        ]
+    return dataframe
+
+
+def concat_tables(tables: List[pa.Table]) -> pa.Table:
+    """
+    Concatenates tables whose columns may be missing or typed differently across
+    them, e.g. int64 in a blob and string in another. Columns are promoted to a type
+    holding all their values (see `to_partitions`) and missing ones are null.
+    """
+    types: Dict[str, pa.DataType] = {}
+    for table in tables:
+        for field in table.schema:
+            if field.name in types:
+                types[field.name] = _promote_type(types[field.name], field.type)
+            else:
+                types[field.name] = field.type
+    tables = [
+        table.cast(pa.schema([(name, types[name]) for name in table.schema.names]))
+        for table in tables
+    ]
+    return pa.concat_tables(tables, promote=True)
+
+
+class StagingTableReader:
+    """
+    Reads a table of the staging bucket.
+
+    Args:
+        dataset_id (str): dataset of the table.
+        table_id (str): table.
+        bucket (str): Optional. Defaults to `basedosdados-dev`.
+        client: Optional. A `google.cloud.storage.Client`. Defaults to the staging
+            client of `basedosdados`.
+        max_workers (int): blobs downloaded at the same time.
+    """
+
+    def __init__(
+        self,
+        dataset_id: str,
+        table_id: str,
+        bucket: str = None,
+        client=None,
+        max_workers: int = 8,
+    ):
+        self.dataset_id = dataset_id
+        self.table_id = table_id
+        self.bucket = bucket or STAGING_BUCKET
+        if client is None:
+            storage = bd.Storage(dataset_id=dataset_id, table_id=table_id)
+            client = storage.client["storage_staging"]
+        self.client = client
+        self.max_workers = max_workers
+
+    @property
+    def prefix(self) -> str:
+        """
+        Prefix of the blobs of the table.
+        """
+        return f"staging/{self.dataset_id}/{self.table_id}/"
+
+    def list_blobs(self, filters: Dict[str, PartitionFilter] = None) -> List:
+        """
+        Lists the data blobs of the table whose partitions match `filters`.
+        """
+        return [
+            blob
+            for blob in self.client.bucket(self.bucket).list_blobs(prefix=self.prefix)
+            if not blob.name.endswith("/")
+            and match_partitions(blob_partitions(blob.name), filters)
+        ]
+
+    def iter_tables(
+        self,
+        columns: List[str] = None,
+        filters: Dict[str, PartitionFilter] = None,
+        as_strings: bool = False,
+    ) -> Iterator[pa.Table]:
+        """
+        Yields one Arrow table per blob, in the order of the listing. At most
+        `2 * max_workers` blobs are held in memory ahead of the consumer.
+
+        Args:
+            columns (list): Optional. Columns to read, including partition columns.
+            filters (dict): Optional. `{partition_column: filter}`, where a filter is a
+                value, a list of values or a predicate on the value (a str).
+            as_strings (bool): read every column as string instead of inferring types.
+        """
+        return self.iter_blobs(self.list_blobs(filters), columns, as_strings)
+
+    def iter_blobs(
+        self, blobs: List, columns: List[str] = None, as_strings: bool = False
+    ) -> Iterator[pa.Table]:
+        """
+        Yields one Arrow table per blob of `blobs`, already listed. See `iter_tables`.
+        """
+
+        def read(blob) -> pa.Table:
+            return parse_blob(blob.download_as_bytes(), blob.name, columns, as_strings)
+
+        return self._iter(blobs, read)
+
+    def _iter(self, blobs: List, read: Callable) -> Iterator:
+        """
+        Yields `read(blob)` for each blob, read by `max_workers` threads.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque()
+            for blob in blobs:
+                pending.append(executor.submit(read, blob))
+                if len(pending) >= 2 * self.max_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def read(
+        self,
+        columns: List[str] = None,
+        filters: Dict[str, PartitionFilter] = None,
+        as_strings: bool = False,
+    ) -> pa.Table:
+        """
+        Reads the matching blobs into a single Arrow table. See `iter_tables`.
+        """
+        tables = list(self.iter_tables(columns, filters, as_strings))
+        if not tables:
+            raise FileNotFoundError(
+                f"No blobs in gs://{self.bucket}/{self.prefix} match {filters}"
+            )
+        return concat_tables(tables)
+
+    def read_pandas(
+        self, columns: List[str] = None, filters: Dict[str, PartitionFilter] = None
+    ) -> pd.DataFrame:
+        """
+        Reads the matching blobs into a single DataFrame, parsing each blob with pandas.
+        See `iter_tables`.
+        """
+
+        def read(blob) -> pd.DataFrame:
+            return parse_blob_pandas(blob.download_as_bytes(), blob.name, columns)
+
+        dataframes = list(self._iter(self.list_blobs(filters), read))
+        if not dataframes:
+            raise FileNotFoundError(
+                f"No blobs in gs://{self.bucket}/{self.prefix} match {filters}"
+            )
+        return pd.concat(dataframes, ignore_index=True)
+
+
+def read_staging_table(
+    dataset_id: str,
+    table_id: str,
+    columns: List[str] = None,
+    filters: Dict[str, PartitionFilter] = None,
+    as_strings: bool = False,
+    max_workers: int = 8,
+) -> pa.Table:
+    """
+    Reads a table of the staging bucket as an Arrow table, e.g.
+    `read_staging_table("br_tse_eleicoes", "candidatos", ["ano", "sequencial"],
+    filters={"ano": [2018, 2022]}).to_pandas()`.
+    """
+    reader = StagingTableReader(dataset_id, table_id, max_workers=max_workers)
+    return reader.read(columns, filters, as_strings)
+
+
+def read_staging_dataframe(
+    dataset_id: str,
+    table_id: str,
+    columns: List[str] = None,
+    filters: Dict[str, PartitionFilter] = None,
+    max_workers: int = 8,
+) -> pd.DataFrame:
+    """
+    Reads a table of the staging bucket as a DataFrame, with the types inferred by
+    pandas for each blob. See `read_staging_table`.
+    """
+    reader = StagingTableReader(dataset_id, table_id, max_workers=max_workers)
+    return reader.read_pandas(columns, filters)
@@ -17,6 +17,7 @@ from prefect.backend import FlowRunView
 from prefect.client import Client
 
 from pipelines.constants import constants
+from pipelines.utils.uploader import upload_to_staging
 from pipelines.utils.utils import (
     create_update,
     dump_header_to_csv,
@@ -26,9 +27,11 @@ from pipelines.utils.utils import (
     get_credentials_utils,
     get_first_date,
     get_ids,
+    get_staging_table_source_format,
     get_token,
     log,
     parse_temporal_coverage,
+    update_staging_schema_from_parquet,
 )
 
 
@@ -40,6 +43,21 @@ def log_task(msg: Any, level: str = "info"):
     log(msg=msg, level=level)
 
 
+@task
+def get_staging_source_format(
+    dataset_id: str, table_id: str, default: str = "parquet"
+) -> str:
+    """
+    Returns the source format of the existing staging table, so that appended files
+    match it, or `default` for tables still to be created.
+    """
+    source_format = get_staging_table_source_format(dataset_id, table_id)
+    if source_format is None:
+        source_format = default
+    log(f"Staging files of {dataset_id}.{table_id} are written as {source_format}")
+    return source_format
+
+
 ##################
 #
 # Hashicorp Vault
@@ -77,7 +95,12 @@ def create_table_and_upload_to_gcs(
 ) -> None:
     """
     Create table using BD+ and upload to GCS.
+
+    `source_format` accepts csv or parquet. In parquet mode the header is built from
+    the parquet footer and the staging table gets the column types stored in it.
     """
+    if source_format not in ("csv", "parquet"):
+        raise ValueError(f"Invalid source format: {source_format}")
     bd_version = bd.__version__
     log(f"USING BASEDOSDADOS {bd_version}")
     # pylint: disable=C0103
@@ -116,6 +139,11 @@ def create_table_and_upload_to_gcs(
                 source_format=source_format,
             )
 
+            if source_format == "parquet":
+                update_staging_schema_from_parquet(
+                    dataset_id=dataset_id, table_id=table_id, data_path=header_path
+                )
+
             log(
                 "MODE APPEND: Sucessfully CREATED A NEW TABLE:\n"
                 f"{table_staging}\n"
@@ -155,7 +183,9 @@ def create_table_and_upload_to_gcs(
         # the header is needed to create a table when dosen't exist
         # in overwrite mode the header is always created
         log("MODE OVERWRITE: Table DOSEN'T EXISTS\n" + "Start to CREATE HEADER file")
-        header_path = dump_header_to_csv(data_path=data_path)
+        header_path = dump_header_to_csv(
+            data_path=data_path, source_format=source_format
+        )
         log("MODE OVERWRITE: Created HEADER file:\n" f"{header_path}")
 
         tb.create(
@@ -165,6 +195,11 @@ def create_table_and_upload_to_gcs(
             source_format=source_format,
         )
 
+        if source_format == "parquet":
+            update_staging_schema_from_parquet(
+                dataset_id=dataset_id, table_id=table_id, data_path=header_path
+            )
+
         log(
             "MODE OVERWRITE: Sucessfully CREATED TABLE\n"
             f"{table_staging}\n"
@@ -187,7 +222,7 @@ def create_table_and_upload_to_gcs(
     log("STARTING UPLOAD TO GCS")
     if tb.table_exists(mode="staging"):
         # the name of the files need to be the same or the data doesn't get overwritten
-        tb.append(filepath=data_path, if_exists="replace")
+        upload_to_staging(data_path=data_path, dataset_id=dataset_id, table_id=table_id)
 
         log(
             f"STEP UPLOAD: Successfully uploaded {data_path} to Storage:\n"
@@ -2,14 +2,13 @@
 """
 General purpose functions for the temporal_coverage_updater project
 """
-import json
 import re
 from datetime import datetime
 from typing import Tuple
 
 import basedosdados as bd
-import requests
 
+from pipelines.utils.metadata.client import get_metadata_client
 from pipelines.utils.temporal_coverage_updater.constants import (
     constants as temp_constants,
 )
@@ -124,22 +123,10 @@ def get_credentials(secret_path: str) -> Tuple[str, str]:
 
 
 def get_token(email, password):
-    r = requests.post(
-        "http://api.basedosdados.org/api/v1/graphql",
-        headers={"Content-Type": "application/json"},
-        json={
-            "query": """
-        mutation ($email: String!, $password: String!) {
-            tokenAuth(email: $email, password: $password) {
-                token
-            }
-        }
-    """,
-            "variables": {"email": email, "password": password},
-        },
-    )
-    r.raise_for_status()
-    return r.json()["data"]["tokenAuth"]["token"]
+    """
+    Get api token. The token is cached by the shared metadata client until it expires.
+    """
+    return get_metadata_client(email, password).token
 
 
 def get_id(
@@ -147,87 +134,21 @@ def get_id(
     query_parameters,
     email,
     password,
-):  # sourcery skip: avoid-builtin-shadow
-    # email = temp_constants.EMAIL.value
-    # password = temp_constants.PASSWORD.value
-    # backend = b.Backend(graphql_url="http://api.basedosdados.org/api/v1/graphql")
-    token = get_token(email, password)
-    header = {
-        "Authorization": f"Bearer {token}",
-    }
-    _filter = ", ".join(list(query_parameters.keys()))
-    keys = [
-        parameter.replace("$", "").split(":")[0]
-        for parameter in list(query_parameters.keys())
-    ]
-    values = list(query_parameters.values())
-    _input = ", ".join([f"{key}:${key}" for key in keys])
-
-    query = f"""query({_filter}) {{
-                        {query_class}({_input}){{
-                        edges{{
-                            node{{
-                            id,
-                            }}
-                        }}
-                        }}
-                    }}"""
-    r = requests.post(
-        url="https://api.basedosdados.org/api/v1/graphql",
-        json={"query": query, "variables": dict(zip(keys, values))},
-        headers=header,
-    ).json()
-
-    if "data" in r and r is not None:
-        if r.get("data", {}).get(query_class, {}).get("edges") == []:
-            id = None
-            # print(f"get: not found {query_class}", dict(zip(keys, values)))
-        else:
-            id = r["data"][query_class]["edges"][0]["node"]["id"]
-            # print(f"get: found {id}")
-            id = id.split(":")[1]
-        return r, id
-    else:
-        print("get:  Error:", json.dumps(r, indent=4, ensure_ascii=False))
-        raise Exception("get: Error")
-
-
-def get_date(
-    query_class, query_parameters, email, password
-):  # sourcery skip: avoid-builtin-shadow
-    # email = temp_constants.EMAIL.value
-    # password = temp_constants.PASSWORD.value
-    # backend = b.Backend(graphql_url="http://api.basedosdados.org/api/v1/graphql")
-    token = get_token(email=email, password=password)
-    header = {
-        "Authorization": f"Bearer {token}",
-    }
-    _filter = ", ".join(list(query_parameters.keys()))
-    keys = [
-        parameter.replace("$", "").split(":")[0]
-        for parameter in list(query_parameters.keys())
-    ]
-    values = list(query_parameters.values())
-    _input = ", ".join([f"{key}:${key}" for key in keys])
-
-    query = f"""query({_filter}) {{
-                        {query_class}({_input}){{
-                        edges{{
-                            node{{
-                            startYear,
-                            startMonth,
-                            startDay,
-                            interval,
-                            }}
-                        }}
-                        }}
-                    }}"""
-    r = requests.post(
-        url="https://api.basedosdados.org/api/v1/graphql",
-        json={"query": query, "variables": dict(zip(keys, values))},
-        headers=header,
-    ).json()
-    return r
+):
+    """
+    Returns the response and the ID of the first `query_class` node matching
+    `query_parameters`. IDs are memoized by the shared metadata client.
+    """
+    return get_metadata_client(email, password).get_id(
+        query_class, query_parameters, cloud_table=False
+    )
+
+
+def get_date(query_class, query_parameters, email, password):
+    """
+    Returns the start date and interval of the `query_class` nodes.
+    """
+    return get_metadata_client(email, password).get_date(query_class, query_parameters)
 
 
 def create_update(
@@ -239,71 +160,17 @@ def create_update(
     query_parameters,
     update=False,
 ):
-    # email = temp_constants.EMAIL.value
-    # password = temp_constants.PASSWORD.value
-    # backend = b.Backend(graphql_url="http://api.basedosdados.org/api/v1/graphql")
-    token = get_token(email=email, password=password)
-    header = {
-        "Authorization": f"Bearer {token}",
-    }
-
-    r, id = get_id(
+    """
+    Creates the `mutation_class` object unless the `query_class` lookup finds it, in
+    which case it is only changed when `update` is True.
+    """
+    return get_metadata_client(email, password).create_update(
+        mutation_class=mutation_class,
+        mutation_parameters=mutation_parameters,
         query_class=query_class,
         query_parameters=query_parameters,
-        email=email,
-        password=password,
+        update=update,
     )
-    if id is not None:
-        r["r"] = "query"
-        if update is False:
-            return r, id
-
-    _classe = mutation_class.replace("CreateUpdate", "").lower()
-    query = f"""
-                mutation($input:{mutation_class}Input!){{
-                    {mutation_class}(input: $input){{
-                    errors {{
-                        field,
-                        messages
-                    }},
-                    clientMutationId,
-                    {_classe} {{
-                        id,
-                    }}
-                }}
-                }}
-            """
-
-    if update is True and id is not None:
-        mutation_parameters["id"] = id
-    r = requests.post(
-        "https://api.basedosdados.org/api/v1/graphql",
-        json={"query": query, "variables": {"input": mutation_parameters}},
-        headers=header,
-    ).json()
-
-    r["r"] = "mutation"
-    if "data" in r and r is not None:
-        if r.get("data", {}).get(mutation_class, {}).get("errors", []) != []:
-            print(f"create: not found {mutation_class}", mutation_parameters)
-            print("create: error\n", json.dumps(r, indent=4, ensure_ascii=False), "\n")
-            id = None
-            raise Exception("create: Error")
-        else:
-            id = r["data"][mutation_class][_classe]["id"]
-            # print(f"create: created {id}")
-            id = id.split(":")[1]
-
-            return r, id
-    else:
-        print("\n", "create: query\n", query, "\n")
-        print(
-            "create: input\n",
-            json.dumps(mutation_parameters, indent=4, ensure_ascii=False),
-            "\n",
-        )
-        print("create: error\n", json.dumps(r, indent=4, ensure_ascii=False), "\n")
-        raise Exception("create: Error")
 
 
 def parse_temporal_coverage(temporal_coverage):
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel upload of local (hive partitioned) folders to Google Cloud Storage.
+"""
+import base64
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+import basedosdados as bd
+import google_crc32c
+from google.cloud import storage
+from google.cloud.storage.retry import DEFAULT_RETRY
+
+from pipelines.utils.utils import human_readable, log
+
+UPLOAD_SUFFIXES = (".csv", ".parquet")
+
+
+def list_files_to_upload(path: Union[str, Path], prefix: str) -> List[Tuple[Path, str]]:
+    """
+    Walks a file or a hive partitioned folder and returns `(filepath, blob_name)` for
+    every csv or parquet file, keeping the partition folders in the blob name.
+    """
+    path = Path(path)
+    prefix = prefix.rstrip("/")
+    if not path.is_dir():
+        return [(path, f"{prefix}/{path.name}")]
+
+    files = []
+    for filepath in sorted(path.rglob("*")):
+        if filepath.is_file() and filepath.suffix in UPLOAD_SUFFIXES:
+            files.append(
+                (filepath, f"{prefix}/{filepath.relative_to(path).as_posix()}")
+            )
+    return files
+
+
+def crc32c_checksum(filepath: Union[str, Path], chunk_size: int = 8 * 1024 * 1024):
+    """
+    Returns the base64 encoded CRC32C of a file, as reported by `Blob.crc32c`.
+    """
+    checksum = google_crc32c.Checksum()
+    with open(filepath, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            checksum.update(chunk)
+    return base64.b64encode(checksum.digest()).decode("utf-8")
+
+
+def _upload_file(
+    bucket: storage.Bucket,
+    filepath: Path,
+    blob_name: str,
+    remote_checksum: str,
+    resumable_threshold: int,
+    chunk_size: int,
+) -> Tuple[str, int]:
+    """
+    Uploads a single file unless the blob already has the same CRC32C.
+    Files bigger than `resumable_threshold` are sent as chunked resumable uploads,
+    so a failed chunk is retried instead of the whole file.
+    """
+    size = filepath.stat().st_size
+    if remote_checksum is not None and remote_checksum == crc32c_checksum(filepath):
+        return "skipped", size
+
+    blob = bucket.blob(
+        blob_name, chunk_size=chunk_size if size > resumable_threshold else None
+    )
+    blob.upload_from_filename(str(filepath), checksum="crc32c", retry=DEFAULT_RETRY)
+    return "uploaded", size
+
+
+def upload_files_to_gcs(
+    path: Union[str, Path],
+    bucket_name: str,
+    prefix: str,
+    client: storage.Client = None,
+    max_workers: int = 8,
+    skip_unchanged: bool = True,
+    resumable_threshold: int = 8 * 1024 * 1024,
+    chunk_size: int = 64 * 1024 * 1024,
+) -> Dict[str, int]:
+    """
+    Uploads a file or a hive partitioned folder to `gs://<bucket_name>/<prefix>/` using
+    a bounded thread pool.
+
+    Args:
+        path (str, pathlib.Path): file or folder to be uploaded.
+        bucket_name (str): destination bucket.
+        prefix (str): blob prefix, e.g. `staging/<dataset_id>/<table_id>`.
+        client (google.cloud.storage.Client): Optional. Any client works, including one
+            pointed to a local fake GCS server through `client_options={"api_endpoint": ...}`.
+        max_workers (int): number of files uploaded at the same time.
+        skip_unchanged (bool): skip files whose blob already has the same CRC32C, so a
+            retried task only sends what is missing.
+        resumable_threshold (int): files bigger than this (in bytes) use resumable uploads.
+        chunk_size (int): resumable upload chunk size. Must be a multiple of 256 KB.
+
+    Returns:
+        dict: number of uploaded and skipped files and uploaded bytes.
+    """
+    client = client or storage.Client()
+    bucket = client.bucket(bucket_name)
+    files = list_files_to_upload(path, prefix)
+
+    remote_checksums = {}
+    if skip_unchanged:
+        remote_checksums = {
+            blob.name: blob.crc32c
+            for blob in client.list_blobs(bucket_name, prefix=prefix.rstrip("/") + "/")
+        }
+
+    metrics = {"uploaded": 0, "skipped": 0, "bytes": 0}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                _upload_file,
+                bucket,
+                filepath,
+                blob_name,
+                remote_checksums.get(blob_name),
+                resumable_threshold,
+                chunk_size,
+            ): blob_name
+            for filepath, blob_name in files
+        }
+        for future in as_completed(futures):
+            status, size = future.result()
+            metrics[status] += 1
+            if status == "uploaded":
+                metrics["bytes"] += size
+
+    elapsed = time.perf_counter() - start
+    throughput = metrics["bytes"] / elapsed if elapsed > 0 else 0
+    log(
+        f"Uploaded {metrics['uploaded']} files "
+        f"({human_readable(metrics['bytes'], unit='B', unit_divider=1024)}) "
+        f"to gs://{bucket_name}/{prefix} in {elapsed:.1f}s "
+        f"({human_readable(throughput, unit='B/s', unit_divider=1024)}); "
+        f"skipped {metrics['skipped']} unchanged files"
+    )
+    return metrics
+
+
+def upload_to_staging(
+    data_path: Union[str, Path],
+    dataset_id: str,
+    table_id: str,
+    max_workers: int = 8,
+    skip_unchanged: bool = True,
+) -> Dict[str, int]:
+    """
+    Uploads `data_path` to the staging folder of a BD+ table, with the same blob names
+    as `bd.Table.append`.
+    """
+    st = bd.Storage(dataset_id=dataset_id, table_id=table_id)
+    return upload_files_to_gcs(
+        path=data_path,
+        bucket_name=st.bucket_name,
+        prefix=f"staging/{dataset_id}/{table_id}",
+        client=st.client["storage_staging"],
+        max_workers=max_workers,
+        skip_unchanged=skip_unchanged,
+    )
@@ -8,11 +8,13 @@ import json
 # pylint: disable=too-many-arguments
 import logging
 import re
+import zipfile
+from collections import OrderedDict
 from datetime import datetime
 from os import getenv, walk
 from os.path import join
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 from uuid import uuid4
 
 import basedosdados as bd
@@ -21,8 +23,10 @@ import hvac
 import numpy as np
 import pandas as pd
 import prefect
+import pyarrow as pa
+import pyarrow.parquet as pq
 import requests
-from google.cloud import storage
+from google.cloud import bigquery, storage
 from google.cloud.storage.blob import Blob
 from google.oauth2 import service_account
 from prefect.client import Client
@@ -31,6 +35,7 @@ from prefect.run_configs import KubernetesRun, VertexRun
 from redis_pal import RedisPal
 
 from pipelines.constants import constants
+from pipelines.utils.metadata.client import get_metadata_client
 
 
 def log(msg: Any, level: str = "info") -> None:
@@ -347,17 +352,44 @@ def remove_columns_accents(dataframe: pd.DataFrame) -> list:
 
 
 def to_partitions(
-    data: pd.DataFrame,
+    data: Union[pd.DataFrame, Iterable[pd.DataFrame], pa.RecordBatchReader],
     partition_columns: List[str],
     savepath: str,
     file_type: str = "csv",
+    max_open_files: int = 64,
+    compression: str = "snappy",
+    basename: str = "data",
+    encoding: str = "utf-8",
+    schema: pa.Schema = None,
 ):
     """Save data in to hive patitions schema, given a dataframe and a list of partition columns.
+    Rows are grouped in a single pass. Existing data is never overwritten: csv partitions
+    are appended to `data.csv`, and parquet partitions get a new `data{i}.parquet` file,
+    numbered after the files already in the partition. Remove the partitions first to
+    replace their data.
+
+    `data` may also be an iterator of dataframe chunks (e.g. `pd.read_csv(..., chunksize=...)`)
+    or a `pyarrow.RecordBatchReader`. Chunks are routed to per-partition writers that stay
+    open between chunks, so memory is bounded by one chunk plus `max_open_files` writers.
+    When the least recently used writer is closed, parquet partitions continue in the
+    next `data{i}.parquet` file. The parquet schema is `schema` or the schema of the
+    first chunk, promoted when a later chunk does not fit it (e.g. strings in a column
+    that was all null).
+
+    `basename` replaces the `data` file name, e.g. to let several workers write their own
+    files to the same partitions.
     Args:
-        data (pandas.core.frame.DataFrame): Dataframe to be partitioned.
+        data (pandas.core.frame.DataFrame): Dataframe, iterator of dataframes or
+            pyarrow.RecordBatchReader to be partitioned.
         partition_columns (list): List of columns to be used as partitions.
         savepath (str, pathlib.PosixPath): folder path to save the partitions.
         file_type (str): default to csv. Accepts parquet.
+        max_open_files (int): maximum number of partition files kept open when streaming chunks.
+        compression (str): parquet codec, default to snappy. Accepts zstd, gzip or none.
+        basename (str): name of the partition files, without extension. Default to data.
+        encoding (str): csv encoding, default to utf-8.
+        schema (pyarrow.Schema): Optional. Schema of the parquet files written from
+            chunks, without the partition columns.
     Exemple:
         data = {
             "ano": [2020, 2021, 2020, 2021, 2020, 2021, 2021,2025],
@@ -371,55 +403,346 @@ def to_partitions(
             savepath='partitions/',
         )
     """
-
+    savepath = Path(savepath)
     if isinstance(data, (pd.core.frame.DataFrame)):
-        savepath = Path(savepath)
-        # create unique combinations between partition columns
-        unique_combinations = (
-            data[partition_columns]
-            # .astype(str)
-            .drop_duplicates(subset=partition_columns).to_dict(orient="records")
+        if file_type == "csv":
+            _write_csv_partitions(
+                data, partition_columns, savepath, basename=basename, encoding=encoding
+            )
+        elif file_type == "parquet":
+            _write_parquet_partitions(
+                data, partition_columns, savepath, compression, basename=basename
+            )
+    elif isinstance(data, pa.RecordBatchReader):
+        _write_chunked_partitions(
+            (batch.to_pandas() for batch in data),
+            partition_columns,
+            savepath,
+            file_type,
+            max_open_files,
+            compression,
+            basename=basename,
+            encoding=encoding,
+            schema=schema,
+        )
+    elif isinstance(data, Iterable) and not isinstance(data, (str, bytes)):
+        _write_chunked_partitions(
+            data,
+            partition_columns,
+            savepath,
+            file_type,
+            max_open_files,
+            compression,
+            basename=basename,
+            encoding=encoding,
+            schema=schema,
+        )
+    else:
+        raise BaseException(
+            "Data need to be a pandas DataFrame, an iterator of DataFrames "
+            "or a pyarrow RecordBatchReader"
         )
 
-        for filter_combination in unique_combinations:
-            patitions_values = [
-                f"{partition}={value}"
-                for partition, value in filter_combination.items()
-            ]
 
-            # get filtered data
-            df_filter = data.loc[
-                data[filter_combination.keys()]
-                .isin(filter_combination.values())
-                .all(axis=1),
-                :,
+def _partition_path(partition_columns: List[str], values: tuple) -> str:
+    """
+    Builds the hive path (`col=value/col=value`) of a partition.
+    """
+    return "/".join(
+        f"{partition}={value}" for partition, value in zip(partition_columns, values)
+    )
+
+
+def _iter_partitions(data: pd.DataFrame, partition_columns: List[str]):
+    """
+    Yields `(hive_path, dataframe)` for every partition of `data`, grouping the
+    rows in a single pass instead of masking the whole dataframe once per partition.
+    """
+    grouped = data.groupby(partition_columns, sort=False, dropna=False, observed=True)
+    for values, group in grouped:
+        if not isinstance(values, tuple):
+            values = (values,)
+        yield _partition_path(partition_columns, values), group.drop(
+            columns=partition_columns
+        )
+
+
+def _write_csv_partitions(
+    data: pd.DataFrame,
+    partition_columns: List[str],
+    savepath: Path,
+    buffer_size: int = 8 * 1024 * 1024,
+    basename: str = "data",
+    encoding: str = "utf-8",
+) -> None:
+    """
+    Appends every partition of `data` to its `<basename>.csv`, writing the header only
+    when the file is created.
+    """
+    for partition_path, df_partition in _iter_partitions(data, partition_columns):
+        filter_save_path = savepath / partition_path
+        filter_save_path.mkdir(parents=True, exist_ok=True)
+        file_filter_save_path = filter_save_path / f"{basename}.csv"
+        header = not file_filter_save_path.exists()
+        with open(
+            file_filter_save_path,
+            mode="a",
+            encoding=encoding,
+            newline="",
+            buffering=buffer_size,
+        ) as file:
+            df_partition.to_csv(file, sep=",", na_rep="", index=False, header=header)
+
+
+def _write_parquet_partitions(
+    data: pd.DataFrame,
+    partition_columns: List[str],
+    savepath: Path,
+    compression: str = "snappy",
+    basename: str = "data",
+) -> None:
+    """
+    Writes every partition of `data` to a new `<basename>{i}.parquet`, numbered after
+    the files already in the partition like the chunked writes. All the files share
+    the schema of the whole dataframe.
+    """
+    schema = pa.Schema.from_pandas(
+        data.drop(columns=partition_columns), preserve_index=False
+    )
+    # every partition is written at once, so a single open file is enough
+    _write_chunked_partitions(
+        [data],
+        partition_columns,
+        savepath,
+        "parquet",
+        max_open_files=1,
+        compression=compression,
+        basename=basename,
+        schema=schema,
+    )
+
+
+def _promote_type(current: pa.DataType, new: pa.DataType) -> pa.DataType:
+    """
+    Returns a type able to hold values of both `current` and `new`: the non-null one,
+    float64 for mixed numbers and string otherwise.
+    """
+    if current.equals(new) or pa.types.is_null(new):
+        return current
+    if pa.types.is_null(current):
+        return new
+    numbers = (pa.types.is_integer, pa.types.is_floating)
+    if any(kind(current) for kind in numbers) and any(kind(new) for kind in numbers):
+        if pa.types.is_integer(current) and pa.types.is_integer(new):
+            return pa.int64()
+        return pa.float64()
+    return pa.string()
+
+
+class _PartitionWriters:
+    """
+    Keeps at most `max_open_files` partition files open, closing the least recently
+    used one when a new partition shows up.
+
+    Parquet files share the schema of the first chunk (or `schema`). Chunks are cast to
+    it, and when a chunk does not fit (e.g. strings after an all-null column, or NaN
+    after integers) the schema is promoted, the open files are closed and the files
+    written with the previous schema are rewritten with the promoted one on `finish`.
+    """
+
+    def __init__(
+        self,
+        savepath: Path,
+        file_type: str,
+        max_open_files: int,
+        compression: str = "snappy",
+        buffer_size: int = 1024 * 1024,
+        basename: str = "data",
+        encoding: str = "utf-8",
+        schema: pa.Schema = None,
+    ):
+        if file_type not in ("csv", "parquet"):
+            raise ValueError(f"Invalid file type: {file_type}")
+        self.savepath = savepath
+        self.file_type = file_type
+        self.max_open_files = max(1, max_open_files)
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.basename = basename
+        self.encoding = encoding
+        self.schema: Optional[pa.Schema] = schema
+        self._writers: OrderedDict = OrderedDict()
+        self._next_file: Dict[str, int] = {}
+        self._file_schemas: Dict[Path, pa.Schema] = {}
+
+    def write(self, partition_path: str, dataframe: pd.DataFrame) -> None:
+        """
+        Writes `dataframe` to the partition, opening its file if needed.
+        """
+        if self.file_type == "parquet":
+            table = self._to_table(dataframe)
+        writer = self._writers.pop(partition_path, None)
+        if writer is None:
+            if len(self._writers) >= self.max_open_files:
+                _, lru_writer = self._writers.popitem(last=False)
+                lru_writer.close()
+            writer = self._open(partition_path)
+        self._writers[partition_path] = writer
+
+        if self.file_type == "csv":
+            dataframe.to_csv(
+                writer, sep=",", na_rep="", index=False, header=writer.tell() == 0
+            )
+        else:
+            writer.write_table(table)
+
+    def _to_table(self, dataframe: pd.DataFrame) -> pa.Table:
+        table = pa.Table.from_pandas(dataframe, preserve_index=False)
+        if self.schema is None:
+            self.schema = table.schema
+            return table
+        if table.schema.names != self.schema.names:
+            raise ValueError(
+                f"Chunk columns {table.schema.names} differ from {self.schema.names}"
+            )
+        try:
+            return table.cast(self.schema)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            pass
+        schema = pa.schema(
+            [
+                field.with_type(_promote_type(field.type, new.type))
+                for field, new in zip(self.schema, table.schema)
+            ],
+        )
+        log(f"Promoting the parquet schema from {self.schema} to {schema}", "warning")
+        # open files keep the previous schema, the next chunks go to new files
+        self.close()
+        self.schema = schema
+        return table.cast(schema)
+
+    def _open(self, partition_path: str):
+        folder = self.savepath / partition_path
+        folder.mkdir(parents=True, exist_ok=True)
+        if self.file_type == "csv":
+            return open(  # pylint: disable=consider-using-with
+                folder / f"{self.basename}.csv",
+                mode="a",
+                encoding=self.encoding,
+                newline="",
+                buffering=self.buffer_size,
+            )
+
+        if partition_path not in self._next_file:
+            # continue after the files written by previous calls, like csv appends
+            pattern = re.compile(rf"{re.escape(self.basename)}(\d+)\.parquet")
+            numbers = [
+                int(match.group(1))
+                for match in map(pattern.fullmatch, (f.name for f in folder.iterdir()))
+                if match
             ]
-            df_filter = df_filter.drop(columns=partition_columns)
-
-            # create folder tree
-            filter_save_path = Path(savepath / "/".join(patitions_values))
-            filter_save_path.mkdir(parents=True, exist_ok=True)
-
-            if file_type == "csv":
-                # append data to csv
-                file_filter_save_path = Path(filter_save_path) / "data.csv"
-                df_filter.to_csv(
-                    file_filter_save_path,
-                    sep=",",
-                    encoding="utf-8",
-                    na_rep="",
-                    index=False,
-                    mode="a",
-                    header=not file_filter_save_path.exists(),
-                )
-            elif file_type == "parquet":
-                # append data to parquet
-                file_filter_save_path = Path(filter_save_path) / "data.parquet"
-                df_filter.to_parquet(
-                    file_filter_save_path, index=False, compression="gzip"
-                )
-    else:
-        raise BaseException("Data need to be a pandas DataFrame")
+            self._next_file[partition_path] = max(numbers, default=-1) + 1
+        file_number = self._next_file[partition_path]
+        self._next_file[partition_path] = file_number + 1
+        path = folder / f"{self.basename}{file_number}.parquet"
+        self._file_schemas[path] = self.schema
+        return pq.ParquetWriter(str(path), self.schema, compression=self.compression)
+
+    def close(self) -> None:
+        """
+        Closes every open writer.
+        """
+        while self._writers:
+            _, writer = self._writers.popitem(last=False)
+            writer.close()
+
+    def finish(self) -> None:
+        """
+        Closes every open writer and rewrites the parquet files written before the
+        schema was promoted, so that all of them share the final schema.
+        """
+        self.close()
+        for path, schema in self._file_schemas.items():
+            if not schema.equals(self.schema, check_metadata=False):
+                table = pq.read_table(path).cast(self.schema)
+                pq.write_table(table, path, compression=self.compression)
+        self._file_schemas = {}
+
+
+def _write_chunked_partitions(
+    chunks: Iterable[pd.DataFrame],
+    partition_columns: List[str],
+    savepath: Path,
+    file_type: str,
+    max_open_files: int,
+    compression: str = "snappy",
+    basename: str = "data",
+    encoding: str = "utf-8",
+    schema: pa.Schema = None,
+) -> None:
+    """
+    Routes every chunk to its partition writers, holding a single chunk in memory.
+    """
+    writers = _PartitionWriters(
+        savepath,
+        file_type,
+        max_open_files,
+        compression,
+        basename=basename,
+        encoding=encoding,
+        schema=schema,
+    )
+    try:
+        for chunk in chunks:
+            for partition_path, df_partition in _iter_partitions(
+                chunk, partition_columns
+            ):
+                writers.write(partition_path, df_partition)
+    finally:
+        writers.close()
+    writers.finish()
+
+
+def list_zip_members(
+    path: Union[str, Path], suffix: str = ".csv"
+) -> List[Tuple[Path, str]]:
+    """
+    Returns `(zip_path, member)` for every member ending with `suffix` (case
+    insensitive) of a zip file, or of every zip file in a folder.
+    """
+    path = Path(path)
+    zip_paths = sorted(path.glob("*.zip")) if path.is_dir() else [path]
+    members = []
+    for zip_path in zip_paths:
+        with zipfile.ZipFile(zip_path) as archive:
+            members.extend(
+                (zip_path, name)
+                for name in archive.namelist()
+                if name.lower().endswith(suffix.lower())
+            )
+    return members
+
+
+def read_csv_from_zip(
+    zip_path: Union[str, Path], member: str, **read_csv_kwargs
+) -> pd.DataFrame:
+    """
+    Reads a csv member of a zip file without extracting it. Accepts the same keyword
+    arguments as `pd.read_csv`, including `encoding`, which is decoded on the fly.
+    """
+    with zipfile.ZipFile(zip_path) as archive, archive.open(member) as file:
+        return pd.read_csv(file, **read_csv_kwargs)
+
+
+def iter_csv_from_zip(
+    zip_path: Union[str, Path], member: str, chunksize: int, **read_csv_kwargs
+) -> Iterable[pd.DataFrame]:
+    """
+    Yields chunks of `chunksize` rows of a csv member of a zip file, streaming it
+    straight from the archive. Accepts the same keyword arguments as `pd.read_csv`.
+    """
+    with zipfile.ZipFile(zip_path) as archive, archive.open(member) as file:
+        yield from pd.read_csv(file, chunksize=chunksize, **read_csv_kwargs)
 
 
 ###############
@@ -478,6 +801,8 @@ def dump_header_to_csv(data_path: Union[str, Path], source_format: str):
         The function will search for either a CSV or Parquet file in the provided data_path.
         If the file is found, it will read the first row (header) and save it to a new file
         with the format 'header.csv' for CSV files and 'header.parquet' for Parquet files.
+        Parquet headers are built from the file footer only: 'header.parquet' is an empty
+        file carrying the original schema.
         If the data_path contains partition folders (folders with '=' in their names), the
         header file will be saved in a corresponding partition path under a 'data' directory.
     """
@@ -542,16 +867,97 @@ def dump_header_to_csv(data_path: Union[str, Path], source_format: str):
         # Write dataframe to CSV
         dataframe.to_csv(save_header_file_path, index=False, encoding="utf-8")
     elif source_format == "parquet":
-        dataframe = pd.read_parquet(file)
-        dataframe = dataframe.head(1)
-
-        # Write dataframe to Parquet
-        dataframe.to_parquet(save_header_file_path, index=False)
+        # Only the footer is read: the header is an empty file with the same schema
+        schema = get_parquet_schema(file)
+        pq.write_table(schema.empty_table(), save_header_file_path)
 
-    log(f"Wrote header Parquet: {save_header_file_path}")
+    log(f"Wrote header {source_format}: {save_header_file_path}")
     return save_header_path
 
 
+def get_parquet_schema(data_path: Union[str, Path]) -> pa.Schema:
+    """
+    Reads the schema of a parquet file from its footer, without reading any row.
+    If `data_path` is a directory, the first parquet file found in it is used.
+    """
+    path = Path(data_path)
+    if path.is_dir():
+        path = next(iter(sorted(path.rglob("*.parquet"))), None)
+        if path is None:
+            raise FileNotFoundError(f"No parquet file found in {data_path}")
+    return pq.read_schema(path)
+
+
+def parquet_schema_to_bigquery_types(schema: pa.Schema) -> Dict[str, str]:
+    """
+    Maps every column of a parquet schema to its BigQuery type.
+    Types without a direct equivalent are mapped to STRING.
+    """
+    bigquery_types = {}
+    for field in schema:
+        field_type = field.type
+        if pa.types.is_dictionary(field_type):
+            field_type = field_type.value_type
+
+        if pa.types.is_boolean(field_type):
+            bigquery_type = "BOOL"
+        elif pa.types.is_integer(field_type):
+            bigquery_type = "INT64"
+        elif pa.types.is_floating(field_type):
+            bigquery_type = "FLOAT64"
+        elif pa.types.is_decimal(field_type):
+            bigquery_type = "NUMERIC" if field_type.precision <= 38 else "BIGNUMERIC"
+        elif pa.types.is_date(field_type):
+            bigquery_type = "DATE"
+        elif pa.types.is_timestamp(field_type):
+            bigquery_type = "TIMESTAMP" if field_type.tz else "DATETIME"
+        elif pa.types.is_time(field_type):
+            bigquery_type = "TIME"
+        elif pa.types.is_binary(field_type) or pa.types.is_large_binary(field_type):
+            bigquery_type = "BYTES"
+        else:
+            bigquery_type = "STRING"
+        bigquery_types[field.name] = bigquery_type
+    return bigquery_types
+
+
+def update_staging_schema_from_parquet(
+    dataset_id: str, table_id: str, data_path: Union[str, Path]
+) -> None:
+    """
+    Replaces the all-STRING schema that BD+ gives to staging tables with the
+    types stored in the parquet footer. Partition columns are kept as they are.
+    """
+    bigquery_types = parquet_schema_to_bigquery_types(get_parquet_schema(data_path))
+    tb = bd.Table(dataset_id=dataset_id, table_id=table_id)
+    client = tb.client["bigquery_staging"]
+    table = client.get_table(tb.table_full_name["staging"])
+    table.schema = [
+        bigquery.SchemaField(
+            name=field.name,
+            field_type=bigquery_types.get(field.name, field.field_type),
+            mode=field.mode,
+            description=field.description,
+        )
+        for field in table.schema
+    ]
+    client.update_table(table, ["schema"])
+    log(f"Updated staging schema of {dataset_id}.{table_id}: {bigquery_types}")
+
+
+def get_staging_table_source_format(dataset_id: str, table_id: str) -> Optional[str]:
+    """
+    Returns the source format (csv or parquet) of the files behind an existing staging
+    table, or None if the table does not exist.
+    """
+    tb = bd.Table(dataset_id=dataset_id, table_id=table_id)
+    if not tb.table_exists(mode="staging"):
+        return None
+    table = tb.client["bigquery_staging"].get_table(tb.table_full_name["staging"])
+    config = table.external_data_configuration
+    return config.source_format.lower() if config is not None else None
+
+
 def determine_whether_to_execute_or_not(
     cron_expression: str, datetime_now: datetime, datetime_last_execution: datetime
 ) -> bool:
@@ -832,43 +1238,9 @@ def get_credentials_utils(secret_path: str) -> Tuple[str, str]:
 
 def get_token(email, password, api_mode: str = "prod"):
     """
-    Get api token.
-    """
-    r = None
-    if api_mode == "prod":
-        r = requests.post(
-            "http://api.basedosdados.org/api/v1/graphql",
-            headers={"Content-Type": "application/json"},
-            json={
-                "query": """
-            mutation ($email: String!, $password: String!) {
-                tokenAuth(email: $email, password: $password) {
-                    token
-                }
-            }
-        """,
-                "variables": {"email": email, "password": password},
-            },
-        )
-
-        r.raise_for_status()
-    elif api_mode == "staging":
-        r = requests.post(
-            "http://staging.api.basedosdados.org/api/v1/graphql",
-            headers={"Content-Type": "application/json"},
-            json={
-                "query": """
-            mutation ($email: String!, $password: String!) {
-                tokenAuth(email: $email, password: $password) {
-                    token
-                }
-            }
-        """,
-                "variables": {"email": email, "password": password},
-            },
-        )
-        r.raise_for_status()
-    return r.json()["data"]["tokenAuth"]["token"]
+    Get api token. The token is cached by the shared metadata client until it expires.
+    """
+    return get_metadata_client(email, password, api_mode).token
 
 
 def get_id(
@@ -879,67 +1251,13 @@ def get_id(
     api_mode: str = "prod",
     cloud_table: bool = True,
 ):
-    token = get_token(email, password, api_mode)
-    header = {
-        "Authorization": f"Bearer {token}",
-    }
-    _filter = ", ".join(list(query_parameters.keys()))
-    keys = [
-        parameter.replace("$", "").split(":")[0]
-        for parameter in list(query_parameters.keys())
-    ]
-    values = list(query_parameters.values())
-    _input = ", ".join([f"{key}:${key}" for key in keys])
-
-    if cloud_table:
-        query = f"""query({_filter}) {{
-                            {query_class}({_input}){{
-                            edges{{
-                                node{{
-                                id,
-                                table{{
-                                    _id
-                                    }}
-                                }}
-                            }}
-                            }}
-                        }}"""
-    else:
-        query = f"""query({_filter}) {{
-                            {query_class}({_input}){{
-                            edges{{
-                                node{{
-                                id,
-                                }}
-                            }}
-                            }}
-                        }}"""
-
-    if api_mode == "staging":
-        r = requests.post(
-            url=f"https://{api_mode}.api.basedosdados.org/api/v1/graphql",
-            json={"query": query, "variables": dict(zip(keys, values))},
-            headers=header,
-        ).json()
-    elif api_mode == "prod":
-        r = requests.post(
-            url="https://api.basedosdados.org/api/v1/graphql",
-            json={"query": query, "variables": dict(zip(keys, values))},
-            headers=header,
-        ).json()
-
-    if "data" in r and r is not None:
-        if r.get("data", {}).get(query_class, {}).get("edges") == []:
-            id = None
-            # print(f"get: not found {query_class}", dict(zip(keys, values)))
-        else:
-            id = r["data"][query_class]["edges"][0]["node"]["id"]
-            # print(f"get: found {id}")
-            id = id.split(":")[1]
-        return r, id
-    else:
-        print("get:  Error:", json.dumps(r, indent=4, ensure_ascii=False))
-        raise Exception("get: Error")
+    """
+    Returns the response and the ID of the first `query_class` node matching
+    `query_parameters`. IDs are memoized by the shared metadata client.
+    """
+    return get_metadata_client(email, password, api_mode).get_id(
+        query_class, query_parameters, cloud_table=cloud_table
+    )
 
 
 def get_date(
@@ -949,51 +1267,12 @@ def get_date(
     password,
     api_mode: str = "prod",
 ):
-    token = get_token(
-        email=email,
-        password=password,
-        api_mode=api_mode,
+    """
+    Returns the start date and interval of the `query_class` nodes.
+    """
+    return get_metadata_client(email, password, api_mode).get_date(
+        query_class, query_parameters
     )
-    log("puxou token")
-    header = {
-        "Authorization": f"Bearer {token}",
-    }
-    log(f"{header}")
-    _filter = ", ".join(list(query_parameters.keys()))
-    keys = [
-        parameter.replace("$", "").split(":")[0]
-        for parameter in list(query_parameters.keys())
-    ]
-    values = list(query_parameters.values())
-    _input = ", ".join([f"{key}:${key}" for key in keys])
-
-    query = f"""query({_filter}) {{
-                        {query_class}({_input}){{
-                        edges{{
-                            node{{
-                            startYear,
-                            startMonth,
-                            startDay,
-                            interval,
-                            }}
-                        }}
-                        }}
-                    }}"""
-
-    if api_mode == "staging":
-        r = requests.post(
-            url=f"https://{api_mode}.api.basedosdados.org/api/v1/graphql",
-            json={"query": query, "variables": dict(zip(keys, values))},
-            headers=header,
-        ).json()
-    elif api_mode == "prod":
-        r = requests.post(
-            url="https://api.basedosdados.org/api/v1/graphql",
-            json={"query": query, "variables": dict(zip(keys, values))},
-            headers=header,
-        ).json()
-
-    return r
 
 
 def create_update(
@@ -1006,81 +1285,17 @@ def create_update(
     update=False,
     api_mode: str = "prod",
 ):
-    token = get_token(
-        email=email,
-        password=password,
-        api_mode=api_mode,
-    )
-    header = {
-        "Authorization": f"Bearer {token}",
-    }
-
-    r, id = get_id(
+    """
+    Creates the `mutation_class` object unless the `query_class` lookup finds it, in
+    which case it is only changed when `update` is True.
+    """
+    return get_metadata_client(email, password, api_mode).create_update(
+        mutation_class=mutation_class,
+        mutation_parameters=mutation_parameters,
         query_class=query_class,
         query_parameters=query_parameters,
-        email=email,
-        password=password,
-        cloud_table=False,
-        api_mode=api_mode,
+        update=update,
     )
-    if id is not None:
-        r["r"] = "query"
-        if update is False:
-            return r, id
-
-    _classe = mutation_class.replace("CreateUpdate", "").lower()
-    query = f"""
-                mutation($input:{mutation_class}Input!){{
-                    {mutation_class}(input: $input){{
-                    errors {{
-                        field,
-                        messages
-                    }},
-                    clientMutationId,
-                    {_classe} {{
-                        id,
-                    }}
-                }}
-                }}
-            """
-
-    if update is True and id is not None:
-        mutation_parameters["id"] = id
-
-        if api_mode == "prod":
-            r = requests.post(
-                "https://api.basedosdados.org/api/v1/graphql",
-                json={"query": query, "variables": {"input": mutation_parameters}},
-                headers=header,
-            ).json()
-        elif api_mode == "staging":
-            r = requests.post(
-                f"https://{api_mode}api.basedosdados.org/api/v1/graphql",
-                json={"query": query, "variables": {"input": mutation_parameters}},
-                headers=header,
-            ).json()
-
-    r["r"] = "mutation"
-    if "data" in r and r is not None:
-        if r.get("data", {}).get(mutation_class, {}).get("errors", []) != []:
-            print(f"create: not found {mutation_class}", mutation_parameters)
-            print("create: error\n", json.dumps(r, indent=4, ensure_ascii=False), "\n")
-            id = None
-            raise Exception("create: Error")
-        else:
-            id = r["data"][mutation_class][_classe]["id"]
-            id = id.split(":")[1]
-
-            return r, id
-    else:
-        print("\n", "create: query\n", query, "\n")
-        print(
-            "create: input\n",
-            json.dumps(mutation_parameters, indent=4, ensure_ascii=False),
-            "\n",
-        )
-        print("create: error\n", json.dumps(r, indent=4, ensure_ascii=False), "\n")
-        raise Exception("create: Error")
 
 
 def parse_temporal_coverage(temporal_coverage):
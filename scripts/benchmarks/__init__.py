@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for shared pipeline utilities. Run them with `python -m scripts.benchmarks.<name>`.
+"""
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the legacy 27-filters-per-chunk `process_csv_estabelecimentos` with the
+single-pass UF router on a synthetic file in the RFB Estabelecimentos format.
+
+Usage:
+    python -m scripts.benchmarks.cnpj_estabelecimentos --rows 2000000 --chunk-size 100000
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from pipelines.datasets.br_me_cnpj.constants import constants as constants_cnpj
+from pipelines.datasets.br_me_cnpj.utils import (
+    fill_left_zeros,
+    process_csv_estabelecimentos,
+)
+from pipelines.utils.utils import iter_csv_from_zip, list_zip_members
+
+UFS = constants_cnpj.UFS.value
+COLUNAS = constants_cnpj.COLUNAS_ESTABELECIMENTO.value
+MEMBER = "K3241.K03200Y0.D30610.ESTABELE"
+
+
+def legacy_process_csv_estabelecimentos(
+    zip_path: str, output_path: str, data_coleta: str, i: int, chunk_size: int
+):
+    """
+    The `process_csv_estabelecimentos` implementation that filters every chunk once
+    per UF and reopens the partition files on every chunk.
+    """
+    ordem = constants_cnpj.COLUNAS_ESTABELECIMENTO_ORDEM.value
+    save_path = f"{output_path}data={data_coleta}/"
+    for uf in UFS:
+        os.makedirs(os.path.join(save_path, f"sigla_uf={uf}"), exist_ok=True)
+    for _, nome_arquivo in list_zip_members(zip_path, suffix=""):
+        for chunk in iter_csv_from_zip(
+            zip_path,
+            nome_arquivo,
+            encoding="iso-8859-1",
+            sep=";",
+            header=None,
+            names=COLUNAS,
+            dtype=str,
+            chunksize=chunk_size,
+        ):
+            date_cols = [
+                "data_situacao_cadastral",
+                "data_inicio_atividade",
+                "data_situacao_especial",
+            ]
+            chunk[date_cols] = chunk[date_cols].apply(
+                pd.to_datetime, format="%Y%m%d", errors="coerce"
+            )
+            chunk[date_cols] = chunk[date_cols].apply(
+                lambda x: x.dt.strftime("%Y-%m-%d")
+            )
+            chunk = fill_left_zeros(chunk, "cnpj_basico", 8)
+            chunk = fill_left_zeros(chunk, "cnpj_ordem", 4)
+            chunk = fill_left_zeros(chunk, "cnpj_dv", 2)
+            chunk["cnpj"] = (
+                chunk["cnpj_basico"] + chunk["cnpj_ordem"] + chunk["cnpj_dv"]
+            )
+            chunk["id_municipio"] = ""
+            chunk = chunk.loc[:, ordem]
+            for uf in UFS:
+                df_particao = chunk[chunk["sigla_uf"] == uf].copy()
+                df_particao.drop(["sigla_uf"], axis=1, inplace=True)
+                particao_file_path = os.path.join(
+                    save_path, f"sigla_uf={uf}", f"estabelecimentos_{i}.csv"
+                )
+                mode = "a" if os.path.exists(particao_file_path) else "w"
+                df_particao.to_csv(
+                    particao_file_path,
+                    index=False,
+                    encoding="iso-8859-1",
+                    mode=mode,
+                    header=mode == "w",
+                )
+
+
+def synthetic_zip(path: Path, rows: int, seed: int = 42) -> Path:
+    """
+    Writes a zip with a `;` separated, quoted, latin-1 Estabelecimentos file.
+    """
+    rng = np.random.default_rng(seed)
+    dias = np.datetime64("1960-01-01") + rng.integers(0, 23000, rows)
+    datas = pd.Series(dias.astype("datetime64[D]").astype(str)).str.replace("-", "")
+    data = pd.DataFrame({coluna: "" for coluna in COLUNAS}, index=range(rows))
+    data["cnpj_basico"] = rng.integers(0, 99_999_999, rows).astype(str)
+    data["cnpj_ordem"] = rng.integers(1, 9999, rows).astype(str)
+    data["cnpj_dv"] = rng.integers(0, 99, rows).astype(str)
+    data["nome_fantasia"] = "PADARIA SÃO JOÃO"
+    data["situacao_cadastral"] = rng.choice(["02", "04", "08"], rows)
+    data["data_situacao_cadastral"] = np.where(rng.random(rows) < 0.1, "0", datas)
+    data["data_inicio_atividade"] = datas
+    data["cnae_fiscal_principal"] = rng.integers(1_000_000, 9_999_999, rows)
+    data["logradouro"] = "RUA DAS ACÁCIAS"
+    data["cep"] = rng.integers(1_000_000, 99_999_999, rows).astype(str)
+    data["sigla_uf"] = rng.choice(UFS, rows)
+    data["id_municipio_rf"] = rng.integers(1, 9999, rows).astype(str)
+    zip_path = path / "Estabelecimentos0.zip"
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(MEMBER, "w") as file:
+            data.to_csv(
+                file,
+                sep=";",
+                header=False,
+                index=False,
+                encoding="iso-8859-1",
+                quoting=1,
+            )
+    return zip_path
+
+
+def main():
+    """
+    Runs both implementations over the same synthetic file and prints their timings.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="cnpj_estabelecimentos_"))
+    try:
+        zip_path = synthetic_zip(workdir, args.rows)
+        print(
+            f"{args.rows:,} rows, {zip_path.stat().st_size / 1024**2:.1f} MiB zip, "
+            f"chunk_size={args.chunk_size:,}"
+        )
+        results = {}
+        for name, process in [
+            ("legacy", legacy_process_csv_estabelecimentos),
+            ("new", process_csv_estabelecimentos),
+        ]:
+            output_path = f"{workdir}/{name}/"
+            start = time.perf_counter()
+            process(str(zip_path), output_path, "2023-06-10", 0, args.chunk_size)
+            results[name] = time.perf_counter() - start
+            print(f"{name:>6}: {results[name]:.2f}s")
+        print(f"speedup: {results['legacy'] / results['new']:.1f}x")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the legacy per-cell cleaning of the CVM CDA files (strptime, applymap and
+`limpar_string` on every cell) with the vectorized helpers of `br_cvm_fi.utils`, on a
+synthetic month of the 8 CDA BLC files.
+
+Usage:
+    python -m scripts.benchmarks.cvm_cda --rows 1000000
+"""
+import argparse
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from pipelines.datasets.br_cvm_fi.constants import constants as cvm_constants
+from pipelines.datasets.br_cvm_fi.utils import (
+    check_and_create_column,
+    extrair_ano_mes,
+    limpar_colunas_ascii,
+    limpar_documentos,
+    limpar_string,
+    mapear_colunas,
+    trocar_virgula_decimal,
+)
+
+DOCUMENTOS = [
+    "CNPJ_FUNDO",
+    "CNPJ_INSTITUICAO_FINANC_COOBR",
+    "CPF_CNPJ_EMISSOR",
+    "CNPJ_EMISSOR",
+    "CNPJ_FUNDO_COTA",
+]
+# colunas originais das que são normalizadas em COLUNAS_ASCI, depois do rename
+TEXTO = [
+    "DENOM_SOCIAL",
+    "TP_APLIC",
+    "TP_ATIVO",
+    "DS_ATIVO",
+    "TP_NEGOC",
+    "TP_TITPUB",
+    "EMISSOR",
+    "DS_INDEXADOR_POSFX",
+    "AG_RISCO",
+    "GRAU_RISCO",
+    "PAIS",
+    "BV_MERC",
+    "CD_BV_MERC",
+]
+
+
+def legacy_clean(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The cleaning steps of `clean_data_make_partitions_cda` before vectorization.
+    """
+    df["ano"] = df["DT_COMPTC"].apply(lambda x: datetime.strptime(x, "%Y-%m-%d").year)
+    df["mes"] = df["DT_COMPTC"].apply(lambda x: datetime.strptime(x, "%Y-%m-%d").month)
+    df[cvm_constants.COLUNAS.value] = df[cvm_constants.COLUNAS.value].applymap(
+        lambda x: cvm_constants.MAPEAMENTO.value.get(x, x)
+    )
+    for coluna in DOCUMENTOS:
+        df[coluna] = df[coluna].str.replace(r"[/.-]", "", regex=True)
+    df = df.replace(",", ".", regex=True)
+    df[TEXTO] = df[TEXTO].fillna("")
+    df[TEXTO] = df[TEXTO].applymap(limpar_string)
+    return df
+
+
+def vectorized_clean(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The same steps with the vectorized helpers.
+    """
+    df = extrair_ano_mes(df)
+    df = mapear_colunas(df, cvm_constants.COLUNAS.value, cvm_constants.MAPEAMENTO.value)
+    df = limpar_documentos(df, DOCUMENTOS)
+    df = trocar_virgula_decimal(df)
+    df = limpar_colunas_ascii(df, TEXTO)
+    return df
+
+
+def synthetic_month(rows: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Builds the concatenation of the 8 CDA BLC files of a month, with the repetitive
+    text columns of the real files.
+    """
+    rng = np.random.default_rng(seed)
+    n_fundos = max(rows // 50, 1)
+    fundos = np.array([f"FUNDO DE INVESTIMENTO AÇÕES Nº {i}" for i in range(n_fundos)])
+    cnpjs = np.array(
+        [
+            f"{i:02d}.{i % 1000:03d}.{i % 777:03d}/0001-{i % 100:02d}"
+            for i in range(n_fundos)
+        ]
+    )
+    fundo = rng.integers(0, n_fundos, rows)
+    df = pd.DataFrame(index=range(rows))
+    df["TP_FUNDO"] = "FI"
+    df["CNPJ_FUNDO"] = cnpjs[fundo]
+    df["DENOM_SOCIAL"] = fundos[fundo]
+    df["DT_COMPTC"] = "2023-05-31"
+    df["TP_APLIC"] = rng.choice(
+        ["Títulos Públicos", "Cotas de Fundos", "Ações", "Depósitos a prazo"], rows
+    )
+    df["TP_ATIVO"] = rng.choice(["Título público federal", "Ação ordinária", ""], rows)
+    df["DS_ATIVO"] = rng.choice([f"ATIVO Nº {i} - SÉRIE Ú" for i in range(500)], rows)
+    df["TP_NEGOC"] = rng.choice(["Para negociação", "Mantido até o vencimento"], rows)
+    df["TP_TITPUB"] = rng.choice(["LTN", "NTN-B", "LFT", None], rows)
+    df["EMISSOR"] = rng.choice([f"EMISSORA {i} S.A." for i in range(2000)], rows)
+    df["DS_INDEXADOR_POSFX"] = rng.choice(["IPCA", "CDI", "SELIC", None], rows)
+    df["AG_RISCO"] = rng.choice(["Fitch", "Moody's", "S&P", None], rows)
+    df["GRAU_RISCO"] = rng.choice(["AAA", "AA+", "brA-", None], rows)
+    df["PAIS"] = rng.choice(["Brasil", "Estados Unidos", None], rows)
+    df["BV_MERC"] = rng.choice(["B3", "Balcão", None], rows)
+    df["CD_BV_MERC"] = rng.choice(["BVMF", "CETIP", None], rows)
+    df["CNPJ_INSTITUICAO_FINANC_COOBR"] = rng.choice(["60.701.190/0001-04", None], rows)
+    df["CPF_CNPJ_EMISSOR"] = rng.choice(["33.000.167/0001-01", "N", "S", None], rows)
+    df["CNPJ_EMISSOR"] = rng.choice(["00.000.000/0001-91", None], rows)
+    df["CNPJ_FUNDO_COTA"] = rng.choice(["11.222.333/0001-81", None], rows)
+    df["VL_MERC_POS_FINAL"] = (
+        pd.Series(rng.random(rows) * 1e6).round(2).astype(str).str.replace(".", ",")
+    )
+    for coluna in cvm_constants.COLUNAS.value:
+        if coluna != "CPF_CNPJ_EMISSOR":
+            df[coluna] = rng.choice(["S", "N", None], rows)
+    df = check_and_create_column(df, colunas_totais=cvm_constants.COLUNAS_FINAL.value)
+    return df.astype("string")
+
+
+def main():
+    """
+    Runs both implementations over the same synthetic month, checks that their outputs
+    are equal and prints their timings.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    df = synthetic_month(args.rows)
+    print(f"{args.rows:,} rows, {df.shape[1]} columns")
+    results, outputs = {}, {}
+    for name, clean in [("legacy", legacy_clean), ("new", vectorized_clean)]:
+        start = time.perf_counter()
+        outputs[name] = clean(df.copy())
+        results[name] = time.perf_counter() - start
+        print(f"{name:>6}: {results[name]:.2f}s")
+
+    pd.testing.assert_frame_equal(
+        outputs["legacy"].astype(str), outputs["new"].astype(str), check_dtype=False
+    )
+    print("outputs are equal")
+    print(f"speedup: {results['legacy'] / results['new']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
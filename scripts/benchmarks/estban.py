@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the legacy long-format steps of the ESTBAN agência cleaning (`df.melt`,
+`np.vectorize(condicoes)` and a regex per row for `id_verbete`) with the vectorized
+helpers of `br_bcb_estban.utils`, on a synthetic full year of agência files.
+
+Usage:
+    python -m scripts.benchmarks.estban --agencias 20000 --ano 2022
+"""
+import argparse
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from pipelines.datasets.br_bcb_estban.utils import (
+    condicoes,
+    create_id_verbete_column,
+    standardize_monetary_units,
+    wide_to_long_agencia,
+)
+
+VERBETES = [
+    "VERBETE_110_CAIXA",
+    "VERBETE_111_DEPOSITOS_BANCARIOS",
+    "VERBETE_112_RESERVAS_LIVRES_EM_ESPECIE",
+    "VERBETE_120_TITULOS_E_VALORES_MOBILIARIOS",
+    "VERBETE_160_OPERACOES_DE_CREDITO",
+    "VERBETE_161_EMPRESTIMOS_E_TITULOS_DESCONTADOS",
+    "VERBETE_162_FINANCIAMENTOS",
+    "VERBETE_163_FINANCIAMENTOS_RURAIS_AGRICULTURA",
+    "VERBETE_169_FINANCIAMENTOS_IMOBILIARIOS",
+    "VERBETE_171_OUTROS_CREDITOS",
+    "VERBETE_172_OUTROS_CREDITOS_DE_LIQUIDACAO_DUVIDOSA",
+    "VERBETE_173_PROVISAO_PARA_OPERACOES_DE_CREDITO",
+    "VERBETE_174_PROVISAO_PARA_CREDITOS_DE_LIQUIDACAO",
+    "VERBETE_176_OPERACOES_DE_ARRENDAMENTO",
+    "VERBETE_180_ARRENDAMENTO_MERCANTIL",
+    "VERBETE_184_PROVISAO_PARA_OPERACOES_DE_ARRENDAMENTO",
+    "VERBETE_190_OUTROS_VALORES_E_BENS",
+    "VERBETE_200_RELACOES_INTERFINANCEIRAS_E_INTERDEPENDENCIAS",
+    "VERBETE_399_TOTAL_DO_ATIVO",
+    "VERBETE_401_419_DEPOSITOS_A_VISTA",
+    "VERBETE_420_DEPOSITOS_DE_POUPANCA",
+    "VERBETE_432_DEPOSITOS_INTERFINANCEIROS",
+    "VERBETE_433_DEPOSITOS_A_PRAZO",
+    "VERBETE_460_OBRIGACOES_POR_EMPRESTIMOS",
+    "VERBETE_480_OBRIGACOES_POR_REPASSES",
+    "VERBETE_490_OUTRAS_OBRIGACOES",
+    "VERBETE_500_RELACOES_INTERFINANCEIRAS",
+    "VERBETE_610_PATRIMONIO_LIQUIDO",
+    "VERBETE_710_CONTAS_DE_RESULTADO",
+    "VERBETE_711_CONTAS_CREDORAS",
+    "VERBETE_712_CONTAS_DEVEDORAS",
+    "VERBETE_899_TOTAL_DO_PASSIVO",
+]
+
+
+def legacy_long(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The long-format steps of `cleaning_agencias_data` before vectorization.
+    """
+    df = df.melt(
+        id_vars=[
+            "data_base",
+            "sigla_uf",
+            "cnpj_basico",
+            "instituicao",
+            "cnpj_agencia",
+            "id_municipio",
+        ],
+        var_name="verbete_descricao",
+        value_name="valor",
+    )
+    df["valor"] = np.vectorize(condicoes)(df["data_base"], df["valor"])
+    padrao_letras = re.compile(r"\D")
+    df["id_verbete"] = [padrao_letras.sub("", x) for x in df["verbete_descricao"]]
+    return df
+
+
+def vectorized_long(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The same steps with the vectorized helpers.
+    """
+    df = wide_to_long_agencia(df)
+    df = standardize_monetary_units(df, date_column="data_base", value_column="valor")
+    df = create_id_verbete_column(df, column_name="id_verbete")
+    return df
+
+
+def synthetic_year(agencias: int, ano: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Builds the 12 monthly agência files of a year, after `pre_cleaning_for_pivot_long`.
+    """
+    rng = np.random.default_rng(seed)
+    rows = agencias * 12
+    agencia = np.tile(np.arange(agencias), 12)
+    df = pd.DataFrame(
+        {
+            "data_base": np.repeat(ano * 100 + np.arange(1, 13), agencias),
+            "sigla_uf": np.array(["SP", "RJ", "MG", "BA", "RS"])[agencia % 5],
+            "cnpj_basico": (agencia % 150).astype(str),
+            "instituicao": np.array([f"BANCO {i} S.A." for i in range(150)])[
+                agencia % 150
+            ],
+            "cnpj_agencia": agencia.astype(str),
+            "id_municipio": (3500000 + agencia % 5570).astype(str),
+        }
+    )
+    for verbete in VERBETES:
+        df[verbete] = rng.integers(0, 10**10, rows)
+    return df
+
+
+def main():
+    """
+    Runs both implementations over the same synthetic year, checks that their outputs
+    are equal and prints their timings and memory usage.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--agencias", type=int, default=20_000)
+    parser.add_argument("--ano", type=int, default=2022)
+    args = parser.parse_args()
+
+    df = synthetic_year(args.agencias, args.ano)
+    print(f"{len(df):,} rows x {len(VERBETES)} verbetes, ano {args.ano}")
+    results, outputs = {}, {}
+    for name, clean in [("legacy", legacy_long), ("new", vectorized_long)]:
+        start = time.perf_counter()
+        outputs[name] = clean(df.copy())
+        results[name] = time.perf_counter() - start
+        memory = outputs[name].memory_usage(deep=True).sum() / 1024**2
+        print(f"{name:>6}: {results[name]:.2f}s, {memory:,.0f} MiB")
+
+    legacy, new = outputs["legacy"], outputs["new"]
+    for column in ["data_base", "cnpj_agencia", "verbete_descricao", "id_verbete"]:
+        assert (legacy[column].astype(str) == new[column].astype(str)).all(), column
+    # np.round may differ from round() by one unit in the last decimal place
+    np.testing.assert_allclose(
+        legacy["valor"].astype(float), new["valor"].astype(float), rtol=0, atol=1.5e-6
+    )
+    print("outputs are equal")
+    print(f"speedup: {results['legacy'] / results['new']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
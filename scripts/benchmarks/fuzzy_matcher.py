@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the legacy `get_id` of br_mercadolivre_ofertas (Levenshtein distance to every
+municipality, for every row) with `pipelines.utils.fuzzy.FuzzyIndex`, on synthetic
+seller locations: municipality names with a trailing dot, without accents or with
+typos, repeated as sellers concentrate in a few cities.
+
+Usage:
+    python -m scripts.benchmarks.fuzzy_matcher --rows 2000 --distinct 500
+"""
+import argparse
+import time
+
+import Levenshtein
+import numpy as np
+from unidecode import unidecode
+
+from pipelines.datasets.br_mercadolivre_ofertas.constants import (
+    constants as const_mercadolivre,
+)
+from pipelines.utils.fuzzy import FuzzyIndex
+
+
+def legacy_get_id(input_string, dictionary):
+    """
+    The `get_id` of br_mercadolivre_ofertas before the index.
+    """
+    if input_string is None:
+        return None
+
+    if not isinstance(input_string, str):
+        return None
+
+    best_match = None
+    min_distance = float("inf")
+
+    for key in dictionary:
+        distance = Levenshtein.distance(input_string.lower(), key.lower())
+        if distance < min_distance:
+            min_distance = distance
+            best_match = key
+
+    return dictionary.get(best_match)
+
+
+def typo(text: str, rng: np.random.Generator) -> str:
+    """
+    Deletes, duplicates or swaps a random character.
+    """
+    i = int(rng.integers(1, len(text) - 1))
+    kind = rng.integers(3)
+    if kind == 0:
+        return text[:i] + text[i + 1 :]
+    if kind == 1:
+        return text[:i] + text[i] + text[i:]
+    return text[: i - 1] + text[i] + text[i - 1] + text[i + 1 :]
+
+
+def synthetic_locations(names, distinct: int, rows: int, seed: int = 42):
+    """
+    Builds `rows` locations out of `distinct` variations of municipality names.
+    """
+    rng = np.random.default_rng(seed)
+    variations = []
+    for name in rng.choice(names, distinct):
+        kind = rng.integers(4)
+        if kind == 0:
+            variations.append(f"{name}.")
+        elif kind == 1:
+            variations.append(unidecode(name))
+        elif kind == 2:
+            variations.append(typo(name, rng))
+        else:
+            variations.append(typo(unidecode(name).upper(), rng))
+    # a few cities concentrate most of the sellers
+    weights = 1 / np.arange(1, distinct + 1)
+    return list(rng.choice(variations, rows, p=weights / weights.sum()))
+
+
+def main():
+    """
+    Resolves the same locations with both implementations, compares their results and
+    prints their timings.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2_000)
+    parser.add_argument("--distinct", type=int, default=500)
+    args = parser.parse_args()
+
+    municipios = const_mercadolivre.MAP_MUNICIPIO_TO_ID.value
+    locations = synthetic_locations(list(municipios), args.distinct, args.rows)
+    print(f"{len(municipios):,} municipalities, {args.rows:,} rows")
+
+    start = time.perf_counter()
+    legacy = [legacy_get_id(location, municipios) for location in locations]
+    legacy_time = time.perf_counter() - start
+    print(f"legacy: {legacy_time:.2f}s ({legacy_time / args.rows * 1000:.2f} ms/row)")
+
+    start = time.perf_counter()
+    index = FuzzyIndex(municipios)
+    build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    new = [index.get(location) for location in locations]
+    new_time = time.perf_counter() - start
+    print(
+        f"   new: {new_time:.3f}s ({new_time / args.rows * 1000:.3f} ms/row), "
+        f"index built in {build_time:.2f}s"
+    )
+
+    start = time.perf_counter()
+    cold = FuzzyIndex(municipios, cache_size=0)
+    for location in locations:
+        cold.get(location)
+    cold_time = time.perf_counter() - start
+    print(f"without memoization: {cold_time / args.rows * 1000:.3f} ms/row")
+
+    differences = [
+        (location, a, b) for location, a, b in zip(locations, legacy, new) if a != b
+    ]
+    # differences only come from the normalized match, which ignores accents and
+    # punctuation where the raw distance may prefer another name
+    print(f"same result in {args.rows - len(differences):,} of {args.rows:,} rows")
+    for location, a, b in sorted(set(differences))[:10]:
+        print(f"  {location!r}: legacy {a}, new {b}")
+    print(f"speedup: {legacy_time / new_time:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
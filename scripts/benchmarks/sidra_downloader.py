@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the legacy download loop of crawler_ibge_inflacao (a new session per table
+and a fixed sleep after each one) with `SidraClient`, against a local server that
+answers every table after `--latency` seconds. The legacy sleep is scaled down with
+`--sleep` (10s in production) to keep the benchmark short.
+
+Usage:
+    python -m scripts.benchmarks.sidra_downloader --tables 60 --latency 0.5 --sleep 1
+"""
+import argparse
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pipelines.utils.crawler_ibge_inflacao.utils import SidraClient, get_legacy_session
+
+
+def serve(latency: float) -> ThreadingHTTPServer:
+    """
+    Starts a server answering a small csv after `latency` seconds.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        """Fake SIDRA"""
+
+        def do_GET(self):
+            """Answers a table"""
+            time.sleep(latency)
+            body = b"tabela;1\n" * 1000
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            """Silences the server"""
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def legacy_download(tables: dict, sleep: float) -> None:
+    """
+    The download loop of the crawler task before `SidraClient`.
+    """
+    for path, url in tables.items():
+        response = get_legacy_session().get(url)
+        with open(path, "wb") as f:
+            f.write(response.content)
+        time.sleep(sleep)
+
+
+def main():
+    """
+    Downloads the same tables with both implementations and prints their timings.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tables", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--sleep", type=float, default=1)
+    parser.add_argument("--workers", type=int, default=3)
+    args = parser.parse_args()
+
+    server = serve(args.latency)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    with tempfile.TemporaryDirectory() as folder:
+        tables = {f"{folder}/{i}.csv": f"{base_url}/{i}" for i in range(args.tables)}
+
+        start = time.perf_counter()
+        legacy_download(tables, args.sleep)
+        legacy_time = time.perf_counter() - start
+        print(f"legacy: {legacy_time:.1f}s")
+
+        client = SidraClient(max_workers=args.workers, max_age=0)
+        start = time.perf_counter()
+        downloaded = client.download_all(tables)
+        new_time = time.perf_counter() - start
+        print(f"   new: {new_time:.1f}s ({len(downloaded)} of {args.tables} tables)")
+
+        client = SidraClient(max_workers=args.workers)
+        start = time.perf_counter()
+        client.download_all(tables)
+        print(f"resumed: {time.perf_counter() - start:.3f}s")
+    server.shutdown()
+    print(f"speedup: {legacy_time / new_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the legacy serial `get_data_from_prod` (one `pd.read_csv` per blob) with
+`pipelines.utils.staging.StagingTableReader`, on a fake GCS bucket served over HTTP
+from a local folder, with a fixed latency per request.
+
+Usage:
+    python -m scripts.benchmarks.staging_reader --years 6 --rows 20000 --latency 50
+"""
+import argparse
+import re
+import shutil
+import tempfile
+import threading
+import time
+import urllib.request
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from pipelines.utils.staging import StagingTableReader
+
+UFS = [
+    "AC", "AL", "AM", "AP", "BA", "CE", "DF", "ES", "GO",
+    "MA", "MG", "MS", "MT", "PA", "PB", "PE", "PI", "PR",
+    "RJ", "RN", "RO", "RR", "RS", "SC", "SE", "SP", "TO",
+]  # fmt: skip
+
+
+class SlowHandler(SimpleHTTPRequestHandler):
+    """Serves the bucket folder, sleeping `latency` seconds before every response"""
+
+    latency = 0.0
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        time.sleep(self.latency)
+        super().do_GET()
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class FakeBlob:
+    """The subset of `google.cloud.storage.Blob` used by both readers"""
+
+    def __init__(self, name: str, base_url: str):
+        self.name = name
+        self.generation = 1
+        self.public_url = f"{base_url}/{name}"
+
+    def download_as_bytes(self) -> bytes:
+        """Downloads the blob over HTTP"""
+        with urllib.request.urlopen(self.public_url) as response:
+            return response.read()
+
+
+class FakeClient:
+    """A storage client whose only bucket lists the files of a local folder"""
+
+    def __init__(self, root: Path, base_url: str):
+        self.root = root
+        self.base_url = base_url
+
+    def bucket(self, _name: str) -> "FakeClient":
+        """Returns the (only) bucket"""
+        return self
+
+    def list_blobs(self, prefix: str):
+        """Lists the files under `prefix`"""
+        for path in sorted((self.root / prefix).rglob("*.csv")):
+            yield FakeBlob(path.relative_to(self.root).as_posix(), self.base_url)
+
+
+def legacy_get_data_from_prod(client, dataset_id: str, table_id: str, columns: list):
+    """
+    The serial `get_data_from_prod` of br_tse_eleicoes, with the client injected.
+    """
+    blobs = list(
+        client.bucket("basedosdados-dev").list_blobs(
+            prefix=f"staging/{dataset_id}/{table_id}/"
+        )
+    )
+
+    dfs = []
+
+    for blob in blobs:
+        partitions = re.findall(r"\w+(?==)", blob.name)
+        if len(set(partitions) & set(columns)) == 0:
+            df = pd.read_csv(blob.public_url, usecols=columns)
+            dfs.append(df)
+        else:
+            columns2add = list(set(partitions) & set(columns))
+            for column in columns2add:
+                columns.remove(column)
+            df = pd.read_csv(blob.public_url, usecols=columns)
+            for column in columns2add:
+                df[column] = blob.name.split(column + "=")[1].split("/")[0]
+            dfs.append(df)
+
+    return pd.concat(dfs)
+
+
+def write_fake_table(root: Path, years: int, rows: int, seed: int = 42) -> None:
+    """
+    Writes a candidatos-like table partitioned by ano and sigla_uf.
+    """
+    rng = np.random.default_rng(seed)
+    for ano in range(2022 - 2 * (years - 1), 2023, 2):
+        for uf in UFS:
+            folder = root / f"staging/br_x/candidatos/ano={ano}/sigla_uf={uf}"
+            folder.mkdir(parents=True)
+            pd.DataFrame(
+                {
+                    "tipo_eleicao": rng.choice(
+                        ["eleicao ordinaria", "suplementar"], rows
+                    ),
+                    "sequencial": rng.integers(1, 10**11, rows),
+                    "id_candidato_bd": rng.integers(1, 10**6, rows),
+                    "nome": rng.choice([f"CANDIDATO {i}" for i in range(1000)], rows),
+                    "situacao": rng.choice(["deferido", "indeferido"], rows),
+                }
+            ).to_csv(folder / "candidatos.csv", index=False)
+
+
+def main():
+    """
+    Reads the fake table with both implementations, checks that their outputs are
+    equal and prints their timings, then times a read pruned to the last election.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--years", type=int, default=6)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--latency", type=float, default=50, help="milliseconds")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    root = Path(tempfile.mkdtemp())
+    write_fake_table(root, args.years, args.rows)
+    SlowHandler.latency = args.latency / 1000
+    server = ThreadingHTTPServer(
+        ("localhost", 0), partial(SlowHandler, directory=str(root))
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = FakeClient(root, f"http://localhost:{server.server_address[1]}")
+    columns = ["ano", "tipo_eleicao", "sigla_uf", "sequencial", "id_candidato_bd"]
+    print(f"{args.years * len(UFS)} blobs of {args.rows:,} rows")
+
+    try:
+        start = time.perf_counter()
+        legacy = legacy_get_data_from_prod(client, "br_x", "candidatos", list(columns))
+        legacy_time = time.perf_counter() - start
+        print(f"legacy: {legacy_time:.2f}s")
+
+        reader = StagingTableReader(
+            "br_x", "candidatos", client=client, max_workers=args.workers
+        )
+        start = time.perf_counter()
+        new = reader.read(columns).to_pandas()
+        new_time = time.perf_counter() - start
+        print(f"   new: {new_time:.2f}s")
+
+        # the legacy reader removes the partition columns from `columns` while reading
+        # the first blob, so only that blob gets them
+        data_columns = ["tipo_eleicao", "sequencial", "id_candidato_bd"]
+        pd.testing.assert_frame_equal(
+            legacy[data_columns].reset_index(drop=True),
+            new[data_columns].reset_index(drop=True),
+            check_dtype=False,
+        )
+        print(
+            "outputs are equal, except for the partitions the legacy reader missed in "
+            f"{legacy['ano'].isna().sum():,} rows (new: {new['ano'].isna().sum()})"
+        )
+        print(f"speedup: {legacy_time / new_time:.1f}x")
+
+        start = time.perf_counter()
+        pruned = reader.read(columns, filters={"ano": 2022})
+        print(
+            f"pruned to ano=2022: {time.perf_counter() - start:.2f}s "
+            f"({pruned.num_rows:,} rows)"
+        )
+    finally:
+        server.shutdown()
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the legacy mask-per-partition `to_partitions` with the single-pass writer.
+
+Usage:
+    python -m scripts.benchmarks.to_partitions --rows 10000000 --file-type csv
+"""
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from pipelines.utils.utils import to_partitions
+
+UFS = [
+    "AC", "AL", "AM", "AP", "BA", "CE", "DF", "ES", "GO",
+    "MA", "MG", "MS", "MT", "PA", "PB", "PE", "PI", "PR",
+    "RJ", "RN", "RO", "RR", "RS", "SC", "SE", "SP", "TO",
+]  # fmt: skip
+
+
+def legacy_to_partitions(
+    data: pd.DataFrame,
+    partition_columns: List[str],
+    savepath: str,
+    file_type: str = "csv",
+):
+    """
+    The `to_partitions` implementation that scans the dataframe once per partition.
+    """
+    savepath = Path(savepath)
+    unique_combinations = data[partition_columns].drop_duplicates().to_dict("records")
+    for filter_combination in unique_combinations:
+        patitions_values = [
+            f"{partition}={value}" for partition, value in filter_combination.items()
+        ]
+        df_filter = data.loc[
+            data[filter_combination.keys()]
+            .isin(filter_combination.values())
+            .all(axis=1),
+            :,
+        ]
+        df_filter = df_filter.drop(columns=partition_columns)
+        filter_save_path = Path(savepath / "/".join(patitions_values))
+        filter_save_path.mkdir(parents=True, exist_ok=True)
+        if file_type == "csv":
+            file_filter_save_path = filter_save_path / "data.csv"
+            df_filter.to_csv(
+                file_filter_save_path,
+                sep=",",
+                encoding="utf-8",
+                na_rep="",
+                index=False,
+                mode="a",
+                header=not file_filter_save_path.exists(),
+            )
+        elif file_type == "parquet":
+            df_filter.to_parquet(
+                filter_save_path / "data.parquet", index=False, compression="gzip"
+            )
+
+
+def synthetic_data(rows: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Builds a comex_stat-like frame with 27 UFs x 12 months in a single year.
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "ano": 2023,
+            "mes": rng.integers(1, 13, rows),
+            "sigla_uf": pd.Categorical(rng.choice(UFS, rows)).astype(str),
+            "id_ncm": rng.integers(1_000_000, 9_999_999, rows),
+            "kg_liquido": rng.random(rows) * 1000,
+            "valor_fob_dolar": rng.random(rows) * 100_000,
+        }
+    )
+
+
+def timed(function, *args, **kwargs) -> float:
+    """
+    Runs `function` and returns its wall-clock duration in seconds.
+    """
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main():
+    """
+    Runs both writers over the same synthetic frame and prints their timings.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--file-type", choices=["csv", "parquet"], default="csv")
+    args = parser.parse_args()
+
+    data = synthetic_data(args.rows)
+    partition_columns = ["ano", "mes", "sigla_uf"]
+    print(
+        f"{len(data):,} rows, "
+        f"{len(data[partition_columns].drop_duplicates())} partitions, "
+        f"file_type={args.file_type}"
+    )
+
+    results = {}
+    for name, writer in [("legacy", legacy_to_partitions), ("new", to_partitions)]:
+        savepath = tempfile.mkdtemp(prefix=f"to_partitions_{name}_")
+        try:
+            results[name] = timed(
+                writer,
+                data=data,
+                partition_columns=partition_columns,
+                savepath=savepath,
+                file_type=args.file_type,
+            )
+        finally:
+            shutil.rmtree(savepath, ignore_errors=True)
+        print(f"{name:>6}: {results[name]:.2f}s")
+
+    print(f"speedup: {results['legacy'] / results['new']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the registry of architecture tables, with the fetches replaced by a counter
+"""
+import os
+import time
+
+import pytest
+import requests
+
+from pipelines.utils.architecture import ArchitectureRegistry, snapshot_name
+
+# pylint: disable=invalid-name, redefined-outer-name, protected-access
+
+URL = "https://docs.google.com/spreadsheets/d/abc-123/edit#gid=42"
+CONTENT = (
+    "name,original_name,bigquery_type\n"
+    "ano,ANO,int64\n"
+    "valor,VL,float64\n"
+    "nome,NM,string\n"
+    "apelido,NM,string\n"
+)
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    """Replaces the fetch of the sheets, returning `CONTENT` and recording the URLs;
+    fetches raise when `fetches.fail` is set"""
+    calls = []
+
+    def fetch(self, url):
+        calls.append(url)
+        if fetch.fail:
+            raise requests.ConnectionError("offline")
+        return CONTENT
+
+    fetch.fail = False
+    fetch.calls = calls
+    monkeypatch.setattr(ArchitectureRegistry, "_fetch", fetch)
+    return fetch
+
+
+def test_snapshot_name():
+    """Snapshots are named after the sheet and tab"""
+    assert snapshot_name(URL) == "abc-123_42.csv"
+
+
+def test_architecture_maps(tmp_path, fetches):
+    """Rename map, column order and dtypes come from the sheet; ambiguous original
+    names are not renamed"""
+    architecture = ArchitectureRegistry(cache_dir=tmp_path, ttl=60).get(URL)
+
+    assert architecture.rename_map == {"ANO": "ano", "VL": "valor"}
+    assert architecture.columns == ["ano", "valor", "nome", "apelido"]
+    assert architecture.original_columns == ["ANO", "VL", "NM", "NM"]
+    assert architecture.dtypes["ano"] == "Int64"
+    assert architecture.dtypes["valor"] == "float64"
+
+
+def test_tables_are_cached_until_the_ttl(tmp_path, fetches):
+    """Tables are fetched once per ttl, by the process and by new registries"""
+    ArchitectureRegistry(cache_dir=tmp_path, ttl=60).get(URL)
+    ArchitectureRegistry(cache_dir=tmp_path, ttl=60).get(URL)
+    assert len(fetches.calls) == 1
+
+    (cache_file,) = tmp_path.iterdir()
+    stale = time.time() - 120
+    os.utime(cache_file, (stale, stale))
+    ArchitectureRegistry(cache_dir=tmp_path, ttl=60).get(URL)
+    assert len(fetches.calls) == 2
+
+
+def test_failed_fetch_falls_back_to_stale_cache_and_snapshot(tmp_path, fetches):
+    """A failed fetch uses the expired cache, then the snapshot, then raises"""
+    snapshot_dir = tmp_path / "snapshots"
+    registry = ArchitectureRegistry(
+        cache_dir=tmp_path / "cache", ttl=0, snapshot_dir=snapshot_dir
+    )
+    registry.save_snapshot(URL)
+    assert (snapshot_dir / "abc-123_42.csv").read_text(encoding="utf-8") == CONTENT
+
+    fetches.fail = True
+    time.sleep(0.01)
+    assert registry.get(URL).content == CONTENT
+
+    registry = ArchitectureRegistry(
+        cache_dir=tmp_path / "empty", ttl=0, snapshot_dir=snapshot_dir
+    )
+    assert registry.get(URL).content == CONTENT
+
+    registry = ArchitectureRegistry(
+        cache_dir=tmp_path / "empty", ttl=0, snapshot_dir=tmp_path / "none"
+    )
+    with pytest.raises(requests.ConnectionError):
+        registry.get(URL)
+
+
+def test_offline_only_reads_snapshots(tmp_path, fetches):
+    """Offline registries never fetch, and fail without a snapshot"""
+    (tmp_path / "abc-123_42.csv").write_text(CONTENT, encoding="utf-8")
+
+    registry = ArchitectureRegistry(
+        cache_dir=tmp_path / "cache", snapshot_dir=tmp_path, offline=True
+    )
+    assert registry.get(URL).columns == ["ano", "valor", "nome", "apelido"]
+    with pytest.raises(FileNotFoundError):
+        registry.get(URL.replace("gid=42", "gid=7"))
+    assert not fetches.calls
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the CNPJ task, run with the downloads and the processing replaced by fakes
+"""
+import logging
+import os
+import threading
+import zipfile
+from datetime import datetime
+
+import prefect
+
+from pipelines.datasets.br_me_cnpj import tasks, utils
+
+# pylint: disable=invalid-name, unused-argument
+
+
+def fake_download_file(url, save_path, **kwargs):
+    """Writes an empty zip to `save_path`, logging like the real download"""
+    utils.log(f"Downloaded {url} to {save_path}")
+    with zipfile.ZipFile(save_path, "w"):
+        pass
+    return save_path
+
+
+def fake_processar_arquivo(tabela, zip_path, output_path, data_coleta, i, chunk_size):
+    """Removes the zip, returning the index of the file like the real one"""
+    os.remove(zip_path)
+    return i
+
+
+def test_main_logs_from_the_download_threads(monkeypatch, tmp_path, caplog):
+    """Downloads run in worker threads, which log through the logger of the task"""
+    threads = set()
+
+    def download_file(url, save_path, **kwargs):
+        threads.add(threading.get_ident())
+        return fake_download_file(url, save_path, **kwargs)
+
+    monkeypatch.setattr(tasks, "data_url", lambda url, headers: datetime(2023, 10, 1))
+    monkeypatch.setattr(tasks, "destino_output", lambda sufixo, data: str(tmp_path))
+    monkeypatch.setattr(tasks, "processar_arquivo", fake_processar_arquivo)
+    monkeypatch.setattr(utils, "download_file", download_file)
+
+    logger = logging.getLogger("test_br_me_cnpj")
+    with caplog.at_level(logging.INFO, logger=logger.name):
+        with prefect.context(logger=logger):
+            assert tasks.main.run(["Empresas"], max_workers=2) == str(tmp_path)
+
+    assert threading.get_ident() not in threads
+    for i in range(tasks.constants_cnpj.N_ARQUIVOS.value):
+        url = f"https://dadosabertos.rfb.gov.br/CNPJ/Empresas{i}.zip"
+        assert f"Baixando o arquivo {url}\n" in caplog.text
+        assert f"Arquivo Empresas{i} processado\n" in caplog.text
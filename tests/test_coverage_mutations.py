@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the DateTimeRange updates of the bulk metadata update
+"""
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from pipelines.utils.metadata import tasks, utils
+from pipelines.utils.metadata.utils import (
+    build_coverage_mutations,
+    extract_last_dates,
+    get_ids_bulk,
+)
+
+IDS = {"table_id": "t-1", "coverage_id": "cov-free", "coverage_id_pro": "cov-pro"}
+
+
+def test_free_table():
+    """Free tables only update the open coverage, up to the last date"""
+    assert build_coverage_mutations(IDS, "2023-05-10", "yy-mm-dd", False, True) == [
+        (
+            "cov-free",
+            {"endYear": 2023, "endMonth": 5, "endDay": 10, "coverage": "cov-free"},
+        )
+    ]
+
+
+def test_bd_pro_table():
+    """BD Pro tables only update the closed coverage"""
+    assert build_coverage_mutations(IDS, "2023", "yy", True, False) == [
+        ("cov-pro", {"endYear": 2023, "coverage": "cov-pro"})
+    ]
+
+
+def test_bd_pro_and_free_table():
+    """The open coverage ends `time_delta` before the last date, where the closed one
+    starts"""
+    mutations = build_coverage_mutations(
+        IDS, "2023-05", "yy-mm", True, True, time_delta=3, time_unit="months"
+    )
+    assert mutations == [
+        (
+            "cov-pro",
+            {
+                "startYear": 2023,
+                "startMonth": 2,
+                "endYear": 2023,
+                "endMonth": 5,
+                "coverage": "cov-pro",
+            },
+        ),
+        ("cov-free", {"endYear": 2023, "endMonth": 2, "coverage": "cov-free"}),
+    ]
+
+
+def test_neither_free_nor_bd_pro():
+    """Tables that are neither free nor BD Pro have nothing to update"""
+    assert build_coverage_mutations({}, "2023-05-10", "yy-mm-dd", False, False) == []
+
+
+@pytest.mark.parametrize(
+    "is_bd_pro, is_free, ids",
+    [
+        (False, True, {"coverage_id_pro": "cov-pro"}),
+        (True, False, {"coverage_id": "cov-free"}),
+        (True, True, {"coverage_id": "cov-free"}),
+    ],
+)
+def test_missing_coverage(is_bd_pro, is_free, ids):
+    """Coverages to be updated must exist"""
+    with pytest.raises(ValueError, match="Cobertura"):
+        build_coverage_mutations(ids, "2023-05-10", "yy-mm-dd", is_bd_pro, is_free)
+
+
+@pytest.mark.parametrize(
+    "time_delta, time_unit", [(0, "days"), (1.5, "days"), (1, "decades")]
+)
+def test_invalid_lag(time_delta, time_unit):
+    """Lags must be a positive integer of a known unit"""
+    with pytest.raises(ValueError):
+        build_coverage_mutations(
+            IDS, "2023-05-10", "yy-mm-dd", True, True, time_delta, time_unit
+        )
+
+
+def test_empty_tables_have_no_last_date(monkeypatch):
+    """NULL max dates of empty tables are left out instead of parsed"""
+    result = pd.DataFrame(
+        {
+            "dataset_id": ["br_x", "br_x"],
+            "table_id": ["a", "vazia"],
+            "max_date": ["2023-5", None],
+        }
+    )
+    monkeypatch.setattr(utils.bd, "read_sql", lambda **kwargs: result)
+
+    last_dates = extract_last_dates(
+        [("br_x", "a", "yy-mm"), ("br_x", "vazia", "yy-mm")], "basedosdados"
+    )
+    assert last_dates == {("br_x", "a"): "2023-05"}
+
+
+class FakeClient:
+    """A metadata client that knows the tables `br_x.a` and `br_x.sem_tables`, with
+    the coverages of `IDS`"""
+
+    def get_ids_batch(self, lookups):
+        """Answers every lookup like `MetadataClient.get_ids_batch`"""
+        results = []
+        for query_class, parameters, _ in lookups:
+            edges = []
+            table_id = parameters.get("$gcpTableId: String")
+            if query_class == "allCloudtable" and table_id in ("a", "sem_tables"):
+                edges = [{"node": {"id": "CloudTable:ct-1", "table": {"_id": "t-1"}}}]
+            elif query_class == "allCoverage":
+                coverage = "pro" if parameters["$isClosed: Boolean"] else "free"
+                edges = [{"node": {"id": f"CoverageNode:cov-{coverage}"}}]
+            id_ = edges[0]["node"]["id"].split(":")[1] if edges else None
+            results.append(({"data": {query_class: {"edges": edges}}}, id_))
+        return results
+
+
+def test_unknown_tables_are_left_out_of_the_ids(monkeypatch):
+    """Tables missing from the API have no IDs, instead of raising"""
+    monkeypatch.setattr(utils, "get_metadata_client", lambda *args: FakeClient())
+
+    ids = get_ids_bulk([("br_x", "a"), ("br_x", "nova")], "user", "secret")
+
+    assert ids == {("br_x", "a"): IDS}
+
+
+def test_bulk_update_fails_per_table(monkeypatch):
+    """Tables missing from the API or from __TABLES__ fail on their own, after the
+    other tables were updated"""
+    pushed = []
+
+    def create_update(mutation_parameters, **kwargs):
+        pushed.append(mutation_parameters["coverage"])
+        return None, "range-id"
+
+    monkeypatch.setattr(tasks, "get_credentials_utils", lambda secret_path: ("", ""))
+    monkeypatch.setattr(utils, "get_metadata_client", lambda *args: FakeClient())
+    monkeypatch.setattr(
+        tasks,
+        "extract_last_updates",
+        lambda tables, billing_project_id: {("br_x", "a"): datetime(2023, 5, 10)},
+    )
+    monkeypatch.setattr(tasks, "create_update", create_update)
+    tables = [
+        {"dataset_id": "br_x", "table_id": table_id, "is_free": True}
+        for table_id in ["a", "nova", "sem_tables"]
+    ]
+
+    with pytest.raises(Exception, match=r"\['br_x.nova', 'br_x.sem_tables'\]"):
+        tasks.update_django_metadata_bulk.run(tables)
+    assert pushed == ["cov-free"]
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the shared async crawler, run against a local aiohttp test server
+"""
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from pipelines.datasets.br_mercadolivre_ofertas.utils import PageCache
+from pipelines.utils.crawler import AsyncCrawler, TokenBucket, html_parser
+
+# pylint: disable=invalid-name
+
+
+def build_app(hits):
+    """A site with a page, a flaky page, a rate-limited page, a missing page and a
+    slow page, counting the requests to each path in `hits`"""
+    state = {"in_flight": 0, "max_in_flight": 0}
+
+    async def page(request):
+        hits[request.path] = hits.get(request.path, 0) + 1
+        return web.Response(
+            text="<html><h1>Title</h1></html>", content_type="text/html"
+        )
+
+    async def flaky(request):
+        hits[request.path] = hits.get(request.path, 0) + 1
+        if hits[request.path] < 3:
+            return web.Response(status=503)
+        return web.Response(text="ok")
+
+    async def limited(request):
+        hits[request.path] = hits.get(request.path, 0) + 1
+        if hits[request.path] == 1:
+            return web.Response(status=429, headers={"Retry-After": "0"})
+        return web.Response(text="ok")
+
+    async def missing(request):
+        hits[request.path] = hits.get(request.path, 0) + 1
+        return web.Response(status=404)
+
+    async def slow(request):
+        state["in_flight"] += 1
+        state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+        await asyncio.sleep(0.05)
+        state["in_flight"] -= 1
+        return web.Response(text=request.query["i"])
+
+    app = web.Application()
+    app.router.add_get("/page", page)
+    app.router.add_get("/flaky", flaky)
+    app.router.add_get("/limited", limited)
+    app.router.add_get("/missing", missing)
+    app.router.add_get("/slow", slow)
+    return app, state
+
+
+def crawl(test, **crawler_kwargs):
+    """Runs `test(crawler, base_url, hits, state)` against the local server"""
+    hits = {}
+
+    async def main():
+        app, state = build_app(hits)
+        async with TestServer(app) as server:
+            base_url = str(server.make_url("")).rstrip("/")
+            async with AsyncCrawler(backoff=0.01, **crawler_kwargs) as crawler:
+                return await test(crawler, base_url, hits, state)
+
+    return asyncio.run(main())
+
+
+def test_fetch_parses_the_page():
+    """Pages are handed to the parser"""
+
+    async def test(crawler, base_url, hits, _):
+        soup = await crawler.fetch(f"{base_url}/page", parser=html_parser)
+        text = await crawler.fetch(f"{base_url}/page")
+        return soup.h1.text, text, hits
+
+    title, text, hits = crawl(test)
+    assert title == "Title"
+    assert text.startswith("<html>")
+    assert hits["/page"] == 2
+
+
+def test_fetch_retries_server_errors():
+    """5xx and 429 answers are retried, client errors are not"""
+
+    async def test(crawler, base_url, hits, _):
+        results = await crawler.fetch_all(
+            [f"{base_url}/flaky", f"{base_url}/limited", f"{base_url}/missing"]
+        )
+        return results, hits
+
+    results, hits = crawl(test, attempts=3)
+    assert results == ["ok", "ok", None]
+    assert hits == {"/flaky": 3, "/limited": 2, "/missing": 1}
+
+
+def test_fetch_gives_up_after_all_attempts():
+    """None is returned once every attempt failed"""
+
+    async def test(crawler, base_url, hits, _):
+        return await crawler.fetch(f"{base_url}/flaky"), hits
+
+    result, hits = crawl(test, attempts=2)
+    assert result is None
+    assert hits["/flaky"] == 2
+
+
+def test_page_cache_retries_failed_pages():
+    """Pages are downloaded once, but failed downloads are tried again"""
+
+    async def test(crawler, base_url, hits, _):
+        cache = PageCache(crawler)
+        pages = await asyncio.gather(*[cache.get(f"{base_url}/page") for _ in range(3)])
+        failed = await cache.get(f"{base_url}/flaky")
+        retried = await cache.get(f"{base_url}/flaky")
+        return pages, failed, retried, hits
+
+    pages, failed, retried, hits = crawl(test, attempts=2)
+    assert [page.h1.text for page in pages] == ["Title"] * 3
+    assert failed is None
+    assert retried.text == "ok"
+    assert hits == {"/page": 1, "/flaky": 3}
+
+
+def test_fetch_all_limits_concurrency_per_host():
+    """No more than `max_per_host` requests are in flight, and results keep the order
+    of the urls"""
+
+    async def test(crawler, base_url, _, state):
+        urls = [f"{base_url}/slow?i={i}" for i in range(12)]
+        return await crawler.fetch_all(urls), state["max_in_flight"]
+
+    results, max_in_flight = crawl(test, max_per_host=3)
+    assert results == [str(i) for i in range(12)]
+    assert max_in_flight == 3
+
+
+def test_token_bucket_rate():
+    """After the initial burst, acquisitions happen at `rate` per second"""
+
+    async def main():
+        bucket = TokenBucket(rate=20, capacity=1)
+        start = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(main()) == pytest.approx(0.2, abs=0.08)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the DBF reader, run against a DBF file written by the tests
+"""
+import struct
+
+import pytest
+
+from pipelines.utils.dbc import dbc_to_csv, read_dbf_batches
+
+# pylint: disable=invalid-name
+
+FIELDS = [("CNES", "C", 7, 0), ("QT", "N", 4, 0), ("NOME", "C", 6, 0)]
+RECORDS = [("2000001", "12", "Ana"), ("2000002", "", "José")]
+
+
+def write_dbf(path, fields=FIELDS, records=RECORDS):
+    """Writes a dBase III file with fixed width records"""
+    record_length = 1 + sum(field[2] for field in fields)
+    header_length = 32 + 32 * len(fields) + 1
+    header = struct.pack(
+        "<B3BIHH20x", 3, 23, 1, 1, len(records), header_length, record_length
+    )
+    for name, kind, length, decimals in fields:
+        header += struct.pack(
+            "<11sc4xBB14x", name.encode(), kind.encode(), length, decimals
+        )
+    header += b"\x0d"
+    body = b""
+    for record in records:
+        body += b" "
+        for (_, kind, length, _), value in zip(fields, record):
+            value = value.encode("iso-8859-1")
+            body += value.rjust(length) if kind == "N" else value.ljust(length)
+    path.write_bytes(header + body + b"\x1a")
+    return path
+
+
+def test_missing_columns_raise(tmp_path):
+    """Requested columns missing from the file are an error, not a silent skip"""
+    path = write_dbf(tmp_path / "file.dbf")
+
+    with pytest.raises(KeyError, match="ID_EQUIPE"):
+        list(read_dbf_batches(path, columns=["CNES", "ID_EQUIPE"]))
+
+
+def test_optional_columns_are_read_when_present(tmp_path):
+    """Optional columns follow the requested ones, and are skipped when missing"""
+    path = write_dbf(tmp_path / "file.dbf")
+
+    (batch,) = read_dbf_batches(path, columns=["QT"], optional_columns=["NOME", "X"])
+
+    assert batch.to_pydict() == {"QT": ["12", None], "NOME": ["Ana", "José"]}
+
+
+def test_dbc_to_csv(tmp_path):
+    """Batches are appended to a single csv, with a header and blanks as empty"""
+    path = write_dbf(tmp_path / "file.dbf")
+    destination = tmp_path / "out" / "file.csv"
+
+    dbc_to_csv(path, destination, batch_size=1)
+
+    assert destination.read_text(encoding="utf-8").splitlines() == [
+        "CNES,QT,NOME",
+        "2000001,12,Ana",
+        "2000002,,José",
+    ]
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the cached downloads, run against a local server with range support
+"""
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from pipelines.utils.downloader import DownloadCache, download_file
+
+# pylint: disable=invalid-name, redefined-outer-name
+
+CONTENT = bytes(range(256)) * 64
+
+
+@pytest.fixture
+def server():
+    """Serves `state["content"]` at `/file` and a body shorter than its Content-Length
+    at `/truncated`, answering range requests. Files are sent with the `state["etag"]`
+    and `state["last_modified"]` validators, and conditional requests are answered
+    with a 304 when `state["conditional"]` is set. The status of every response is
+    recorded in `state["statuses"]`."""
+    state = {
+        "content": CONTENT,
+        "etag": '"v1"',
+        "last_modified": None,
+        "conditional": True,
+        "statuses": [],
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        """Static file server"""
+
+        protocol_version = "HTTP/1.0"
+
+        def do_GET(self):
+            """Answers the file, or the requested range of it"""
+            content = state["content"]
+            body, status = content, 200
+            start, end = 0, len(content) - 1
+            if "Range" in self.headers:
+                first, last = self.headers["Range"][len("bytes=") :].split("-")
+                start = int(first)
+                end = int(last) if last else end
+                body, status = content[start : end + 1], 206
+            validators = {
+                "ETag": state["etag"],
+                "Last-Modified": state["last_modified"],
+            }
+            conditions = {
+                "ETag": self.headers.get("If-None-Match"),
+                "Last-Modified": self.headers.get("If-Modified-Since"),
+            }
+            if state["conditional"] and any(
+                value and conditions[name] == value
+                for name, value in validators.items()
+            ):
+                body, status = b"", 304
+            state["statuses"].append(status)
+            self.send_response(status)
+            for name, value in validators.items():
+                if value:
+                    self.send_header(name, value)
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(len(body)))
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(content)}")
+            self.end_headers()
+            if self.path == "/truncated":
+                body = body[: len(body) // 2]
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            """Silences the server"""
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}", state
+    httpd.shutdown()
+
+
+def test_truncated_download_is_not_cached(server, tmp_path):
+    """A body shorter than its Content-Length is never cached"""
+    base_url, _ = server
+    cache = DownloadCache(tmp_path / "cache")
+    url = f"{base_url}/truncated"
+
+    with pytest.raises(Exception):
+        download_file(
+            url, tmp_path / "file", use_cache=True, cache=cache, max_workers=1
+        )
+
+    assert cache.get(url) is None
+    assert not list(cache.objects_dir.iterdir())
+
+
+def test_lost_part_file_restarts_segments(server, tmp_path):
+    """Segments recorded for a part file that is gone are downloaded again"""
+    base_url, _ = server
+    cache = DownloadCache(tmp_path / "cache")
+    url = f"{base_url}/file"
+    part_path = cache.partial_path(url)
+    validators = {
+        "etag": '"v1"',
+        "last_modified": None,
+        "content_length": str(len(CONTENT)),
+    }
+    state = {"validators": validators, "mode": "segments", "segments": [0, 4096]}
+    part_path.with_suffix(".json").write_text(json.dumps(state), encoding="utf-8")
+
+    download_file(
+        url,
+        tmp_path / "file",
+        use_cache=True,
+        cache=cache,
+        max_workers=4,
+        segment_size=4096,
+    )
+
+    assert (tmp_path / "file").read_bytes() == CONTENT
+
+
+@pytest.mark.parametrize("conditional", [True, False])
+@pytest.mark.parametrize(
+    "validator, first, second",
+    [
+        ("etag", '"v1"', '"v2"'),
+        (
+            "last_modified",
+            "Mon, 02 Oct 2023 10:00:00 GMT",
+            "Tue, 03 Oct 2023 10:00:00 GMT",
+        ),
+    ],
+)
+def test_cached_files_are_revalidated(
+    server, tmp_path, conditional, validator, first, second
+):
+    """The cached copy is reused while the validator is the same, answered with a 304
+    or not, and downloaded again once it changes"""
+    base_url, state = server
+    state.update(etag=None, conditional=conditional)
+    state[validator] = first
+    cache = DownloadCache(tmp_path / "cache")
+    url = f"{base_url}/file"
+    path = tmp_path / "file"
+
+    download_file(url, path, use_cache=True, cache=cache, max_workers=1)
+    # the server answers other content with the same validator
+    state["content"] = CONTENT[::-1]
+    download_file(url, path, use_cache=True, cache=cache, max_workers=1)
+    assert path.read_bytes() == CONTENT
+    assert state["statuses"] == [200, 304 if conditional else 200]
+
+    state[validator] = second
+    download_file(url, path, use_cache=True, cache=cache, max_workers=1)
+    assert path.read_bytes() == CONTENT[::-1]
+    assert cache.get(url)[validator] == second
+
+
+def test_eviction_removes_the_least_recently_used(tmp_path):
+    """Objects used last are kept when the cache grows over its size"""
+    cache = DownloadCache(tmp_path / "cache", max_size=2 * len(CONTENT))
+    validators = {"etag": '"v1"', "last_modified": None, "content_length": None}
+    for i, name in enumerate(["a", "b"]):
+        cache.store(name, validators, lambda writer, i=i: writer.write(CONTENT[i:]))
+        os.utime(cache.object_path(cache.get(name)), (1000 + i, 1000 + i))
+
+    # "a" is older, but was used after "b"
+    cache.object_path(cache.get("a"))
+    cache.store("c", validators, lambda writer: writer.write(CONTENT[2:]))
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+    assert len(list(cache.objects_dir.iterdir())) == 2
+
+
+def test_download_without_cache(server, tmp_path):
+    """Without the cache the file is the only copy, so removing it frees disk"""
+    base_url, _ = server
+    path = tmp_path / "input" / "file"
+
+    download_file(f"{base_url}/file", path, max_workers=4, segment_size=4096)
+
+    assert path.read_bytes() == CONTENT
+    assert path.stat().st_nlink == 1
+    assert os.listdir(tmp_path / "input") == ["file"]
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the selection of the ESTBAN months to backfill
+"""
+from pipelines.datasets.br_bcb_estban.utils import (
+    complete_data_bases,
+    data_base_from_link,
+    missing_links,
+)
+
+LINKS = [
+    "fis/cosif/cont/estban/municipio/202303_ESTBAN.ZIP",
+    "fis/cosif/cont/estban/municipio/202302_ESTBAN.ZIP",
+    "fis/cosif/cont/estban/municipio/202301_ESTBAN.ZIP",
+]
+
+
+def test_data_base_from_link():
+    """The data_base is read from the file name, not from the folders"""
+    assert data_base_from_link(LINKS[0]) == "202303"
+    assert data_base_from_link("fis/202101/agencia/202212_ESTBAN_AG.ZIP") == "202212"
+
+
+def test_missing_links():
+    """Links of the months already in staging are dropped, keeping the order"""
+    assert missing_links(LINKS, {"202302"}) == [LINKS[0], LINKS[2]]
+    assert missing_links(LINKS, set()) == LINKS
+    assert not missing_links(LINKS, {"202301", "202302", "202303"})
+
+
+def test_incomplete_months_are_missing():
+    """Months with fewer states than the others are backfilled again"""
+    partitions = [
+        {"ano": "2023", "mes": "1", "sigla_uf": "SP"},
+        {"ano": "2023", "mes": "1", "sigla_uf": "RJ"},
+        {"ano": "2023", "mes": "2", "sigla_uf": "SP"},
+        {"ano": "2023", "mes": "3", "sigla_uf": "RJ"},
+        {"ano": "2023", "mes": "3", "sigla_uf": "SP"},
+    ]
+    assert complete_data_bases(partitions) == {"202301", "202303"}
+    assert missing_links(LINKS, complete_data_bases(partitions)) == [LINKS[1]]
+
+
+def test_months_without_states():
+    """Tables not partitioned by sigla_uf count every uploaded month"""
+    partitions = [{"ano": "2023", "mes": "1"}, {"ano": "2023", "mes": "02"}, {}]
+    assert complete_data_bases(partitions) == {"202301", "202302"}
+    assert complete_data_bases([]) == set()
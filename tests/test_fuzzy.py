@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the fuzzy name index, compared with a brute-force Levenshtein scan
+"""
+import random
+
+import Levenshtein
+import pytest
+
+from pipelines.utils.fuzzy import FuzzyIndex
+
+# pylint: disable=invalid-name
+
+NAMES = {
+    "Juiz de Fora, Minas Gerais": 3136702,
+    "São Paulo, São Paulo": 3550308,
+    "São João d'Aliança, Goiás": 5220009,
+    "Rio de Janeiro, Rio de Janeiro": 3304557,
+    "Belo Horizonte, Minas Gerais": 3106200,
+    "Belo Jardim, Pernambuco": 2601508,
+    "Bom Jardim, Pernambuco": 2602001,
+    "Bom Jardim, Rio de Janeiro": 3300506,
+}
+
+
+def brute_force(mapping, query, max_distance=None):
+    """The value of the first name nearest to `query`, comparing it with every name"""
+    if not isinstance(query, str):
+        return None
+    best_name, best_distance = None, None
+    for name in mapping:
+        distance = Levenshtein.distance(query.lower(), name.lower())
+        if best_distance is None or distance < best_distance:
+            best_name, best_distance = name, distance
+    if max_distance is not None and best_distance > max_distance:
+        return None
+    return mapping[best_name]
+
+
+def typo(text, rng):
+    """Deletes, duplicates or replaces a random character"""
+    i = rng.randrange(len(text))
+    kind = rng.randrange(3)
+    if kind == 0:
+        return text[:i] + text[i + 1 :]
+    if kind == 1:
+        return text[:i] + text[i] + text[i:]
+    return text[:i] + rng.choice("aeiouxz") + text[i + 1 :]
+
+
+def test_typos_match_brute_force():
+    """Names with up to three typos resolve like the brute-force scan"""
+    rng = random.Random(42)
+    index = FuzzyIndex(NAMES)
+    for _ in range(500):
+        query = rng.choice(list(NAMES))
+        for _ in range(rng.randint(1, 3)):
+            query = typo(query, rng)
+        assert index.get(query) == brute_force(NAMES, query), query
+
+
+def test_ties_match_brute_force():
+    """Among names at the same distance the first one wins, whatever the n-grams"""
+    rng = random.Random(7)
+    words = ["".join(rng.choices("ab", k=rng.randint(2, 6))) for _ in range(40)]
+    mapping = {word: i for i, word in enumerate(dict.fromkeys(words))}
+    index = FuzzyIndex(mapping)
+    for _ in range(300):
+        query = "".join(rng.choices("abc", k=rng.randint(1, 7)))
+        assert index.get(query) == brute_force(mapping, query), query
+
+    assert FuzzyIndex({"abcx": 1, "abcy": 2}).get("abcz") == 1
+    assert FuzzyIndex({"abcy": 2, "abcx": 1}).get("abcz") == 2
+
+
+def test_normalized_names():
+    """Names equal but for accents and punctuation match exactly, unless they are
+    ambiguous, which falls back to the nearest name"""
+    index = FuzzyIndex(NAMES)
+    assert index.get("SAO JOAO D ALIANCA GOIAS.") == 5220009
+
+    ambiguous = {"São Paulo": 1, "Sao Paulo!": 2}
+    index = FuzzyIndex(ambiguous)
+    for query in ["SÃO PAULO", "sao paulo", "Sao Paulo!!", "são  paulo"]:
+        assert index.get(query) == brute_force(ambiguous, query), query
+    assert index.get("Sao Paulo!!") == 2
+
+    assert FuzzyIndex({"São Paulo": 1, "Sao Paulo!": 1}).get("sao-paulo") == 1
+
+
+@pytest.mark.parametrize("max_distance", [0, 1, 2])
+def test_max_distance(max_distance):
+    """Queries farther than `max_distance` from every name resolve to None, except
+    for names equal once normalized"""
+    index = FuzzyIndex(NAMES, max_distance=max_distance)
+    for query in ["Juiz de Fora, Minas Gerai", "Juiz de Fora, Minas Geral", "Bom"]:
+        expected = brute_force(NAMES, query, max_distance)
+        assert index.get(query) == expected, query
+    assert index.get("Juiz de Fora, Minas Gerai") == (
+        None if max_distance < 1 else 3136702
+    )
+    assert index.get("Juiz de Fora Minas Gerais.") == 3136702
+
+
+def test_non_strings_resolve_to_none():
+    """NaN, None and numbers are not looked up"""
+    index = FuzzyIndex(NAMES)
+    assert [index.get(query) for query in [None, float("nan"), 3136702]] == [None] * 3
+    assert FuzzyIndex({}).get("Juiz de Fora") is None
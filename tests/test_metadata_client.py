@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the metadata API client, run against a local stub GraphQL server
+"""
+import base64
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from pipelines.utils.metadata.client import MetadataClient
+
+# pylint: disable=invalid-name, redefined-outer-name
+
+
+def make_token(exp: float) -> str:
+    """Builds an unsigned JWT with the given expiration"""
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": exp}).encode()).decode()
+    return f"header.{payload.rstrip('=')}.signature"
+
+
+class StubGraphQLHandler(BaseHTTPRequestHandler):
+    """Answers tokenAuth, ID lookups and mutations like the metadata API"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Records the request and answers it"""
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        server.requests.append((self.client_address[1], body))
+        query = body["query"]
+        if "tokenAuth" not in query and server.revoked:
+            server.revoked -= 1
+            if server.on_revoke is not None:
+                server.on_revoke()
+            self.send_response(401)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if "tokenAuth" in query:
+            server.logins += 1
+            data = {"tokenAuth": {"token": make_token(server.token_exp)}}
+        elif query.strip().startswith("mutation"):
+            mutation_class = re.search(r"(\w+)\(input", query).group(1)
+            _classe = mutation_class.replace("CreateUpdate", "").lower()
+            data = {
+                mutation_class: {"errors": [], _classe: {"id": f"{_classe}:new-id"}}
+            }
+        elif "startYear" in query:
+            query_class = re.search(r"\{\s*(\w+)\(", query).group(1)
+            node = {"startYear": 2020, "startMonth": 1, "startDay": 1, "interval": 1}
+            data = {query_class: {"edges": [{"node": node}]}}
+        else:
+            data = {}
+            for alias, query_class in re.findall(r"(q\d+): (\w+)\(", query):
+                data[alias] = {"edges": server.nodes.get(query_class, [])}
+        content = json.dumps({"data": data}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    """Starts the stub GraphQL server on a free local port"""
+    server = ThreadingHTTPServer(("localhost", 0), StubGraphQLHandler)
+    server.requests = []
+    server.logins = 0
+    server.revoked = 0
+    server.on_revoke = None
+    server.token_exp = time.time() + 3600
+    server.nodes = {
+        "allCloudtable": [{"node": {"id": "CloudTable:ct-1", "table": {"_id": "t-1"}}}],
+        "allCoverage": [{"node": {"id": "CoverageNode:cov-1"}}],
+    }
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(stub_server):
+    """A client pointed to the stub server"""
+    host, port = stub_server.server_address[:2]
+    return MetadataClient("user@example.com", "secret", url=f"http://{host}:{port}/")
+
+
+def test_single_login_and_connection(stub_server, client):
+    """Several calls share one token and one pooled connection"""
+    table_query = {"$gcpDatasetId: String": "br_x", "$gcpTableId: String": "y"}
+    response, _id = client.get_id("allCloudtable", table_query, cloud_table=True)
+    client.get_date("allDatetimerange", {"$coverage_Id: ID": "cov-1"})
+    client.create_update(
+        mutation_class="CreateUpdateDateTimeRange",
+        mutation_parameters={"startYear": 2020},
+        query_class="allDatetimerange",
+        query_parameters={"$coverage_Id: ID": "cov-2"},
+    )
+
+    assert _id == "ct-1"
+    assert (
+        response["data"]["allCloudtable"]["edges"][0]["node"]["table"]["_id"] == "t-1"
+    )
+    assert stub_server.logins == 1
+    assert len({port for port, _ in stub_server.requests}) == 1
+
+
+def test_ids_are_memoized(stub_server, client):
+    """A found ID is not looked up again"""
+    query = {"$table_Id: ID": "t-1"}
+    first = client.get_id("allCoverage", query, cloud_table=False)
+    n_requests = len(stub_server.requests)
+    second = client.get_id("allCoverage", query, cloud_table=False)
+    assert first == second == (first[0], "cov-1")
+    assert len(stub_server.requests) == n_requests
+
+
+def test_batched_lookups(stub_server, client):
+    """Several lookups are sent in a single GraphQL request"""
+    client.token  # pylint: disable=pointless-statement
+    n_requests = len(stub_server.requests)
+    results = client.get_ids_batch(
+        [
+            (
+                "allCoverage",
+                {"$table_Id: ID": "t-1", "$isClosed: Boolean": False},
+                True,
+            ),
+            ("allCoverage", {"$table_Id: ID": "t-1", "$isClosed: Boolean": True}, True),
+            ("allDataset", {"$slug: String": "missing"}, False),
+        ]
+    )
+    assert len(stub_server.requests) == n_requests + 1
+    variables = stub_server.requests[-1][1]["variables"]
+    assert variables == {
+        "table_Id_0": "t-1",
+        "isClosed_0": False,
+        "table_Id_1": "t-1",
+        "isClosed_1": True,
+        "slug_2": "missing",
+    }
+    assert [_id for _, _id in results] == ["cov-1", "cov-1", None]
+    assert results[2][0] == {"data": {"allDataset": {"edges": []}}}
+
+
+def test_expired_token_is_renewed(stub_server, client):
+    """A token about to expire is requested again"""
+    stub_server.token_exp = time.time() + 10
+    client.get_date("allDatetimerange", {"$coverage_Id: ID": "cov-1"})
+    client.get_date("allDatetimerange", {"$coverage_Id: ID": "cov-1"})
+    assert stub_server.logins == 2
+
+
+def test_create_update_keeps_memoized_responses(stub_server, client):
+    """Existing objects are returned without changing the memoized lookup"""
+    query = {"$table_Id: ID": "t-1"}
+    memoized, _ = client.get_id("allCoverage", query, cloud_table=False)
+    response, _id = client.create_update(
+        mutation_class="CreateUpdateCoverage",
+        mutation_parameters={"table": "t-1"},
+        query_class="allCoverage",
+        query_parameters=query,
+    )
+    assert (response["r"], _id) == ("query", "cov-1")
+    assert "r" not in memoized
+    assert "r" not in client.get_id("allCoverage", query, cloud_table=False)[0]
+
+
+def test_revoked_token_is_renewed(stub_server, client):
+    """A 401 requests a new token, unless another thread renewed it meanwhile"""
+    # pylint: disable=protected-access
+    client.token  # pylint: disable=pointless-statement
+    stub_server.revoked = 1
+    client.get_date("allDatetimerange", {"$coverage_Id: ID": "cov-1"})
+    assert stub_server.logins == 2
+
+    def renew():
+        with client._lock:
+            client._token = make_token(time.time() + 3600)
+
+    stub_server.revoked, stub_server.on_revoke = 1, renew
+    client.get_date("allDatetimerange", {"$coverage_Id: ID": "cov-1"})
+    assert stub_server.logins == 2
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the SIDRA client of the IBGE inflation crawler, run against a local server
+with the clock of the rate limiter replaced by a fake one
+"""
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from pipelines.utils.crawler_ibge_inflacao import utils
+from pipelines.utils.crawler_ibge_inflacao.utils import AdaptiveRateLimiter, SidraClient
+
+# pylint: disable=invalid-name, redefined-outer-name
+
+
+class FakeTime:
+    """A monotonic clock that only moves when slept on, recording the sleeps"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+        self._lock = threading.Lock()
+
+    def monotonic(self) -> float:
+        """Current time of the fake clock"""
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        """Moves the clock forward"""
+        with self._lock:
+            self.sleeps.append(seconds)
+            self.now += max(seconds, 0)
+
+    @staticmethod
+    def time() -> float:
+        """Wall-clock time, for the age of the files"""
+        return time.time()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replaces the clock of the rate limiter"""
+    fake = FakeTime()
+    monkeypatch.setattr(utils, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def sidra():
+    """A server answering `/tabela/<n>` with a csv and `/html` with an error page,
+    failing `/instavel` twice with a 429, and counting the requests to each path.
+    While `state["barrier"]` is set, tables are only answered once that many requests
+    are in flight."""
+    hits = {}
+    state = {"barrier": None}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        """Fake SIDRA"""
+
+        def do_GET(self):
+            """Answers a table"""
+            with lock:
+                hits[self.path] = hits.get(self.path, 0) + 1
+                count = hits[self.path]
+            if state["barrier"] is not None:
+                state["barrier"].wait()
+            if self.path == "/instavel" and count < 3:
+                self.send_response(429)
+                self.send_header("Retry-After", "0")
+                self.end_headers()
+                return
+            body = f"tabela;{self.path}\n".encode()
+            if self.path == "/html":
+                body = b"<html><body>Erro;</body></html>"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            """Silences the server"""
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}", hits, state
+    server.shutdown()
+
+
+def test_download_all_resumes(sidra, clock, tmp_path):
+    """Tables are downloaded concurrently, and fresh ones are not downloaded again"""
+    base_url, hits, state = sidra
+    tables = {str(tmp_path / f"{i}.csv"): f"{base_url}/tabela/{i}" for i in range(6)}
+    client = SidraClient(max_workers=3)
+
+    # the server only answers when 3 requests are in flight
+    state["barrier"] = threading.Barrier(3, timeout=5)
+    assert client.download_all(tables) == list(tables)
+    state["barrier"] = None
+    assert sorted(os.listdir(tmp_path)) == [f"{i}.csv" for i in range(6)]
+    assert (tmp_path / "0.csv").read_text() == "tabela;/tabela/0\n"
+    assert clock.sleeps == [0] * 6
+
+    os.remove(tmp_path / "5.csv")
+    (tmp_path / "4.csv").write_bytes(b"<html>Erro</html>")
+    (tmp_path / "3.csv").write_bytes(b"")
+    assert client.download_all(tables) == list(tables)
+    assert hits["/tabela/0"] == 1
+    assert [hits[f"/tabela/{i}"] for i in [3, 4, 5]] == [2, 2, 2]
+
+
+def test_download_retries_with_backoff(sidra, clock, tmp_path):
+    """Failed requests are retried after the interval of the limiter, which doubles
+    after failures and halves after successes"""
+    base_url, hits, _ = sidra
+    limiter = AdaptiveRateLimiter(backoff=0.1)
+    client = SidraClient(limiter=limiter)
+
+    assert client.download(f"{base_url}/instavel", str(tmp_path / "instavel.csv"))
+    # intervals of 0.1s and 0.2s after the two 429
+    assert clock.sleeps == pytest.approx([0, 0.1, 0.2])
+    assert hits["/instavel"] == 3
+    assert limiter.interval == pytest.approx(0.1)
+
+
+def test_download_gives_up(sidra, clock, tmp_path):
+    """Nothing is written when every attempt fails, and error pages are failures"""
+    base_url, hits, _ = sidra
+    client = SidraClient(attempts=2, limiter=AdaptiveRateLimiter(backoff=0.01))
+    tables = {
+        str(tmp_path / "instavel.csv"): f"{base_url}/instavel",
+        str(tmp_path / "html.csv"): f"{base_url}/html",
+        str(tmp_path / "0.csv"): f"{base_url}/tabela/0",
+    }
+
+    assert client.download_all(tables) == [str(tmp_path / "0.csv")]
+    assert hits["/instavel"] == 2
+    assert hits["/html"] == 2
+    assert os.listdir(tmp_path) == ["0.csv"]
+    assert len(clock.sleeps) == 5
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the reader of the staging bucket, run against an in-memory bucket
+"""
+from pipelines.utils.staging import StagingTableReader
+
+# pylint: disable=invalid-name
+
+BLOBS = {
+    "staging/br_x/y/ano=2020/data.csv": b"id,valor\n1,10\n2,\n",
+    "staging/br_x/y/ano=2022/data.csv": b"id,valor\nA3,1.5\n4,2.5\n",
+}
+
+
+class FakeBlob:
+    """A blob of the fake bucket"""
+
+    def __init__(self, name: str, data: bytes):
+        self.name = name
+        self.data = data
+
+    def download_as_bytes(self) -> bytes:
+        """Returns the contents of the blob"""
+        return self.data
+
+
+class FakeClient:
+    """A storage client with a single bucket of `BLOBS`"""
+
+    def bucket(self, name):  # pylint: disable=unused-argument
+        """Returns the bucket"""
+        return self
+
+    def list_blobs(self, prefix):
+        """Lists the blobs under `prefix`"""
+        return [FakeBlob(name, data) for name, data in BLOBS.items() if prefix in name]
+
+
+def test_read_promotes_types_across_blobs():
+    """Columns typed differently across blobs are read with a common type"""
+    table = StagingTableReader("br_x", "y", client=FakeClient()).read()
+
+    assert str(table.schema.field("id").type) == "string"
+    assert str(table.schema.field("valor").type) == "double"
+    assert table.column("id").to_pylist() == ["1", "2", "A3", "4"]
+    assert table.column("ano").to_pylist() == ["2020", "2020", "2022", "2022"]
+
+
+def test_read_pandas_parses_blobs_like_read_csv():
+    """read_pandas keeps the types pandas infers for each blob"""
+    reader = StagingTableReader("br_x", "y", client=FakeClient())
+    dataframe = reader.read_pandas(["ano", "id"], filters={"ano": 2020})
+
+    assert dataframe.to_dict("list") == {"ano": ["2020", "2020"], "id": [1, 2]}
+    assert dataframe["id"].dtype == "int64"
+
+    dataframe = reader.read_pandas()
+    assert dataframe["id"].tolist() == [1, 2, "A3", "4"]
+    assert dataframe["valor"].tolist()[2:] == [1.5, 2.5]
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the parquet writers of to_partitions
+"""
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from pipelines.utils.utils import to_partitions
+
+# pylint: disable=invalid-name
+
+
+def read_partitions(path) -> pd.DataFrame:
+    """Reads every parquet file of a hive partitioned folder"""
+    table = ds.dataset(str(path), format="parquet", partitioning="hive").to_table()
+    return table.to_pandas().sort_values(["p", "x"]).reset_index(drop=True)
+
+
+def schemas(path) -> set:
+    """Types of the `x` column of every parquet file of a folder"""
+    return {str(pq.read_schema(f).field("x").type) for f in path.rglob("*.parquet")}
+
+
+def test_chunks_promote_null_columns(tmp_path):
+    """Strings after an all-null chunk widen the schema of every file"""
+    chunks = [
+        pd.DataFrame({"p": [1, 1], "x": [None, None]}),
+        pd.DataFrame({"p": [1, 2], "x": ["a", "b"]}),
+    ]
+    to_partitions(iter(chunks), ["p"], tmp_path, file_type="parquet")
+
+    assert schemas(tmp_path) == {"string"}
+    df = read_partitions(tmp_path)
+    assert df["x"].tolist() == ["a", None, None, "b"]
+
+
+def test_chunks_promote_integers_to_floats(tmp_path):
+    """NaN after integers turns the column into floats, even in files already closed"""
+    chunks = [
+        pd.DataFrame({"p": [1, 2], "x": [1, 2]}),
+        pd.DataFrame({"p": [1, 2], "x": [1.5, np.nan]}),
+    ]
+    to_partitions(iter(chunks), ["p"], tmp_path, file_type="parquet", max_open_files=1)
+
+    assert schemas(tmp_path) == {"double"}
+    df = read_partitions(tmp_path)
+    assert df["x"].tolist()[:3] == [1.0, 1.5, 2.0]
+    assert np.isnan(df["x"].tolist()[3])
+
+
+def test_chunks_keep_files_of_previous_calls(tmp_path):
+    """Files are numbered after the ones already in the partition, like csv appends"""
+    for value in [1, 2]:
+        chunks = [pd.DataFrame({"p": [1], "x": [value]})]
+        to_partitions(iter(chunks), ["p"], tmp_path, file_type="parquet")
+
+    files = sorted(f.name for f in (tmp_path / "p=1").iterdir())
+    assert files == ["data0.parquet", "data1.parquet"]
+    assert read_partitions(tmp_path)["x"].tolist() == [1, 2]
+
+
+def test_dataframes_and_chunks_append_alike(tmp_path):
+    """Dataframes add files after the existing ones too, instead of overwriting"""
+    to_partitions(pd.DataFrame({"p": [1, 2], "x": [1, 2]}), ["p"], tmp_path, "parquet")
+    to_partitions(
+        iter([pd.DataFrame({"p": [1], "x": [3]})]), ["p"], tmp_path, "parquet"
+    )
+    to_partitions(pd.DataFrame({"p": [1], "x": [4]}), ["p"], tmp_path, "parquet")
+
+    files = sorted(f.name for f in (tmp_path / "p=1").iterdir())
+    assert files == ["data0.parquet", "data1.parquet", "data2.parquet"]
+    assert read_partitions(tmp_path)["x"].tolist() == [1, 3, 4, 2]
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the identity resolution of the TSE candidates
+"""
+import numpy as np
+import pandas as pd
+
+from pipelines.datasets.br_tse_eleicoes.identity import resolve_candidates
+from pipelines.datasets.br_tse_eleicoes.utils import clean_digit_id, clean_digit_ids
+
+
+def resolve(rows: list) -> list:
+    """Resolves `(cpf, titulo, nome)` rows"""
+    df = pd.DataFrame(rows, columns=["cpf", "titulo", "nome"])
+    return resolve_candidates(df["cpf"], df["titulo"], df["nome"]).tolist()
+
+
+def test_rows_sharing_documents_are_merged():
+    """A cpf links rows, a título links rows without cpf, and padded or float
+    documents are the same document"""
+    ids = resolve(
+        [
+            ("222", "9", "Ana Silva"),
+            ("00222", None, "ANA SILVA"),
+            (None, "9.0", "Ána Silva"),
+            ("111", "8", "Bia Costa"),
+            ("-1", "8", "Bia Costa"),
+        ]
+    )
+    # numbered in the order of the cpfs
+    assert ids == [2, 2, 2, 1, 1]
+
+
+def test_rows_without_documents_have_no_id():
+    """Rows without cpf and título are not merged into a shared id"""
+    ids = resolve(
+        [
+            (None, None, "Sem Documento"),
+            ("-4", "0", "Outro Sem Documento"),
+            ("111", None, "Bia Costa"),
+        ]
+    )
+    assert ids[2] == 1
+    assert ids[0] is pd.NA and ids[1] is pd.NA
+
+
+def test_groups_with_several_documents_are_split_by_name():
+    """A título shared by two cpfs is split by last name when the first names
+    match, and left without id otherwise"""
+    ids = resolve(
+        [
+            ("333", "7", "José Souza"),
+            ("444", "7", "Jose Lima"),
+            ("555", "6", "Caio Reis"),
+            ("666", "6", "Davi Reis"),
+        ]
+    )
+    assert ids[:2] == [1, 2]
+    assert ids[2] is pd.NA and ids[3] is pd.NA
+
+
+def test_clean_digit_ids():
+    """Matches clean_digit_id on every value, and keeps missing values"""
+    values = pd.Series([123, 123.0, "000123", "12a3", "1234567", None, np.nan])
+    cleaned = clean_digit_ids(values, n_digits=6)
+
+    assert cleaned[:5].tolist() == [clean_digit_id(v, 6) for v in values[:5]]
+    assert cleaned[:4].tolist() == ["000123", "000123", "000123", "00123"]
+    assert cleaned[5] is None
+    assert np.isnan(cleaned[6])
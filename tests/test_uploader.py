@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the parallel GCS uploader, run against a local fake GCS server
+"""
+import socket
+from unittest.mock import patch
+
+import pytest
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import storage
+
+emulator = pytest.importorskip("gcp_storage_emulator.server")
+
+# pylint: disable=wrong-import-position
+from pipelines.utils.uploader import (  # noqa: E402
+    list_files_to_upload,
+    upload_files_to_gcs,
+)
+
+# pylint: disable=invalid-name, redefined-outer-name
+
+BUCKET = "basedosdados-test"
+
+
+@pytest.fixture
+def gcs_client():
+    """Starts an in-memory fake GCS server and returns a client pointed to it"""
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        port = sock.getsockname()[1]
+    server = emulator.create_server("localhost", port, in_memory=True)
+    server.start()
+    client = storage.Client(
+        project="test",
+        credentials=AnonymousCredentials(),
+        client_options={"api_endpoint": f"http://localhost:{port}"},
+    )
+    client.create_bucket(BUCKET)
+    yield client
+    server.stop()
+
+
+@pytest.fixture
+def partitioned_folder(tmp_path):
+    """Builds a small hive partitioned folder"""
+    for uf in ["SP", "RJ"]:
+        for ano in [2020, 2021]:
+            folder = tmp_path / f"ano={ano}" / f"sigla_uf={uf}"
+            folder.mkdir(parents=True)
+            (folder / "data.csv").write_text(f"id,valor\n1,{ano}{uf}\n")
+    (tmp_path / "ano=2020" / "notes.txt").write_text("not uploaded")
+    return tmp_path
+
+
+def test_list_files_to_upload(partitioned_folder):
+    """Only csv and parquet files are listed, keeping the partition folders"""
+    files = list_files_to_upload(partitioned_folder, "staging/dataset/table/")
+    assert len(files) == 4
+    blob_names = [blob_name for _, blob_name in files]
+    assert "staging/dataset/table/ano=2020/sigla_uf=RJ/data.csv" in blob_names
+
+
+def test_upload_and_skip_unchanged(gcs_client, partitioned_folder):
+    """A second upload only sends the files that changed"""
+    prefix = "staging/dataset/table"
+    with patch("pipelines.utils.uploader.log"):
+        first = upload_files_to_gcs(
+            partitioned_folder, BUCKET, prefix, client=gcs_client, max_workers=4
+        )
+        changed = partitioned_folder / "ano=2021" / "sigla_uf=SP" / "data.csv"
+        changed.write_text("id,valor\n1,changed\n")
+        second = upload_files_to_gcs(
+            partitioned_folder, BUCKET, prefix, client=gcs_client, max_workers=4
+        )
+
+    assert first["uploaded"] == 4
+    assert second == {"uploaded": 1, "skipped": 3, "bytes": changed.stat().st_size}
+    blob = gcs_client.bucket(BUCKET).blob(f"{prefix}/ano=2021/sigla_uf=SP/data.csv")
+    assert blob.download_as_text() == "id,valor\n1,changed\n"
+
+
+def test_resumable_upload(gcs_client, tmp_path):
+    """Files above the threshold are sent in resumable chunks"""
+    big_file = tmp_path / "data.csv"
+    big_file.write_bytes(b"x" * (600 * 1024))
+    with patch("pipelines.utils.uploader.log"):
+        metrics = upload_files_to_gcs(
+            big_file,
+            BUCKET,
+            "staging/dataset/big",
+            client=gcs_client,
+            resumable_threshold=256 * 1024,
+            chunk_size=256 * 1024,
+        )
+    assert metrics["uploaded"] == 1
+    blob = gcs_client.bucket(BUCKET).get_blob("staging/dataset/big/data.csv")
+    assert blob.size == 600 * 1024